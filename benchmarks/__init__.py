@@ -0,0 +1,4 @@
+"""Offline benchmarks for the scanner and the post-processing of its results.
+
+Run them from the repository root, e.g. ``python -m benchmarks.scan_benchmark``.
+"""
@@ -0,0 +1,144 @@
+"""Delta scan scenarios against the offline fake Discord client.
+
+Runs a ``--delta`` scan, changes the fake client's servers, runs a second
+``--delta`` scan and compares its results with a fresh scan of the changed
+servers. Each scenario reports the profile requests of both scans::
+
+    python -m benchmarks.delta_benchmark --scenarios members guild_joined guild_left
+
+Exits with status 1 when a delta scan's results differ from the fresh scan.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+
+from benchmarks.scan_benchmark import run_scan
+from fake_discord import FIRST_FAKE_GUILD_ID, build_fake_client
+from scan_config import DEFAULT_PROFILE_CACHE_TTL
+
+
+def move_members(fake_client) -> None:
+    """Move one member of the first guild to the third and add another one to it."""
+    first_guild, _, third_guild = fake_client.guilds[:3]
+    third_guild_ids = {member.id for member in third_guild._members}
+    moved_user, added_user = [
+        member for member in first_guild._members[1:] if member.id not in third_guild_ids
+    ][:2]
+    first_guild.remove_member(moved_user.id)
+    third_guild.add_member(moved_user)
+    third_guild.add_member(added_user)
+
+
+def join_guild(fake_client, left_guild) -> None:
+    fake_client.add_guild(left_guild)
+
+
+def leave_guild(fake_client) -> None:
+    fake_client.remove_guild(FIRST_FAKE_GUILD_ID + 1)
+
+
+def delta_scan_server_info(fake_client, output_path: str) -> tuple:
+    return scan_server_info(
+        fake_client, output_path, delta=True, profile_cache_ttl=DEFAULT_PROFILE_CACHE_TTL
+    )
+
+
+def scan_server_info(fake_client, output_path: str, **client_kwargs) -> tuple:
+    """Return the server info of a scan and the profile requests it issued."""
+    profile_requests = fake_client.stats.profile_requests
+    _client, scan_results = asyncio.run(run_scan(fake_client, output_path, **client_kwargs))
+    server_info = scan_results.to_server_info()
+    scan_results.discard_shards()
+    return server_info, fake_client.stats.profile_requests - profile_requests
+
+
+def mismatched_rows(server_info: dict, expected_server_info: dict) -> list:
+    servers = set(server_info) | set(expected_server_info)
+    return [
+        (server, member)
+        for server in sorted(servers)
+        for member in sorted(
+            set(server_info.get(server, {})) | set(expected_server_info.get(server, {}))
+        )
+        if server_info.get(server, {}).get(member)
+        != expected_server_info.get(server, {}).get(member)
+    ]
+
+
+def run_scenario(scenario: str, args: argparse.Namespace) -> bool:
+    fake_client = build_fake_client([args.members] * args.guilds, overlap=args.overlap)
+    left_guild = None
+    if scenario == "guild_joined":
+        left_guild = fake_client.remove_guild(FIRST_FAKE_GUILD_ID + args.guilds - 1)
+    with tempfile.TemporaryDirectory() as output_path:
+        delta_scan_server_info(fake_client, output_path)
+        if scenario == "members":
+            move_members(fake_client)
+        elif scenario == "guild_joined":
+            join_guild(fake_client, left_guild)
+        else:
+            leave_guild(fake_client)
+        server_info, delta_requests = delta_scan_server_info(fake_client, output_path)
+    with tempfile.TemporaryDirectory() as output_path:
+        expected_server_info, fresh_requests = scan_server_info(fake_client, output_path)
+    mismatches = mismatched_rows(server_info, expected_server_info)
+    print(
+        f"{scenario}: {delta_requests} profile requests for the delta scan, "
+        f"{fresh_requests} for a fresh scan, {len(mismatches)} mismatched member rows"
+    )
+    for server, member in mismatches[:5]:
+        print(f"  {server}: {member}")
+    return not mismatches
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=("members", "guild_joined", "guild_left"),
+        default=["members", "guild_joined", "guild_left"],
+        help=(
+            "Changes between the two delta scans. Example --scenarios guild_left, "
+            "default=members guild_joined guild_left"
+        ),
+    )
+    parser.add_argument(
+        "--guilds",
+        type=int,
+        default=4,
+        help="Guilds of the fake client, at least 3. Example --guilds 10, default=4",
+    )
+    parser.add_argument(
+        "--members",
+        type=int,
+        default=30,
+        help="Members per guild. Example --members 200, default=30",
+    )
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=0.3,
+        help="Share of member rows whose user is in another guild too. default=0.3",
+    )
+    args = parser.parse_args()
+    if args.guilds < 3:
+        parser.error("--guilds must be at least 3")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    passed = [run_scenario(scenario, args) for scenario in args.scenarios]
+    if not all(passed):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Post-processing benchmark on synthetic scan results.
+
+Times and memory-profiles every step between a finished scan and its output
+files at 10k, 100k and 1M member rows, and appends the results to
+``benchmarks/results/postprocessing.json`` so regressions show up against the
+previous run::
+
+    python -m benchmarks.postprocessing_benchmark --sizes 10k 100k 1m
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic_data import generate_scan_results
+from core import MyClient
+from graph_view import build_graph
+from scan_config import ScanConfig
+
+# Scenario name -> (member rows, guild count).
+POSTPROCESSING_SCENARIOS = {
+    "10k": (10_000, 20),
+    "100k": (100_000, 50),
+    "1m": (1_000_000, 200),
+}
+POSTPROCESSING_FUNCTIONS = (
+    "to_server_info",
+    "get_friends",
+    "get_mutual_friends",
+    "get_mutual_servers",
+    "get_derived_views",
+    "write_data_to_json",
+    "build_graph",
+)
+RESULTS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "results", "postprocessing.json"
+)
+OUTPUT_VERBOSITY = 2
+
+
+def build_client(output_path: str) -> MyClient:
+    return MyClient(
+        ScanConfig(
+            sleep_time=0,
+            output_verbosity=OUTPUT_VERBOSITY,
+            print_info=False,
+            write_to_json=True,
+            output_path=output_path,
+            include_servers=[],
+            include_channels=[],
+            max_members=sys.maxsize,
+            period_max_members=sys.maxsize,
+            pause_duration=0,
+        )
+    )
+
+
+def build_steps(client: MyClient, scan_results, server_info: dict, output_path: str) -> dict:
+    """Map each benchmarked function name to a call of it on the given results."""
+    views = client.get_derived_views(scan_results, OUTPUT_VERBOSITY)
+    return {
+        "to_server_info": scan_results.to_server_info,
+        "get_friends": lambda: client.get_friends(server_info),
+        "get_mutual_friends": lambda: client.get_mutual_friends(server_info, OUTPUT_VERBOSITY),
+        "get_mutual_servers": lambda: client.get_mutual_servers(server_info, OUTPUT_VERBOSITY),
+        "get_derived_views": lambda: client.get_derived_views(scan_results, OUTPUT_VERBOSITY),
+        "write_data_to_json": lambda: client.write_data_to_json(scan_results, *views, output_path),
+        "build_graph": lambda: build_graph(server_info),
+    }
+
+
+def time_step(step, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started_at = time.perf_counter()
+        step()
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings)
+
+
+def trace_step(step) -> int:
+    """Peak memory allocated while ``step`` runs, in bytes."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        step()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_scenario(scenario: str, args: argparse.Namespace) -> list:
+    member_rows, guild_count = POSTPROCESSING_SCENARIOS[scenario]
+    started_at = time.perf_counter()
+    scan_results = generate_scan_results(
+        member_rows, guild_count=guild_count, overlap=args.overlap, seed=args.seed
+    )
+    server_info = scan_results.to_server_info()
+    logging.info("Generated %s member rows in %.1fs", member_rows, time.perf_counter() - started_at)
+    results = []
+    with tempfile.TemporaryDirectory() as output_path:
+        client = build_client(output_path)
+        steps = build_steps(client, scan_results, server_info, output_path)
+        for function in args.functions:
+            seconds = time_step(steps[function], args.repeat)
+            peak_memory = trace_step(steps[function]) if args.memory else None
+            results.append(
+                {
+                    "scenario": scenario,
+                    "member_rows": member_rows,
+                    "guilds": guild_count,
+                    "function": function,
+                    "seconds": round(seconds, 4),
+                    "peak_memory_mb": (
+                        round(peak_memory / 2**20, 2) if peak_memory is not None else None
+                    ),
+                }
+            )
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(results_path: str) -> list:
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path) as f:
+        return json.load(f)
+
+
+def previous_result(history: list, result: dict) -> dict | None:
+    for run in reversed(history):
+        for previous in run["results"]:
+            if (previous["scenario"], previous["function"]) == (
+                result["scenario"],
+                result["function"],
+            ):
+                return previous
+    return None
+
+
+def format_change(current, previous) -> str:
+    if current is None or not previous:
+        return ""
+    return f" ({(current - previous) / previous:+.0%})"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        choices=POSTPROCESSING_SCENARIOS,
+        default=["10k", "100k"],
+        help="Scenarios to run. Example --sizes 10k 100k 1m, default=10k 100k",
+    )
+    parser.add_argument(
+        "--functions",
+        nargs="+",
+        choices=POSTPROCESSING_FUNCTIONS,
+        default=list(POSTPROCESSING_FUNCTIONS),
+        help="Functions to benchmark. Example --functions build_graph, default=all",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Timed runs per function, the median is reported. default=3",
+    )
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=0.2,
+        help="Share of member rows whose user is already in another guild. default=0.2",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no_memory",
+        dest="memory",
+        action="store_false",
+        help="If set, the extra run that traces peak memory of each function is skipped",
+    )
+    parser.add_argument(
+        "--results",
+        default=RESULTS_PATH,
+        help="Results history to compare with and append to. default=benchmarks/results/postprocessing.json",
+    )
+    parser.add_argument(
+        "--no_save",
+        dest="save",
+        action="store_false",
+        help="If set, the results are compared with the history but not appended to it",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    history = load_history(args.results)
+    results = []
+    for scenario in args.sizes:
+        for result in run_scenario(scenario, args):
+            results.append(result)
+            previous = previous_result(history, result) or {}
+            memory = ""
+            if result["peak_memory_mb"] is not None:
+                memory = f", peak memory {result['peak_memory_mb']} MB" + format_change(
+                    result["peak_memory_mb"], previous.get("peak_memory_mb")
+                )
+            print(
+                f"{scenario:>5} {result['function']:<20} {result['seconds']:.4f}s"
+                + format_change(result["seconds"], previous.get("seconds"))
+                + memory
+            )
+    if args.save:
+        history.append(
+            {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "options": {"repeat": args.repeat, "overlap": args.overlap, "seed": args.seed},
+                "results": results,
+            }
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, "w") as f:
+            json.dump(history, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
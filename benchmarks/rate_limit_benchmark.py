@@ -0,0 +1,167 @@
+"""Adaptive rate limiter scenario against the offline fake Discord client.
+
+Scans one guild with the adaptive rate limiter while profile requests share a
+rate limit bucket of the fake client, with an injected 429 every
+``--rate_limit_every`` requests. Checks that the limiter backs off on every
+429 and ramps back up to the rate the bucket's remaining requests and reset
+time allow before the next one::
+
+    python -m benchmarks.rate_limit_benchmark --bucket_limit 20 --bucket_window 1
+
+Exits with status 1 when a check fails.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+
+from benchmarks.scan_benchmark import run_scan
+from fake_discord import build_fake_client
+from rate_limit import AdaptiveRateLimiter, http_internals_supported
+
+# Share of the bucket's rate the limiter has to reach between two 429s.
+RAMP_UP_RATIO = 0.9
+
+
+class RecordingRateLimiter(AdaptiveRateLimiter):
+    """Adaptive rate limiter that records its rate after every observation."""
+
+    def __init__(self, max_interval: float) -> None:
+        super().__init__(max_interval)
+        self.started_at = time.monotonic()
+        self.responses = 0
+        # (seconds, responses so far, rate before, rate after) per 429.
+        self.rate_limits: list = []
+        # Peak rate between two 429s, as (responses, peak rate).
+        self.segments: list = [(0, self.rate)]
+
+    def observe_bucket(self, limit: int, remaining: int, reset_after: float) -> None:
+        super().observe_bucket(limit, remaining, reset_after)
+        self.responses += 1
+        responses, peak_rate = self.segments[-1]
+        self.segments[-1] = (responses + 1, max(peak_rate, self.rate))
+
+    def on_rate_limited(self, retry_after: float) -> None:
+        rate_before = self.rate
+        super().on_rate_limited(retry_after)
+        self.rate_limits.append(
+            (time.monotonic() - self.started_at, self.responses, rate_before, self.rate)
+        )
+        self.segments.append((0, self.rate))
+
+
+def run_scenario(args: argparse.Namespace) -> bool:
+    fake_client = build_fake_client(
+        [args.members],
+        latency=args.latency,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after,
+        bucket_limit=args.bucket_limit,
+        bucket_window=args.bucket_window,
+    )
+    rate_limiter = RecordingRateLimiter(args.sleep_time)
+    with tempfile.TemporaryDirectory() as output_path:
+        asyncio.run(run_scan(fake_client, output_path, args.sleep_time, rate_limiter))
+    wall_seconds = time.monotonic() - rate_limiter.started_at
+    bucket_rate = args.bucket_limit / args.bucket_window
+    stats = fake_client.stats
+    injected = stats.profile_requests // args.rate_limit_every if args.rate_limit_every else 0
+    print(
+        f"{stats.profile_requests} profile requests in {wall_seconds:.1f}s "
+        f"({stats.profile_requests / wall_seconds:.1f}/s), bucket allows {bucket_rate:.1f}/s, "
+        f"limiter settled on {rate_limiter.allowed_rate:.1f}/s"
+    )
+    print(f"{injected} injected 429s, {stats.rate_limited - injected} 429s from the bucket")
+
+    backs_off = bool(rate_limiter.rate_limits)
+    for seconds, responses, rate_before, rate_after in rate_limiter.rate_limits:
+        print(
+            f"  429 at {seconds:.1f}s after {responses} responses: "
+            f"{rate_before:.1f}/s -> {rate_after:.1f}/s"
+        )
+        backs_off &= rate_after < rate_before or rate_before <= rate_limiter.min_rate
+
+    ramps_up = True
+    # The last segment may end with the scan before it had time to ramp up.
+    for segment_idx, (responses, peak_rate) in enumerate(rate_limiter.segments):
+        checked = segment_idx < len(rate_limiter.segments) - 1
+        print(
+            f"  segment {segment_idx + 1}: {responses} responses, peak {peak_rate:.1f}/s"
+            + ("" if checked else " (not checked)")
+        )
+        if checked:
+            ramps_up &= peak_rate >= RAMP_UP_RATIO * bucket_rate
+    print(f"backs off on 429: {'yes' if backs_off else 'NO'}")
+    print(f"ramps up to the bucket's rate between 429s: {'yes' if ramps_up else 'NO'}")
+    return backs_off and ramps_up
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--members",
+        type=int,
+        default=200,
+        help="Members of the scanned guild. Example --members 500, default=200",
+    )
+    parser.add_argument(
+        "--bucket_limit",
+        type=int,
+        default=20,
+        help="Profile requests allowed per bucket window. Example --bucket_limit 50, default=20",
+    )
+    parser.add_argument(
+        "--bucket_window",
+        type=float,
+        default=1.0,
+        help="Seconds until the bucket resets. Example --bucket_window 5, default=1",
+    )
+    parser.add_argument(
+        "--rate_limit_every",
+        type=int,
+        default=80,
+        help="Answer every Nth profile request with a 429 first. Example --rate_limit_every 50, default=80",
+    )
+    parser.add_argument(
+        "--retry_after",
+        type=float,
+        default=0.5,
+        help="Retry-After seconds of injected 429s. Example --retry_after 1, default=0.5",
+    )
+    parser.add_argument(
+        "--sleep_time",
+        type=float,
+        default=1.0,
+        help=(
+            "Slowest interval between requests, which the limiter starts from. "
+            "Example --sleep_time 3, default=1"
+        ),
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds every fake request takes. Example --latency 0.05, default=0",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # Injected 429s still reach the rate limiter, just not the console.
+    logging.getLogger("discord.http").propagate = False
+    if not http_internals_supported():
+        print("The installed discord.py-self version is not supported by the adaptive limiter")
+        sys.exit(1)
+    if not run_scenario(args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
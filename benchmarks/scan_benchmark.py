@@ -0,0 +1,270 @@
+"""Scan throughput benchmark against the offline fake Discord client.
+
+Reports wall time, requests issued and peak traced memory of
+``MyClient.get_server_info`` for scans of 1k, 10k and 100k member rows::
+
+    python -m benchmarks.scan_benchmark --sizes 1k 10k --latency 0.001
+
+With ``--replay`` it runs against a fixture recorded by ``main.py --record``
+instead, and also times the post-processing of the scan results::
+
+    python -m benchmarks.scan_benchmark --replay output/scan_fixture.jsonl.gz --speed 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from core import MyClient
+from fake_discord import build_fake_client
+from output_writer import OutputWriter
+from rate_limit import RateLimitLogHandler, build_rate_limiter
+from scan_config import ScanConfig
+from scan_recording import ReplayClient
+from scan_state import SCAN_STATE_FILENAME, ScanState
+
+# Scenario name -> (guild count, members per guild).
+SCAN_SCENARIOS = {
+    "1k": (5, 200),
+    "10k": (10, 1000),
+    "100k": (20, 5000),
+}
+
+
+async def run_scan(
+    fake_client,
+    output_path: str,
+    sleep_time: float = 0.0,
+    rate_limiter=None,
+    **client_kwargs,
+):
+    """Run ``get_server_info`` of a fresh ``MyClient`` against ``fake_client``.
+
+    Uses ``rate_limiter`` when given, or one built from ``rate_limit_mode``.
+    The profile cache is off unless ``profile_cache_ttl`` is given, and a
+    ``delta`` scan keeps its scan state in ``output_path`` like a real one.
+    Returns the client and its scan results.
+    """
+    client_kwargs.setdefault("profile_cache_ttl", 0)
+    client = MyClient(
+        ScanConfig(
+            sleep_time=sleep_time,
+            output_verbosity=2,
+            print_info=False,
+            write_to_json=False,
+            output_path=output_path,
+            include_servers=[],
+            include_channels=[],
+            max_members=sys.maxsize,
+            period_max_members=sys.maxsize,
+            pause_duration=0,
+            **client_kwargs,
+        )
+    )
+    client.profile_cache = client.open_profile_cache()
+    client.checkpoint_journal = client.open_checkpoint_journal()
+    if client.config.delta:
+        client.scan_state = ScanState(os.path.join(output_path, SCAN_STATE_FILENAME))
+    client.rate_limiter = rate_limiter or build_rate_limiter(
+        client.config.rate_limit_mode, sleep_time
+    )
+    rate_limit_log_handler = RateLimitLogHandler(client.rate_limiter)
+    logging.getLogger("discord.http").addHandler(rate_limit_log_handler)
+    try:
+        scan_results = await client.get_server_info(
+            fake_client, {relationship.user.id for relationship in fake_client.friends}
+        )
+    finally:
+        logging.getLogger("discord.http").removeHandler(rate_limit_log_handler)
+        client.checkpoint_journal.discard()
+        client.close_profile_cache()
+    return client, scan_results
+
+
+def time_post_processing(client: MyClient, scan_results, output_path: str) -> dict:
+    """Time building the derived views and writing every output file."""
+    started_at = time.perf_counter()
+    friends, mutual_friends, mutual_servers = client.get_derived_views(
+        scan_results, client.config.output_verbosity
+    )
+    views_seconds = time.perf_counter() - started_at
+    started_at = time.perf_counter()
+    OutputWriter(output_path).write_all(scan_results, friends, mutual_friends, mutual_servers)
+    write_seconds = time.perf_counter() - started_at
+    return {
+        "derived_views_seconds": round(views_seconds, 3),
+        "write_seconds": round(write_seconds, 3),
+    }
+
+
+def run_scenario(scenario: str, args: argparse.Namespace) -> dict:
+    if args.replay:
+        fake_client = ReplayClient(args.replay, args.speed)
+        guild_count = len(fake_client.guilds)
+    else:
+        guild_count, guild_size = SCAN_SCENARIOS[scenario]
+        fake_client = build_fake_client(
+            [guild_size] * guild_count,
+            overlap=args.overlap,
+            latency=args.latency,
+            rate_limit_every=args.rate_limit_every,
+            retry_after=args.retry_after,
+        )
+    client_kwargs = {
+        "profile_concurrency": args.profile_concurrency,
+        "plan_scan": args.plan_scan,
+        "pipeline": args.pipeline,
+    }
+    with tempfile.TemporaryDirectory() as output_path:
+        if args.memory:
+            tracemalloc.start()
+        scan_start = time.perf_counter()
+        client, scan_results = asyncio.run(run_scan(fake_client, output_path, **client_kwargs))
+        wall_seconds = time.perf_counter() - scan_start
+        peak_memory = None
+        if args.memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        member_rows = sum(
+            len(scan_results.guild_members(guild_id)) for guild_id in scan_results.guilds
+        )
+        post_processing = (
+            time_post_processing(client, scan_results, output_path) if args.replay else {}
+        )
+    return {
+        "scenario": scenario,
+        "guilds": guild_count,
+        "member_rows": member_rows,
+        "wall_seconds": round(wall_seconds, 3),
+        "member_rows_per_second": round(member_rows / wall_seconds, 1),
+        **fake_client.stats.to_dict(),
+        "peak_memory_mb": round(peak_memory / 2**20, 2) if peak_memory is not None else None,
+        **post_processing,
+        "options": client_kwargs,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        choices=SCAN_SCENARIOS,
+        default=["1k", "10k"],
+        help="Scenarios to run. Example --sizes 1k 10k 100k, default=1k 10k",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds every fake request takes. Example --latency 0.05, default=0",
+    )
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=0.2,
+        help="Share of member rows whose user is in another guild too. default=0.2",
+    )
+    parser.add_argument(
+        "--rate_limit_every",
+        type=int,
+        default=0,
+        help="Answer every Nth profile request with a 429 first. Use 0 to disable. default=0",
+    )
+    parser.add_argument(
+        "--retry_after",
+        type=float,
+        default=0.01,
+        help="Retry-After seconds of injected 429s. default=0.01",
+    )
+    parser.add_argument(
+        "--replay",
+        default=None,
+        help=(
+            "Replay this fixture recorded by main.py --record instead of the --sizes "
+            "scenarios. Example --replay output/scan_fixture.jsonl.gz, default=None"
+        ),
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help=(
+            "Replay the recorded request times this many times faster, 1 for real time. "
+            "Use 0 to skip them. Example --speed 10, default=0"
+        ),
+    )
+    parser.add_argument(
+        "--profile_concurrency",
+        type=int,
+        default=1,
+        help=(
+            "Number of member profiles fetched concurrently by the scan. "
+            "Example --profile_concurrency 4, default=1"
+        ),
+    )
+    parser.add_argument(
+        "--plan_scan",
+        action="store_true",
+        help="If set, the scan enumerates every server first and fetches each user once",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help=(
+            "If set, the scan enumerates upcoming servers while fetching profiles of "
+            "already enumerated ones"
+        ),
+    )
+    parser.add_argument(
+        "--no_memory",
+        dest="memory",
+        action="store_false",
+        help="If set, peak memory is not traced, which also removes tracemalloc's overhead",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Write the results as JSON to this file. Example --output scan_results.json",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # Injected 429s still reach the rate limiter, just not the console.
+    logging.getLogger("discord.http").propagate = False
+    results = []
+    for scenario in ["replay"] if args.replay else args.sizes:
+        result = run_scenario(scenario, args)
+        results.append(result)
+        print(
+            f"{scenario:>5}: {result['member_rows']} member rows in {result['wall_seconds']}s "
+            f"({result['member_rows_per_second']}/s), "
+            f"{result['profile_requests']} profile requests, "
+            f"{result['fetch_members_requests'] + result['chunk_requests']} enumeration "
+            f"requests, {result['rate_limited']} rate limited, "
+            f"peak memory {result['peak_memory_mb']} MB"
+        )
+        if args.replay:
+            print(
+                f"       derived views in {result['derived_views_seconds']}s, "
+                f"output written in {result['write_seconds']}s"
+            )
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Synthetic scan results with realistic, power-law shaped mutual counts.
+
+Guild sizes follow a Zipf distribution, most users are in a single guild
+while a heavy tail is in many, and mutual friend counts follow a Pareto
+distribution, so that the post-processing sees the same skew as real data.
+"""
+
+from __future__ import annotations
+
+import itertools
+import random
+
+from fake_discord import FAKE_CLIENT_USER_ID, FIRST_FAKE_GUILD_ID, FIRST_FAKE_USER_ID
+from model import ScanResults
+
+
+def pick_guilds(rng: random.Random, guild_count: int, cum_weights: list, count: int) -> list:
+    """Pick ``count`` distinct guild indexes, popular guilds more often."""
+    if count * 2 > guild_count:
+        return rng.sample(range(guild_count), count)
+    picked = set()
+    while len(picked) < count:
+        picked.update(rng.choices(range(guild_count), cum_weights=cum_weights, k=count))
+    return rng.sample(sorted(picked), count)
+
+
+def generate_scan_results(
+    member_rows: int,
+    guild_count: int = 20,
+    overlap: float = 0.2,
+    friend_count: int = 200,
+    guild_size_exponent: float = 1.0,
+    membership_exponent: float = 1.5,
+    mutual_friends_exponent: float = 1.5,
+    seed: int = 0,
+) -> ScanResults:
+    """Generate in-memory scan results with about ``member_rows`` member rows.
+
+    ``overlap`` is the share of member rows that belong to a user already
+    counted in another guild, so there are ``member_rows * (1 - overlap)``
+    distinct users. Guild ``i`` is ``1 / (i + 1) ** guild_size_exponent`` as
+    popular as the first. Extra memberships go to users with Pareto weights of
+    shape ``membership_exponent`` and each user has ``Pareto(shape) - 1``
+    mutual friends of shape ``mutual_friends_exponent``, smaller shapes
+    meaning heavier tails. The first ``friend_count`` users are friends.
+    """
+    rng = random.Random(seed)
+    user_count = max(1, min(member_rows, round(member_rows * (1 - overlap))))
+    guild_count = max(1, guild_count)
+    memberships = [1] * user_count
+    extra_rows = member_rows - user_count
+    user_cum_weights = list(
+        itertools.accumulate(rng.paretovariate(membership_exponent) for _ in range(user_count))
+    )
+    while extra_rows > 0 and any(count < guild_count for count in memberships):
+        skipped = 0
+        for user_idx in rng.choices(range(user_count), cum_weights=user_cum_weights, k=extra_rows):
+            if memberships[user_idx] < guild_count:
+                memberships[user_idx] += 1
+            else:
+                skipped += 1
+        extra_rows = skipped
+
+    guild_cum_weights = list(
+        itertools.accumulate(
+            1 / (guild_idx + 1) ** guild_size_exponent for guild_idx in range(guild_count)
+        )
+    )
+    guild_ids = [FIRST_FAKE_GUILD_ID + guild_idx for guild_idx in range(guild_count)]
+    scan_results = ScanResults()
+    for guild_idx, guild_id in enumerate(guild_ids):
+        scan_results.add_guild(guild_id, f"guild{guild_idx}")
+
+    friend_ids = [
+        FIRST_FAKE_USER_ID + user_idx for user_idx in range(min(friend_count, user_count))
+    ]
+    friends = [[friend_id, f"user{friend_id - FIRST_FAKE_USER_ID}#0"] for friend_id in friend_ids]
+    for user_idx, membership_count in enumerate(memberships):
+        user_id = FIRST_FAKE_USER_ID + user_idx
+        mutual_friend_count = min(len(friends), int(rng.paretovariate(mutual_friends_exponent)) - 1)
+        payload = {
+            "mutual_friends": [
+                friend
+                for friend in rng.sample(friends, mutual_friend_count)
+                if friend[0] != user_id
+            ],
+            "mutual_guilds": [
+                [guild_ids[guild_idx], f"guild{guild_idx}"]
+                for guild_idx in pick_guilds(rng, guild_count, guild_cum_weights, membership_count)
+            ],
+        }
+        for guild_id, _guild_name in payload["mutual_guilds"]:
+            scan_results.add_member(
+                guild_id, user_id, f"user{user_idx}#0", payload, user_idx < len(friend_ids)
+            )
+    scan_results.set_user_name(FAKE_CLIENT_USER_ID, "fake-client#0")
+    return scan_results
+
+
+def generate_server_info(member_rows: int, **kwargs) -> dict:
+    """Generate the name-keyed ``server_info`` dict of :func:`generate_scan_results`."""
+    return generate_scan_results(member_rows, **kwargs).to_server_info()
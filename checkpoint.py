@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Optional
+
+from model import ScanResults
+
+CHECKPOINT_JOURNAL_FILENAME = "scan_journal.jsonl"
+FSYNC_INTERVAL = 50
+
+
+class CheckpointJournal:
+    """Append-only JSON Lines journal of scan progress.
+
+    Every member profile is appended as soon as it has been fetched, followed
+    by the member entries of each guild once that guild is finished, so an
+    interrupted scan can be replayed and continued with ``resume=True`` without
+    requesting any profile twice. Replayed guilds are added to
+    ``scan_results`` and flushed to its shards like freshly scanned ones.
+
+    The journal starts with the scan ``options`` that shape the profiles. A
+    journal written with other options is discarded instead of replayed, so
+    a resumed scan never mixes profiles of both.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        resume: bool = False,
+        scan_results: Optional[ScanResults] = None,
+        options: Optional[dict] = None,
+    ) -> None:
+        self.path = path
+        self.options = dict(options or {})
+        self.scan_results = scan_results if scan_results is not None else ScanResults()
+        self.profiles: dict = dict()
+        self.completed_guilds: set = set()
+        self._pending_guilds: dict = dict()
+        self._unsynced_records = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume:
+            self._replay()
+        elif os.path.exists(path):
+            logging.info("Discarding previous scan journal at %s", path)
+            os.remove(path)
+        self._handle = open(path, "a", encoding="utf-8")
+        if self._handle.tell() == 0:
+            self._append({"event": "options", "options": self.options}, sync=True)
+
+    def _replay(self) -> None:
+        if not os.path.exists(self.path):
+            logging.warning("No scan journal found at %s, starting a fresh scan", self.path)
+            return
+        valid_size = 0
+        records = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning(
+                        "Ignoring truncated scan journal record after %s records", records
+                    )
+                    break
+                if records == 0 and not self._matches_options(record):
+                    break
+                valid_size += len(line)
+                records += 1
+                self._apply(record)
+        if valid_size < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+        self._pending_guilds.clear()
+        logging.info(
+            "Replayed %s journal records (%s completed guilds, %s member profiles)",
+            records,
+            len(self.completed_guilds),
+            len(self.profiles),
+        )
+
+    def _matches_options(self, record: dict) -> bool:
+        options = record.get("options") if record.get("event") == "options" else None
+        if options == self.options:
+            return True
+        logging.warning(
+            "Discarding scan journal at %s, it was written with options %s instead of %s",
+            self.path,
+            options,
+            self.options,
+        )
+        return False
+
+    def _apply(self, record: dict) -> None:
+        if record["event"] == "profile":
+            self.profiles[record["user_id"]] = record["payload"]
+        elif record["event"] == "member":
+            self._pending_guilds.setdefault(record["guild_id"], list()).append(record)
+        elif record["event"] == "guild_done":
+            guild_id = record["guild_id"]
+            self.scan_results.add_guild(guild_id, record["guild"])
+            for member_record in self._pending_guilds.pop(guild_id, list()):
+                self.scan_results.add_member(
+                    guild_id,
+                    member_record["user_id"],
+                    member_record["member"],
+                    member_record["payload"],
+                    member_record["is_friend"],
+                )
+            self.scan_results.flush_guild(guild_id)
+            self.completed_guilds.add(guild_id)
+
+    def _append(self, record: dict, sync: bool = False) -> None:
+        self._handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._handle.flush()
+        self._unsynced_records += 1
+        if sync or self._unsynced_records >= FSYNC_INTERVAL:
+            os.fsync(self._handle.fileno())
+            self._unsynced_records = 0
+
+    def record_profile(self, user_id: int, payload: dict) -> None:
+        self._append({"event": "profile", "user_id": user_id, "payload": payload})
+
+    def record_member(
+        self,
+        guild_id: int,
+        guild_name: str,
+        member_idx: int,
+        user_id: int,
+        member_name: str,
+        is_friend: bool,
+        payload: dict,
+    ) -> None:
+        self._append(
+            {
+                "event": "member",
+                "guild_id": guild_id,
+                "guild": guild_name,
+                "index": member_idx,
+                "user_id": user_id,
+                "member": member_name,
+                "is_friend": is_friend,
+                "payload": payload,
+            }
+        )
+
+    def record_guild_done(self, guild_id: int, guild_name: str) -> None:
+        self._append(
+            {"event": "guild_done", "guild_id": guild_id, "guild": guild_name}, sync=True
+        )
+
+    def close(self) -> None:
+        if not self._handle.closed:
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+            self._handle.close()
+
+    def discard(self) -> None:
+        """Close the journal and delete it once the scan results are safely stored."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
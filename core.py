@@ -1,16 +1,33 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import heapq
 import inspect
 import json
 import logging
 import os
+import sqlite3
 import sys
 import time
-from typing import Iterable, Optional
+from typing import Optional
 
 import discord
 
+from checkpoint import CHECKPOINT_JOURNAL_FILENAME, CheckpointJournal
+from enumeration import ENUMERATION_STATS_FILENAME, EnumerationStats
+from metrics import ScanMetrics
+from model import SHARD_DIRNAME, ScanResults
+from output_writer import OutputWriter, check_compression_available
+from profile_cache import PROFILE_CACHE_FILENAME, ProfileCache
+from rate_limit import RateLimitLogHandler, build_rate_limiter, check_rate_limit_mode
+from scan_config import ScanConfig
+from scan_profiler import SCAN_PROFILE_DIRNAME, ScanProfiler
+from scan_recording import ScanRecorder
+from scan_state import SCAN_STATE_FILENAME, ScanState
+from scanner import ServerScanner
+from watch import ResultsWatcher
+
 DEFAULT_OUTPUT_DIR = "output"
 
 
@@ -67,92 +84,247 @@ def _client_supports_intents() -> bool:
 
 
 class MyClient(discord.Client):
-    def __init__(
-        self,
-        sleep_time: float,
-        output_verbosity: int,
-        print_info: bool,
-        write_to_json: bool,
-        output_path: str,
-        include_servers: Iterable[str],
-        include_channels: Iterable[str],
-        max_members: int,
-        period_max_members: int,
-        pause_duration: int,
-        member_fetch_timeout: Optional[float] = None,
-        intents: Optional[object] = None,
-    ) -> None:
+    def __init__(self, config: ScanConfig, intents: Optional[object] = None) -> None:
+        check_compression_available(config.output_compression)
+        check_rate_limit_mode(config.rate_limit_mode, config.sleep_time)
         resolved_intents = intents or build_intents()
         if _client_supports_intents() and resolved_intents is not None:
             super().__init__(intents=resolved_intents)
         else:
             super().__init__()
-        self.sleep_time = sleep_time
-        self.output_verbosity = output_verbosity
-        self.print_info = print_info
-        self.write_to_json = write_to_json
-        self.output_path = output_path
-        self.include_servers = set(include_servers)
-        self.include_channels = set(include_channels)
-        self.max_members = max_members
-        self.period_max_members = period_max_members
-        self.pause_duration = pause_duration
-        self.member_fetch_timeout = (
-            member_fetch_timeout if member_fetch_timeout and member_fetch_timeout > 0 else None
-        )
+        self.config = config
+        self.profile_cache: Optional[ProfileCache] = None
+        self.checkpoint_journal: Optional[CheckpointJournal] = None
+        self.rate_limiter = None
+        self.enumeration_stats: Optional[EnumerationStats] = None
+        self.scan_state: Optional[ScanState] = None
+        self.scan_profiles: dict = dict()
+        self.watcher: Optional[ResultsWatcher] = None
+        self.scan_metrics: Optional[ScanMetrics] = None
+        self.scan_profiler: Optional[ScanProfiler] = None
 
     async def on_ready(self) -> None:
+        if self.watcher is not None:
+            logging.info("Reconnected as %s, still watching for changes", self.user)
+            return
         logging.info("Client ready as %s", self.user)
-        if self.include_servers:
+        if self.config.include_servers:
             logging.info(
                 "Server filter enabled (%s): %s",
-                len(self.include_servers),
-                sorted(self.include_servers),
+                len(self.config.include_servers),
+                sorted(self.config.include_servers),
             )
-        if self.include_channels:
+        if self.config.include_channels:
             logging.info(
                 "Channel filter enabled (%s): %s",
-                len(self.include_channels),
-                sorted(self.include_channels),
+                len(self.config.include_channels),
+                sorted(self.config.include_channels),
             )
         logging.info(
-            "Starting scan: sleep_time=%s, max_members=%s, period_max_members=%s, pause_duration=%s",
-            self.sleep_time,
-            self.max_members,
-            self.period_max_members,
-            self.pause_duration,
+            "Starting scan: sleep_time=%s, max_members=%s, period_max_members=%s, "
+            "pause_duration=%s, rate_limit_mode=%s",
+            self.config.sleep_time,
+            self.config.max_members,
+            self.config.period_max_members,
+            self.config.pause_duration,
+            self.config.rate_limit_mode,
         )
-        if self.member_fetch_timeout:
+        if self.config.member_fetch_timeout:
             logging.info(
-                "Member fetch timeout enabled: %ss", self.member_fetch_timeout
+                "Member fetch timeout enabled: %ss", self.config.member_fetch_timeout
             )
         else:
             logging.info("Member fetch timeout disabled (will wait indefinitely)")
         friend_ids = self.get_friend_ids(self)
-        server_info = await self.get_server_info(
-            self,
-            friend_ids,
-            self.sleep_time,
-            self.include_servers,
-            self.include_channels,
-            self.max_members,
-            self.period_max_members,
-            self.pause_duration,
-            self.member_fetch_timeout,
+        scan_client = self
+        recorder = None
+        if self.config.record_path:
+            # Cached profiles would never be requested and so missing from the recording.
+            logging.info("Recording scan to %s, profile cache disabled", self.config.record_path)
+            recorder = ScanRecorder(self.config.record_path, self.config.record_anonymize)
+            recorder.record_start(self, friend_ids)
+            scan_client = recorder.wrap(self)
+        else:
+            self.profile_cache = self.open_profile_cache()
+        self.checkpoint_journal = self.open_checkpoint_journal()
+        self.scan_state = ScanState(
+            os.path.join(normalize_output_path(self.config.output_path), SCAN_STATE_FILENAME)
+        )
+        self.rate_limiter = build_rate_limiter(self.config.rate_limit_mode, self.config.sleep_time)
+        self.enumeration_stats = EnumerationStats(
+            os.path.join(
+                normalize_output_path(self.config.output_path), ENUMERATION_STATS_FILENAME
+            )
         )
-        friends = self.get_friends(server_info)
-        mutual_friends = self.get_mutual_friends(server_info, self.output_verbosity)
-        mutual_servers = self.get_mutual_servers(server_info, self.output_verbosity)
+        self.scan_metrics = ScanMetrics(self.rate_limiter, self.profile_cache)
+        metrics_path = normalize_output_path(self.config.output_path)
+        metrics_task = None
+        if self.config.metrics_interval > 0:
+            metrics_task = asyncio.create_task(
+                self.scan_metrics.write_periodically(metrics_path, self.config.metrics_interval)
+            )
+        if self.config.profile:
+            self.scan_profiler = ScanProfiler(
+                os.path.join(normalize_output_path(self.config.output_path), SCAN_PROFILE_DIRNAME)
+            )
+        rate_limit_log_handler = RateLimitLogHandler(self.rate_limiter)
+        logging.getLogger("discord.http").addHandler(rate_limit_log_handler)
+        try:
+            scan_results = await self.run_profiled(self.get_server_info(scan_client, friend_ids))
+        finally:
+            if self.profile_cache is not None:
+                self.profile_cache.log_stats()
+            if not self.config.watch:
+                self.close_profile_cache()
+            self.checkpoint_journal.close()
+            logging.getLogger("discord.http").removeHandler(rate_limit_log_handler)
+            self.rate_limiter.log_stats()
+            if metrics_task is not None:
+                metrics_task.cancel()
+            self.scan_metrics.write(metrics_path)
+            if recorder is not None:
+                recorder.close()
+                logging.info(
+                    "Recorded %s events to %s", recorder.events, self.config.record_path
+                )
+        try:
+            await self.run_profiled(self.write_results(scan_results))
+        finally:
+            if self.scan_profiler is not None:
+                self.scan_profiler.stop()
+                self.scan_profiler.write()
+                self.scan_profiler = None
+        self.checkpoint_journal.discard()
+
+        if self.config.watch:
+            self.watcher = ResultsWatcher(
+                self,
+                scan_results,
+                self.scan_state,
+                self.scan_profiles,
+                friend_ids,
+                self.config.watch_interval,
+            )
+            logging.info(
+                "Watching for changes, rewriting results at most every %ss",
+                self.config.watch_interval,
+            )
+            return
+        scan_results.discard_shards()
 
-        if self.print_info:
-            self.print_client_info(server_info, friends, mutual_friends, mutual_servers)
+        await self.close()
+
+    async def write_results(self, scan_results: ScanResults) -> None:
+        with self.profile_phase("post_processing"):
+            friends, mutual_friends, mutual_servers = self.get_derived_views(
+                scan_results, self.config.output_verbosity, self.config.top_k
+            )
+
+            if self.config.print_info:
+                self.print_client_info(
+                    scan_results.to_server_info(), friends, mutual_friends, mutual_servers
+                )
 
-        if self.write_to_json:
+        if self.config.write_to_json and self.scan_profiler is not None:
+            # Written on the event loop thread, where the phase profilers run.
             self.write_data_to_json(
-                server_info, friends, mutual_friends, mutual_servers, self.output_path
+                scan_results, friends, mutual_friends, mutual_servers, self.config.output_path
+            )
+        elif self.config.write_to_json:
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                self.write_data_to_json,
+                scan_results,
+                friends,
+                mutual_friends,
+                mutual_servers,
+                self.config.output_path,
             )
 
-        await self.close()
+    async def on_member_join(self, member) -> None:
+        if self.watcher is not None:
+            await self.watcher.on_member_join(member)
+
+    async def on_member_remove(self, member) -> None:
+        if self.watcher is not None:
+            await self.watcher.on_member_remove(member)
+
+    async def on_guild_join(self, guild) -> None:
+        if self.watcher is not None:
+            await self.watcher.on_guild_join(guild)
+
+    async def on_guild_remove(self, guild) -> None:
+        if self.watcher is not None:
+            await self.watcher.on_guild_remove(guild)
+
+    async def on_relationship_add(self, relationship) -> None:
+        if self.watcher is not None and relationship.type == discord.RelationshipType.friend:
+            await self.watcher.on_friendship_change(relationship.user, True)
+
+    async def on_relationship_remove(self, relationship) -> None:
+        if self.watcher is not None and relationship.type == discord.RelationshipType.friend:
+            await self.watcher.on_friendship_change(relationship.user, False)
+
+    async def on_relationship_update(self, before, after) -> None:
+        if self.watcher is None:
+            return
+        was_friend = before.type == discord.RelationshipType.friend
+        is_friend = after.type == discord.RelationshipType.friend
+        if was_friend != is_friend:
+            await self.watcher.on_friendship_change(after.user, is_friend)
+
+    async def close(self) -> None:
+        watcher, self.watcher = self.watcher, None
+        if watcher is not None:
+            await watcher.close()
+        self.close_profile_cache()
+        await super().close()
+
+    async def run_profiled(self, coro):
+        if self.scan_profiler is None:
+            return await coro
+        return await self.scan_profiler.run(coro)
+
+    def profile_phase(self, phase: str):
+        if self.scan_profiler is None:
+            return contextlib.nullcontext()
+        return self.scan_profiler.phase(phase)
+
+    def open_profile_cache(self) -> Optional[ProfileCache]:
+        if self.config.profile_cache_ttl <= 0 or self.config.profile_cache_max_entries <= 0:
+            logging.info("Profile cache disabled")
+            return None
+        cache_path = os.path.join(
+            normalize_output_path(self.config.output_path), PROFILE_CACHE_FILENAME
+        )
+        try:
+            return ProfileCache(
+                cache_path, self.config.profile_cache_ttl, self.config.profile_cache_max_entries
+            )
+        except sqlite3.Error as e:
+            logging.warning("Could not open profile cache at %s: %s", cache_path, e)
+            return None
+
+    def close_profile_cache(self) -> None:
+        profile_cache, self.profile_cache = self.profile_cache, None
+        if profile_cache is not None:
+            profile_cache.close()
+
+    def open_checkpoint_journal(self) -> CheckpointJournal:
+        journal_path = os.path.join(
+            normalize_output_path(self.config.output_path), CHECKPOINT_JOURNAL_FILENAME
+        )
+        return CheckpointJournal(
+            journal_path,
+            resume=self.config.resume,
+            scan_results=self.open_scan_results(),
+            options=self.config.profile_options(),
+        )
+
+    def open_scan_results(self) -> ScanResults:
+        return ScanResults(
+            os.path.join(normalize_output_path(self.config.output_path), SHARD_DIRNAME)
+        )
 
     def get_friend_ids(self, client: discord.Client) -> set:
         friend_ids = set()
@@ -160,88 +332,97 @@ class MyClient(discord.Client):
             friend_ids.add(friend.user.id)
         return friend_ids
 
-    def get_friends(self, server_info: dict) -> dict:
+    def rank_members(
+        self,
+        candidates: list,
+        output_verbosity: int,
+        top_k: Optional[int] = None,
+        resolve_mutuals=list,
+    ) -> list:
+        """Rank ``(member, mutuals)`` pairs by mutual count, then member name.
+
+        ``resolve_mutuals`` turns a member's mutuals into the names listed at
+        output verbosity 3.
+        """
+
+        def sort_key(candidate):
+            return (-len(candidate[1]), candidate[0])
+
+        if top_k is not None:
+            ranked = heapq.nsmallest(top_k, candidates, key=sort_key)
+        else:
+            ranked = sorted(candidates, key=sort_key)
+        if output_verbosity == 1:
+            return [member for member, _mutuals in ranked]
+        if output_verbosity == 2:
+            return [(member, len(mutuals)) for member, mutuals in ranked]
+        return [
+            (member, len(mutuals), resolve_mutuals(mutuals)) for member, mutuals in ranked
+        ]
+
+    def get_derived_views(
+        self, scan_results: ScanResults, output_verbosity: int, top_k: Optional[int] = None
+    ) -> tuple:
         friends = dict()
-        for server in server_info:
+        mutual_friends = dict()
+        mutual_servers = dict()
+
+        def resolve_friends(friend_ids) -> list:
+            return [scan_results.user_name(friend_id) for friend_id in friend_ids]
+
+        def resolve_servers(server_ids) -> list:
+            return [scan_results.guild_name(server_id) for server_id in server_ids]
+
+        for server, members in scan_results.iter_guilds():
             friends[server] = list()
-            for member in server_info[server]:
-                if server_info[server][member]["is_friend"]:
+            with_mutual_friends = list()
+            with_mutual_servers = list()
+            for member, record in members:
+                if record.is_friend:
                     friends[server].append(member)
-        return friends
+                if record.mutual_friend_ids:
+                    with_mutual_friends.append((member, record.mutual_friend_ids))
+                if record.mutual_server_ids:
+                    with_mutual_servers.append((member, record.mutual_server_ids))
+            mutual_friends[server] = self.rank_members(
+                with_mutual_friends, output_verbosity, top_k, resolve_friends
+            )
+            mutual_servers[server] = self.rank_members(
+                with_mutual_servers, output_verbosity, top_k, resolve_servers
+            )
+        return friends, mutual_friends, mutual_servers
+
+    def get_friends(self, server_info: dict) -> dict:
+        return {
+            server: [member for member, details in members.items() if details["is_friend"]]
+            for server, members in server_info.items()
+        }
 
     def get_mutual_friends(self, server_info: dict, output_verbosity: int) -> dict:
-        mutual_friends = dict()
-        for server in server_info:
-            mutual_friends[server] = list()
-            for member in server_info[server]:
-                if server_info[server][member]["mutual_friends"]:
-                    mutual_friends[server].append(
-                        (
-                            -len(server_info[server][member]["mutual_friends"]),
-                            member,
-                            server_info[server][member]["mutual_friends"],
-                        )
-                    )
-            mutual_friends[server].sort()
-            if output_verbosity == 1:
-                mutual_friends[server] = [
-                    member
-                    for mutual_friends_count, member, mutual_friends_list in mutual_friends[
-                        server
-                    ]
-                ]
-            elif output_verbosity == 2:
-                mutual_friends[server] = [
-                    (member, -mutual_friends_count)
-                    for mutual_friends_count, member, mutual_friends_list in mutual_friends[
-                        server
-                    ]
-                ]
-            elif output_verbosity == 3:
-                mutual_friends[server] = [
-                    (member, -mutual_friends_count, mutual_friends_list)
-                    for mutual_friends_count, member, mutual_friends_list in mutual_friends[
-                        server
-                    ]
-                ]
-        return mutual_friends
+        return {
+            server: self.rank_members(
+                [
+                    (member, details["mutual_friends"])
+                    for member, details in members.items()
+                    if details["mutual_friends"]
+                ],
+                output_verbosity,
+            )
+            for server, members in server_info.items()
+        }
 
     def get_mutual_servers(self, server_info: dict, output_verbosity: int) -> dict:
-        mutual_servers = dict()
-        for server in server_info:
-            mutual_servers[server] = list()
-            for member in server_info[server]:
-                if server_info[server][member]["mutual_servers"]:
-                    mutual_servers[server].append(
-                        (
-                            -len(server_info[server][member]["mutual_servers"]),
-                            member,
-                            server_info[server][member]["mutual_servers"],
-                        )
-                    )
-            mutual_servers[server].sort()
-            if output_verbosity == 1:
-                mutual_servers[server] = [
-                    member
-                    for mutual_servers_count, member, mutual_servers_list in mutual_servers[
-                        server
-                    ]
-                ]
-            elif output_verbosity == 2:
-                mutual_servers[server] = [
-                    (member, -mutual_servers_count)
-                    for mutual_servers_count, member, mutual_servers_list in mutual_servers[
-                        server
-                    ]
-                ]
-            elif output_verbosity == 3:
-                mutual_servers[server] = [
-                    (member, -mutual_servers_count, mutual_servers_list)
-                    for mutual_servers_count, member, mutual_servers_list in mutual_servers[
-                        server
-                    ]
-                ]
-        return mutual_servers
+        return {
+            server: self.rank_members(
+                [
+                    (member, details["mutual_servers"])
+                    for member, details in members.items()
+                    if details["mutual_servers"]
+                ],
+                output_verbosity,
+            )
+            for server, members in server_info.items()
+        }
 
     def print_client_info(self, server_info, friends, mutual_friends, mutual_servers) -> None:
         print("Server Info:")
@@ -254,295 +435,44 @@ class MyClient(discord.Client):
         print(json.dumps(mutual_servers, indent=4))
 
     def write_data_to_json(
-        self, server_info, friends, mutual_friends, mutual_servers, output_path
+        self, scan_results, friends, mutual_friends, mutual_servers, output_path
     ) -> None:
-        resolved_output_path = normalize_output_path(output_path)
-        os.makedirs(resolved_output_path, exist_ok=True)
-        with open(os.path.join(resolved_output_path, "server_info.json"), "w") as f:
-            json.dump(server_info, f, indent=4)
-        with open(os.path.join(resolved_output_path, "friends.json"), "w") as f:
-            json.dump(friends, f, indent=4)
-        with open(os.path.join(resolved_output_path, "mutual_friends.json"), "w") as f:
-            json.dump(mutual_friends, f, indent=4)
-        with open(os.path.join(resolved_output_path, "mutual_servers.json"), "w") as f:
-            json.dump(mutual_servers, f, indent=4)
-
-    async def get_server_info(
-        self,
-        client: discord.Client,
-        friend_ids: set,
-        sleep_time: float,
-        include_servers: set,
-        include_channels: set,
-        max_members: int,
-        period_max_members: int,
-        pause_duration: int,
-        member_fetch_timeout: Optional[float],
-    ) -> dict:
-        async def maybe_wait_for(coro, timeout: Optional[float], label: str):
-            if not timeout:
-                return await coro
-            try:
-                return await asyncio.wait_for(coro, timeout=timeout)
-            except asyncio.TimeoutError:
-                logging.warning("%s timed out after %ss", label, timeout)
-                return None
-
-        async def fetch_members_with_retry(server, channels=None):
-            try:
-                if channels:
-                    return set(await server.fetch_members(channels=channels))
-                return set(await server.fetch_members())
-            except discord.HTTPException as e:
-                if e.status == 429:
-                    retry_after = int(e.response.headers.get("Retry-After", 1))
-                    logging.warning(
-                        f"Rate limited. Retrying after {retry_after} seconds."
-                    )
-                    await asyncio.sleep(retry_after)
-                    return await fetch_members_with_retry(server, channels)
-                logging.error(f"Failed to fetch members: {e}")
-                return set()
-            except RuntimeError as e:
-                logging.warning(f"Cannot fetch members for {server.name}: {e}")
-                return set()
-
-        logging.info("Fetching guild list...")
-        user_servers = await client.fetch_guilds()
-        servers_count = len(user_servers)
-        logging.info("Found %s guilds", servers_count)
-        server_info = dict()
-        seen_members = dict()
-        include_servers = set(include_servers)
-        include_channels = set(include_channels)
-        specific_server_count = 0
-        matched_servers = set()
-        seen_servers = set()
-
-        for server_idx, user_server in enumerate(user_servers):
-            server = client.get_guild(user_server.id)
-            server_name = server.name
-            seen_servers.add(server_name)
-            if include_servers:
-                if server_name not in include_servers:
-                    continue
-                matched_servers.add(server_name)
-                specific_server_count += 1
-            logging.info(
-                "Fetching members for server %s (%s/%s)",
-                server_name,
-                server_idx + 1,
-                servers_count,
-            )
-
-            if include_channels:
-                channels = [
-                    discord.utils.get(server.channels, name=channel)
-                    for channel in include_channels
-                ]
-                logging.info(
-                    "Starting fetch_members for %s with channels filter (%s)",
-                    server_name,
-                    len(channels),
-                )
-                fetch_start = time.monotonic()
-                fetch_server_members = await maybe_wait_for(
-                    fetch_members_with_retry(server, channels),
-                    member_fetch_timeout,
-                    f"fetch_members for {server_name}",
-                )
-            else:
-                logging.info("Starting fetch_members for %s (no channel filter)", server_name)
-                fetch_start = time.monotonic()
-                fetch_server_members = await maybe_wait_for(
-                    fetch_members_with_retry(server),
-                    member_fetch_timeout,
-                    f"fetch_members for {server_name}",
-                )
-            if fetch_server_members is None:
-                fetch_server_members = set()
-            logging.info(
-                "fetch_members returned %s members for %s in %.1fs",
-                len(fetch_server_members),
-                server_name,
-                time.monotonic() - fetch_start,
-            )
-
-            chunk_start = time.monotonic()
-            logging.info("Starting chunk() for %s", server_name)
-            try:
-                chunk_result = await maybe_wait_for(
-                    server.chunk(),
-                    member_fetch_timeout,
-                    f"chunk() for {server_name}",
-                )
-                chunked_server_members = set(chunk_result or [])
-                logging.info(
-                    "chunk() returned %s members for %s in %.1fs",
-                    len(chunked_server_members),
-                    server_name,
-                    time.monotonic() - chunk_start,
-                )
-            except Exception as e:
-                logging.warning(
-                    "chunk() failed for %s after %.1fs: %s",
-                    server_name,
-                    time.monotonic() - chunk_start,
-                    e,
-                )
-                chunked_server_members = set()
-            guild_server_members = set(server.members)
-            logging.info(
-                "guild.members has %s members for %s", len(guild_server_members), server_name
-            )
-            server_members = list(
-                fetch_server_members.union(guild_server_members).union(
-                    chunked_server_members
-                )
-            )
-
-            server_member_count = len(server_members)
-            logging.info(
-                "Server %s has %s members (processing up to %s)",
-                server_name,
-                server_member_count,
-                max_members,
+        output_writer = OutputWriter(
+            normalize_output_path(output_path),
+            self.config.output_format,
+            self.config.output_compression,
+            self.config.compact_output,
+        )
+        write_start = time.monotonic()
+        with self.profile_phase("json_writing"):
+            written_paths = output_writer.write_all(
+                scan_results, friends, mutual_friends, mutual_servers
             )
-            if server_member_count > max_members:
-                logging.info(
-                    "The server member count of %s is greater than the max member count "
-                    "of %s, selecting only the first %s members",
-                    server_member_count,
-                    max_members,
-                    max_members,
-                )
-
-            selected_server_member_count = min(server_member_count, max_members)
-
-            server_info[server_name] = dict()
+        logging.info(
+            "Wrote %s in %.1fs", ", ".join(written_paths), time.monotonic() - write_start
+        )
 
-            for start_idx in range(0, selected_server_member_count, period_max_members):
-                end_idx = min(
-                    start_idx + period_max_members, selected_server_member_count
-                )
-                for member_idx in range(start_idx, end_idx):
-                    member = server_members[member_idx]
-
-                    if include_servers:
-                        logging.info(
-                            "Processing %s server, progress = %s/%s servers %s/%s members",
-                            server.name,
-                            specific_server_count,
-                            len(include_servers),
-                            member_idx + 1,
-                            selected_server_member_count,
-                        )
-                    else:
-                        logging.info(
-                            "Processing %s server, progress = %s/%s servers %s/%s members",
-                            server.name,
-                            server_idx + 1,
-                            servers_count,
-                            member_idx + 1,
-                            selected_server_member_count,
-                        )
-                    if member.id == client.user.id:
-                        continue
-
-                    member_name = f"{member.name}#{member.discriminator}"
-
-                    if member_name in seen_members:
-                        server_info[server_name][member_name] = dict()
-                        server_info[server_name][member_name]["is_friend"] = (
-                            seen_members[member_name]["is_friend"]
-                        )
-                        server_info[server_name][member_name]["mutual_friends"] = (
-                            seen_members[member_name]["mutual_friends"]
-                        )
-
-                        server_info[server_name][member_name]["mutual_servers"] = (
-                            seen_members[member_name]["mutual_servers"]
-                        )
-                        continue
-                    seen_members[member_name] = dict()
-
-                    try:
-                        member_profile = await server.fetch_member_profile(
-                            member.id,
-                            with_mutual_guilds=True,
-                            with_mutual_friends=True,
-                        )
-                    except (discord.errors.NotFound, discord.errors.InvalidData):
-                        logging.warning(
-                            "Member %s not found or invalid. Skipping.", member_name
-                        )
-                        continue
-                    except discord.errors.HTTPException as e:
-                        logging.warning(
-                            "HTTP error fetching profile for %s: %s. Skipping.",
-                            member_name,
-                            e,
-                        )
-                        continue
-                    except Exception as e:
-                        logging.error(
-                            "Unexpected error fetching profile for %s: %s.",
-                            member_name,
-                            e,
-                        )
-                        continue
-
-                    server_info[server_name][member_name] = dict()
-
-                    mutual_friend_names = []
-                    mutual_server_names = []
-                    mutual_friends = member_profile.mutual_friends
-                    mutual_servers = member_profile.mutual_guilds
-
-                    if member.id in friend_ids:
-                        server_info[server_name][member_name]["is_friend"] = True
-                        seen_members[member_name]["is_friend"] = True
-                    else:
-                        server_info[server_name][member_name]["is_friend"] = False
-                        seen_members[member_name]["is_friend"] = False
-
-                    for friend in mutual_friends:
-                        friend_name = f"{friend.name}#{friend.discriminator}"
-                        mutual_friend_names.append(friend_name)
-
-                    server_info[server_name][member_name]["mutual_friends"] = (
-                        mutual_friend_names
-                    )
-                    seen_members[member_name]["mutual_friends"] = mutual_friend_names
-
-                    for mutual_server in mutual_servers:
-                        if mutual_server.id != server.id:
-                            mutual_server_names.append(mutual_server.guild.name)
-
-                    server_info[server_name][member_name]["mutual_servers"] = (
-                        mutual_server_names
-                    )
-
-                    seen_members[member_name]["mutual_servers"] = mutual_server_names
-
-                    await asyncio.sleep(sleep_time)
-
-                if end_idx < selected_server_member_count and pause_duration > 0:
-                    logging.info("Pausing for %s seconds...", pause_duration)
-                    await asyncio.sleep(pause_duration)
-
-        unmatched_servers = include_servers.difference(matched_servers)
-        if unmatched_servers:
-            logging.warning(
-                "Did not find the following servers: %s consider choosing from the following servers: %s",
-                unmatched_servers,
-                seen_servers,
-            )
-        return server_info
+    async def get_server_info(self, client: discord.Client, friend_ids: set) -> ScanResults:
+        scanner = ServerScanner(
+            client,
+            friend_ids,
+            self.config,
+            self.rate_limiter or build_rate_limiter("fixed", self.config.sleep_time),
+            profile_cache=self.profile_cache,
+            checkpoint_journal=self.checkpoint_journal,
+            scan_state=self.scan_state,
+            enumeration_stats=self.enumeration_stats,
+            scan_metrics=self.scan_metrics,
+            profile_phase=self.profile_phase,
+        )
+        scan_results = await scanner.run()
+        self.scan_profiles = scanner.profiles
+        return scan_results
 
 
 def run_client(*, token: str, **kwargs) -> None:
+    """Scan with the :class:`ScanConfig` options given as keyword arguments."""
     if not token:
         raise ValueError("Discord token is required.")
-    client = MyClient(**kwargs)
+    client = MyClient(ScanConfig(**kwargs))
     client.run(token)
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Iterable, Optional
+
+ENUMERATION_METHODS = ("cached", "fetch_members", "chunk")
+ENUMERATION_STRATEGIES = ("auto", "all") + ENUMERATION_METHODS
+ENUMERATION_STATS_FILENAME = "enumeration_stats.json"
+# Guilds below this size can be chunked from any channel everyone can view.
+SMALL_GUILD_MEMBER_COUNT = 1000
+# A method counts as working when it finds this share of the best count seen.
+COMPLETE_MEMBER_RATIO = 0.99
+
+
+class EnumerationStats:
+    """Per-guild timings and member counts of each enumeration method.
+
+    Persisted as JSON between runs so later scans can pick the cheapest method
+    that found (almost) every member before.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._stats: dict = dict()
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self._stats = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning("Ignoring unreadable enumeration stats at %s: %s", path, e)
+
+    def get(self, guild_id: int) -> dict:
+        return self._stats.get(str(guild_id), dict())
+
+    def record(self, guild_id: int, method: str, seconds: float, members: int) -> None:
+        self._stats.setdefault(str(guild_id), dict())[method] = {
+            "seconds": round(seconds, 3),
+            "members": members,
+        }
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self._stats, f, indent=4)
+
+
+def parse_enumeration_overrides(values: Iterable[str]) -> dict:
+    """Parse ``"server name=method"`` pairs into a server name -> strategy dict."""
+    overrides = dict()
+    for value in values:
+        server_name, separator, strategy = value.rpartition("=")
+        if not separator or not server_name or strategy not in ENUMERATION_STRATEGIES:
+            raise ValueError(
+                f"{value!r} is not SERVER=STRATEGY with STRATEGY one of "
+                f"{', '.join(ENUMERATION_STRATEGIES)}"
+            )
+        overrides[server_name] = strategy
+    return overrides
+
+
+def _can_request_all_members(server) -> bool:
+    permissions = getattr(getattr(server, "me", None), "guild_permissions", None)
+    return permissions is not None and any(
+        (
+            permissions.kick_members,
+            permissions.ban_members,
+            permissions.manage_roles,
+        )
+    )
+
+
+def enumeration_target(server, history: dict) -> Optional[int]:
+    """Number of unique members after which enumeration can stop early.
+
+    Only requesting methods set the bar; the member cache is filled as a side
+    effect of them and would otherwise lock in a partial count.
+    """
+    member_count = getattr(server, "member_count", None)
+    requested_counts = [
+        entry["members"] for method, entry in history.items() if method != "cached"
+    ]
+    if not requested_counts:
+        return member_count
+    target = int(max(requested_counts) * COMPLETE_MEMBER_RATIO)
+    return min(target, member_count) if member_count is not None else target
+
+
+def choose_enumeration_methods(
+    server, strategy: str, history: dict, channel_filter: bool
+) -> list:
+    """Order the enumeration methods to try for a guild, cheapest working first.
+
+    ``all`` runs every method and is how timings for a guild are first learned.
+    ``auto`` always starts from the member cache, then prefers the fastest
+    method that reached the best member count on earlier runs, and otherwise
+    decides from the guild size, our permissions and whether it is chunked.
+    The remaining methods are kept as fallbacks in case the preferred one
+    comes up short.
+    """
+    if strategy == "all":
+        return list(ENUMERATION_METHODS)
+    if strategy != "auto":
+        return [strategy]
+    if getattr(server, "chunked", False):
+        return ["cached"]
+
+    preferred = None
+    target = enumeration_target(server, history)
+    working = [
+        (entry["seconds"], method)
+        for method, entry in history.items()
+        if method in ENUMERATION_METHODS and target is not None and entry["members"] >= target
+    ]
+    if working:
+        preferred = min(working)[1]
+    elif channel_filter or _can_request_all_members(server):
+        preferred = "fetch_members"
+    elif (getattr(server, "member_count", None) or 0) < SMALL_GUILD_MEMBER_COUNT:
+        preferred = "chunk"
+
+    if preferred is None:
+        return list(ENUMERATION_METHODS)
+    return list(dict.fromkeys(["cached", preferred, *ENUMERATION_METHODS]))
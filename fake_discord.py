@@ -0,0 +1,341 @@
+"""Offline stand-in for the parts of discord.Client the scanner uses.
+
+``build_fake_client`` creates guilds of configurable sizes drawn from a shared
+user pool, so guilds overlap by a chosen share of their members. Member
+enumeration and profile requests sleep for a configurable latency, count
+every request, and can answer with injected 429s that are logged the way
+discord.py logs them before it retries. Profile requests can also share a
+rate limit bucket whose state is kept where discord.py's HTTP client keeps
+it, so the adaptive rate limiter can be exercised offline.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import Iterable, Optional, Union
+
+from rate_limit import PROFILE_ROUTE_KEY, RATE_LIMITED_LOG_FORMAT
+
+FAKE_CLIENT_USER_ID = 1
+FIRST_FAKE_GUILD_ID = 100_000
+FIRST_FAKE_USER_ID = 1_000_000
+MAX_MUTUAL_FRIENDS = 10
+FAKE_PROFILE_BUCKET_HASH = "fake-profile-bucket"
+FAKE_API_URL = "https://discord.com/api/v9"
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str, discriminator: str = "0") -> None:
+        self.id = user_id
+        self.name = name
+        self.discriminator = discriminator
+
+    def __repr__(self) -> str:
+        return f"<FakeUser id={self.id} name={self.name!r}>"
+
+
+class FakePermissions:
+    def __init__(self, can_request_all_members: bool = False) -> None:
+        self.kick_members = can_request_all_members
+        self.ban_members = can_request_all_members
+        self.manage_roles = can_request_all_members
+
+
+class FakeMe:
+    def __init__(self, user: FakeUser, guild_permissions: FakePermissions) -> None:
+        self.id = user.id
+        self.guild_permissions = guild_permissions
+
+
+class FakeRelationship:
+    def __init__(self, user: FakeUser) -> None:
+        self.user = user
+
+
+class FakeMutualGuild:
+    def __init__(self, guild) -> None:
+        self.id = guild.id
+        self.guild = guild
+
+
+class FakeMemberProfile:
+    def __init__(self, mutual_friends: Optional[list], mutual_guilds: list) -> None:
+        self.mutual_friends = mutual_friends
+        self.mutual_guilds = mutual_guilds
+
+
+class FakeRequestStats:
+    def __init__(self) -> None:
+        self.profile_requests = 0
+        self.fetch_members_requests = 0
+        self.chunk_requests = 0
+        self.rate_limited = 0
+
+    @property
+    def total_requests(self) -> int:
+        return self.profile_requests + self.fetch_members_requests + self.chunk_requests
+
+    def to_dict(self) -> dict:
+        return {
+            "profile_requests": self.profile_requests,
+            "fetch_members_requests": self.fetch_members_requests,
+            "chunk_requests": self.chunk_requests,
+            "rate_limited": self.rate_limited,
+        }
+
+
+class FakeRatelimit:
+    """The fields of ``discord.http.Ratelimit`` the rate limiter reads."""
+
+    def __init__(self) -> None:
+        self.limit = 1
+        self.remaining = 1
+        self.reset_after = 0.0
+        self.dirty = False
+
+
+class FakeHTTPClient:
+    """Profile route rate limit bucket, kept the way discord.py's HTTPClient keeps it.
+
+    With a ``bucket_limit``, profile requests share a bucket of that many
+    requests per ``bucket_window`` seconds. Its state after every request is
+    stored in the private ``_buckets`` and ``_bucket_hashes`` mappings, under
+    the bucket hash Discord would have sent. Without one, both stay empty.
+    """
+
+    def __init__(self, bucket_limit: int = 0, bucket_window: float = 1.0) -> None:
+        self.bucket_limit = bucket_limit
+        self.bucket_window = bucket_window
+        self._buckets: dict = dict()
+        self._bucket_hashes: dict = dict()
+        self._remaining = bucket_limit
+        self._resets_at = 0.0
+
+    def take_profile_request(self) -> float:
+        """Spend one request of the profile bucket.
+
+        Returns 0 when the request is allowed, otherwise the seconds until the
+        bucket resets, which Discord would send as ``Retry-After`` with a 429.
+        """
+        if not self.bucket_limit:
+            return 0.0
+        now = time.monotonic()
+        if now >= self._resets_at:
+            self._remaining = self.bucket_limit
+            self._resets_at = now + self.bucket_window
+        if self._remaining <= 0:
+            return self._resets_at - now
+        self._remaining -= 1
+        self._bucket_hashes[PROFILE_ROUTE_KEY] = FAKE_PROFILE_BUCKET_HASH
+        ratelimit = self._buckets.setdefault(f"{FAKE_PROFILE_BUCKET_HASH}:", FakeRatelimit())
+        ratelimit.limit = self.bucket_limit
+        ratelimit.remaining = self._remaining
+        ratelimit.reset_after = self._resets_at - now
+        ratelimit.dirty = True
+        return 0.0
+
+
+class FakeGuild:
+    def __init__(
+        self,
+        client: "FakeDiscordClient",
+        guild_id: int,
+        name: str,
+        members: list,
+        cached_fraction: float,
+        fetch_members_fraction: float,
+        can_request_all_members: bool,
+    ) -> None:
+        self._client = client
+        self._members = members
+        self.id = guild_id
+        self.name = name
+        self.member_count = len(members)
+        self.members = members[: int(len(members) * cached_fraction)]
+        self.chunked = cached_fraction >= 1
+        self.channels: list = []
+        self.me = FakeMe(client.user, FakePermissions(can_request_all_members))
+        self._fetch_members_fraction = fetch_members_fraction
+
+    def add_member(self, user: FakeUser) -> None:
+        self._members.append(user)
+        self.member_count += 1
+        self._client._user_guilds.setdefault(user.id, []).append(self)
+
+    def remove_member(self, user_id: int) -> None:
+        user = next(member for member in self._members if member.id == user_id)
+        self._members.remove(user)
+        self.members = [member for member in self.members if member.id != user_id]
+        self.member_count -= 1
+        self._client._user_guilds[user_id].remove(self)
+
+    async def fetch_members(self, channels=None, **kwargs) -> list:
+        self._client.stats.fetch_members_requests += 1
+        await self._client.simulate_latency()
+        return list(self._members[: int(len(self._members) * self._fetch_members_fraction)])
+
+    async def chunk(self, **kwargs) -> list:
+        self._client.stats.chunk_requests += 1
+        await self._client.simulate_latency()
+        return list(self._members)
+
+    async def fetch_member_profile(
+        self,
+        member_id: int,
+        with_mutual_guilds: bool = True,
+        with_mutual_friends: bool = True,
+        **kwargs,
+    ) -> FakeMemberProfile:
+        await self._client.simulate_profile_request(member_id)
+        return self._client.member_profile(member_id, with_mutual_guilds, with_mutual_friends)
+
+
+class FakeDiscordClient:
+    """Serves ``fetch_guilds``, ``get_guild``, ``user`` and ``friends`` from memory."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit_every: int = 0,
+        retry_after: float = 1.0,
+        seed: int = 0,
+        http: Optional[FakeHTTPClient] = None,
+    ) -> None:
+        self.user = FakeUser(FAKE_CLIENT_USER_ID, "fake-client")
+        self.guilds: list = []
+        self.friends: list = []
+        self.http = http or FakeHTTPClient()
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.stats = FakeRequestStats()
+        self._random = random.Random(seed)
+        self._guilds_by_id: dict = dict()
+        self._user_guilds: dict = dict()
+        self._friend_users: list = []
+
+    def add_guild(self, guild: FakeGuild) -> None:
+        self.guilds.append(guild)
+        self._guilds_by_id[guild.id] = guild
+        for member in guild._members:
+            self._user_guilds.setdefault(member.id, []).append(guild)
+
+    def remove_guild(self, guild_id: int) -> FakeGuild:
+        """Leave a guild, which can be joined again with ``add_guild``."""
+        guild = self._guilds_by_id.pop(guild_id)
+        self.guilds.remove(guild)
+        for member in guild._members:
+            self._user_guilds[member.id].remove(guild)
+        return guild
+
+    def set_friends(self, users: Iterable[FakeUser]) -> None:
+        self._friend_users = list(users)
+        self.friends = [FakeRelationship(user) for user in self._friend_users]
+
+    async def fetch_guilds(self) -> list:
+        await self.simulate_latency()
+        return list(self.guilds)
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self._guilds_by_id.get(guild_id)
+
+    async def simulate_latency(self) -> None:
+        await asyncio.sleep(self.latency)
+
+    async def simulate_rate_limited(self, member_id: int, retry_after: float) -> None:
+        self.stats.rate_limited += 1
+        logging.getLogger("discord.http").warning(
+            RATE_LIMITED_LOG_FORMAT,
+            "GET",
+            f"{FAKE_API_URL}/users/{member_id}/profile",
+            retry_after,
+        )
+        await asyncio.sleep(retry_after)
+
+    async def simulate_profile_request(self, member_id: int) -> None:
+        self.stats.profile_requests += 1
+        if self.rate_limit_every and self.stats.profile_requests % self.rate_limit_every == 0:
+            await self.simulate_rate_limited(member_id, self.retry_after)
+        while True:
+            retry_after = self.http.take_profile_request()
+            if not retry_after:
+                break
+            await self.simulate_rate_limited(member_id, retry_after)
+        await self.simulate_latency()
+
+    def member_profile(
+        self, member_id: int, with_mutual_guilds: bool, with_mutual_friends: bool
+    ) -> FakeMemberProfile:
+        mutual_friends = None
+        if with_mutual_friends:
+            member_random = random.Random(member_id)
+            mutual_friend_count = min(
+                len(self._friend_users), member_random.randrange(MAX_MUTUAL_FRIENDS + 1)
+            )
+            mutual_friends = [
+                friend
+                for friend in member_random.sample(self._friend_users, mutual_friend_count)
+                if friend.id != member_id
+            ]
+        mutual_guilds = []
+        if with_mutual_guilds:
+            mutual_guilds = [
+                FakeMutualGuild(guild) for guild in self._user_guilds.get(member_id, [])
+            ]
+        return FakeMemberProfile(mutual_friends, mutual_guilds)
+
+
+def build_fake_client(
+    guild_sizes: Union[int, Iterable[int]] = (1000,),
+    overlap: float = 0.2,
+    friend_count: int = 100,
+    latency: float = 0.0,
+    rate_limit_every: int = 0,
+    retry_after: float = 1.0,
+    bucket_limit: int = 0,
+    bucket_window: float = 1.0,
+    cached_fraction: float = 0.1,
+    fetch_members_fraction: float = 1.0,
+    can_request_all_members: bool = True,
+    seed: int = 0,
+) -> FakeDiscordClient:
+    """Build a fake client whose guilds have ``guild_sizes`` members each.
+
+    Guild members are consecutive runs of a shared user pool that wrap around,
+    with the pool sized so that about ``overlap`` of all member rows belong to
+    users who are also in another guild. ``bucket_limit`` profile requests are
+    allowed per ``bucket_window`` seconds, with 0 for no limit.
+    """
+    if isinstance(guild_sizes, int):
+        guild_sizes = (guild_sizes,)
+    guild_sizes = list(guild_sizes)
+    client = FakeDiscordClient(
+        latency, rate_limit_every, retry_after, seed, FakeHTTPClient(bucket_limit, bucket_window)
+    )
+    member_rows = sum(guild_sizes)
+    pool_size = max(max(guild_sizes, default=0), round(member_rows * (1 - overlap)), 1)
+    users = [
+        FakeUser(FIRST_FAKE_USER_ID + user_idx, f"user{user_idx}") for user_idx in range(pool_size)
+    ]
+    offset = 0
+    for guild_idx, guild_size in enumerate(guild_sizes):
+        members = [client.user] + [
+            users[(offset + member_idx) % pool_size] for member_idx in range(guild_size)
+        ]
+        offset += guild_size
+        client.add_guild(
+            FakeGuild(
+                client,
+                FIRST_FAKE_GUILD_ID + guild_idx,
+                f"guild{guild_idx}",
+                members,
+                cached_fraction,
+                fetch_members_fraction,
+                can_request_all_members,
+            )
+        )
+    client.set_friends(client._random.sample(users, min(friend_count, pool_size)))
+    return client
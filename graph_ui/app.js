@@ -1,8 +1,10 @@
 const canvas = document.getElementById("graph");
 const ctx = canvas.getContext("2d");
+const glCanvas = document.getElementById("graph-webgl");
 const statusEl = document.getElementById("status");
 const searchInput = document.getElementById("search");
 const toggles = Array.from(document.querySelectorAll(".toggle input"));
+const togglesByEdge = new Map(toggles.map((toggle) => [toggle.dataset.edge, toggle]));
 
 const colors = {
   user: "#4ed4ff",
@@ -15,7 +17,22 @@ const colors = {
 
 let graph = { nodes: [], edges: [] };
 let nodes = [];
-let edges = [];
+let nodeIndex = new Map();
+let positions = new Float32Array(0);
+// Bumped whenever positions change, so renderers know when cached drawings are stale.
+let positionsVersion = 0;
+let edgeSources = new Int32Array(0);
+let edgeTargets = new Int32Array(0);
+let edgeTypes = new Uint8Array(0);
+let edgeTypeNames = [];
+let edgesByType = [];
+let visibleTypes = [];
+let layoutWorker = null;
+let layout = null;
+let workerLayoutSettled = false;
+let renderer = null;
+let initialHeat = 1;
+let drawScheduled = false;
 let selectedNode = null;
 let hoveredNode = null;
 let scale = 1;
@@ -24,22 +41,23 @@ let offsetY = 0;
 let isPanning = false;
 let lastPan = { x: 0, y: 0 };
 
-const settings = {
-  repulsion: 2800,
-  springLength: 120,
-  springStrength: 0.008,
-  damping: 0.85,
-  maxVelocity: 6,
-};
+const urlParams = new URLSearchParams(window.location.search);
+if (urlParams.has("theta")) {
+  layoutSettings.theta = Number(urlParams.get("theta"));
+}
 
 function resize() {
   canvas.width = canvas.clientWidth * window.devicePixelRatio;
   canvas.height = canvas.clientHeight * window.devicePixelRatio;
   ctx.setTransform(window.devicePixelRatio, 0, 0, window.devicePixelRatio, 0, 0);
+  requestDraw();
 }
 
 window.addEventListener("resize", resize);
 
+// Starting heat of a graph laid out by graph_view.py, which only needs refining.
+const PRECOMPUTED_LAYOUT_HEAT = 0.2;
+
 function randomPosition(radius = 200) {
   const angle = Math.random() * Math.PI * 2;
   return {
@@ -49,126 +67,208 @@ function randomPosition(radius = 200) {
 }
 
 function buildSimulation(data) {
-  nodes = data.nodes.map((node) => {
-    const { x, y } = randomPosition(300 + Math.random() * 100);
-    return {
-      ...node,
-      x,
-      y,
-      vx: 0,
-      vy: 0,
-    };
+  nodes = data.nodes;
+  positions = new Float32Array(nodes.length * 2);
+  let precomputed = nodes.length > 0;
+  nodes.forEach((node, i) => {
+    const laidOut = Number.isFinite(node.x) && Number.isFinite(node.y);
+    const { x, y } = laidOut ? node : randomPosition(300 + Math.random() * 100);
+    positions[i * 2] = x;
+    positions[i * 2 + 1] = y;
+    precomputed = precomputed && laidOut;
+  });
+  initialHeat = precomputed ? PRECOMPUTED_LAYOUT_HEAT : 1;
+
+  nodeIndex = new Map(nodes.map((node, i) => [node.id, i]));
+  const linkedEdges = data.edges.filter(
+    (edge) => nodeIndex.has(edge.source) && nodeIndex.has(edge.target)
+  );
+  edgeTypeNames = [...new Set(linkedEdges.map((edge) => edge.type))];
+  const typeIndex = new Map(edgeTypeNames.map((type, i) => [type, i]));
+  edgeSources = new Int32Array(linkedEdges.length);
+  edgeTargets = new Int32Array(linkedEdges.length);
+  edgeTypes = new Uint8Array(linkedEdges.length);
+  linkedEdges.forEach((edge, i) => {
+    edgeSources[i] = nodeIndex.get(edge.source);
+    edgeTargets[i] = nodeIndex.get(edge.target);
+    edgeTypes[i] = typeIndex.get(edge.type);
   });
+  edgesByType = groupEdgesByType(edgeTypes, edgeTypeNames.length);
+  visibleTypes = visibleEdgeTypes();
+  positionsVersion += 1;
+}
 
-  const nodeMap = new Map(nodes.map((n) => [n.id, n]));
-  edges = data.edges
-    .map((edge) => ({
-      ...edge,
-      sourceNode: nodeMap.get(edge.source),
-      targetNode: nodeMap.get(edge.target),
-    }))
-    .filter((edge) => edge.sourceNode && edge.targetNode);
+function visibleEdgeTypes() {
+  return edgeTypeNames.map((type) => isEdgeVisible(type));
 }
 
-function applyForces() {
-  for (let i = 0; i < nodes.length; i += 1) {
-    const nodeA = nodes[i];
-    for (let j = i + 1; j < nodes.length; j += 1) {
-      const nodeB = nodes[j];
-      const dx = nodeA.x - nodeB.x;
-      const dy = nodeA.y - nodeB.y;
-      const distanceSq = dx * dx + dy * dy + 0.01;
-      const force = settings.repulsion / distanceSq;
-      const fx = (dx / Math.sqrt(distanceSq)) * force;
-      const fy = (dy / Math.sqrt(distanceSq)) * force;
-      nodeA.vx += fx;
-      nodeA.vy += fy;
-      nodeB.vx -= fx;
-      nodeB.vy -= fy;
-    }
+function runLayoutOnMainThread() {
+  layout = createLayout(
+    positions,
+    edgeSources,
+    edgeTargets,
+    edgeTypes,
+    visibleTypes,
+    initialHeat
+  );
+}
+
+// Also logged by graph_view.py, since the web view's console is usually hidden.
+function reportWarning(message) {
+  console.warn(message);
+  if (window.pywebview && window.pywebview.api && window.pywebview.api.log_warning) {
+    window.pywebview.api.log_warning(message).catch(() => {});
   }
+}
 
-  edges.forEach((edge) => {
-    if (!isEdgeVisible(edge.type)) {
-      return;
-    }
-    const { sourceNode, targetNode } = edge;
-    const dx = targetNode.x - sourceNode.x;
-    const dy = targetNode.y - sourceNode.y;
-    const distance = Math.sqrt(dx * dx + dy * dy) || 1;
-    const displacement = distance - settings.springLength;
-    const force = displacement * settings.springStrength;
-    const fx = (dx / distance) * force;
-    const fy = (dy / distance) * force;
-    sourceNode.vx += fx;
-    sourceNode.vy += fy;
-    targetNode.vx -= fx;
-    targetNode.vy -= fy;
+// Steps the layout in a worker when possible, so input and drawing never wait on it.
+function startLayout() {
+  try {
+    layoutWorker = new Worker("layout.js");
+  } catch (error) {
+    reportWarning(`Layout worker unavailable (${error.message}), laying out on the main thread`);
+    runLayoutOnMainThread();
+    return;
+  }
+  layoutWorker.onmessage = (event) => {
+    const previous = positions;
+    positions = event.data.positions;
+    positionsVersion += 1;
+    workerLayoutSettled = event.data.settled;
+    layoutWorker.postMessage({ type: "buffer", positions: previous }, [previous.buffer]);
+    requestDraw();
+  };
+  layoutWorker.onerror = (event) => {
+    event.preventDefault();
+    reportWarning(`Layout worker failed (${event.message}), laying out on the main thread`);
+    layoutWorker.terminate();
+    layoutWorker = null;
+    runLayoutOnMainThread();
+    requestDraw();
+  };
+  layoutWorker.postMessage({
+    type: "init",
+    positions: positions.slice(),
+    edgeSources,
+    edgeTargets,
+    edgeTypes,
+    visibleEdgeTypes: visibleTypes,
+    heat: initialHeat,
+    settings: layoutSettings,
   });
+}
+
+function stopLayout() {
+  if (layoutWorker) {
+    layoutWorker.terminate();
+    layoutWorker = null;
+  }
+  layout = null;
+  workerLayoutSettled = false;
+}
 
-  nodes.forEach((node) => {
-    node.vx *= settings.damping;
-    node.vy *= settings.damping;
-    node.vx = Math.max(-settings.maxVelocity, Math.min(settings.maxVelocity, node.vx));
-    node.vy = Math.max(-settings.maxVelocity, Math.min(settings.maxVelocity, node.vy));
-    node.x += node.vx;
-    node.y += node.vy;
+// Replaces the running layout with the one graph_view.py computed in the background.
+function applyLayout(laidOut) {
+  stopLayout();
+  nodes.forEach((node, i) => {
+    const position = laidOut[node.id];
+    if (position) {
+      node.x = position[0];
+      node.y = position[1];
+      positions[i * 2] = node.x;
+      positions[i * 2 + 1] = node.y;
+    }
   });
+  initialHeat = PRECOMPUTED_LAYOUT_HEAT;
+  positionsVersion += 1;
+  startLayout();
+  requestDraw();
+}
+
+function updateLayoutVisibility() {
+  visibleTypes = visibleEdgeTypes();
+  if (layoutWorker) {
+    layoutWorker.postMessage({ type: "visibility", visibleEdgeTypes: visibleTypes });
+  } else if (layout) {
+    setLayoutEdgeVisibility(layout, visibleTypes);
+  }
+  requestDraw();
 }
 
 function isEdgeVisible(edgeType) {
-  const toggle = toggles.find((t) => t.dataset.edge === edgeType);
+  const toggle = togglesByEdge.get(edgeType);
   return toggle ? toggle.checked : true;
 }
 
-function draw() {
-  ctx.clearRect(0, 0, canvas.width, canvas.height);
-  ctx.save();
-  ctx.translate(offsetX, offsetY);
-  ctx.scale(scale, scale);
+function isLayoutStatic() {
+  if (layoutWorker) {
+    return workerLayoutSettled;
+  }
+  return !layout || isLayoutSettled(layout);
+}
 
-  edges.forEach((edge) => {
-    if (!isEdgeVisible(edge.type)) {
-      return;
-    }
-    ctx.beginPath();
-    ctx.strokeStyle = colors[edge.type] || "#2d3748";
-    ctx.globalAlpha = edge.type === "membership" ? 0.4 : 0.6;
-    ctx.lineWidth = 1.1;
-    ctx.moveTo(edge.sourceNode.x, edge.sourceNode.y);
-    ctx.lineTo(edge.targetNode.x, edge.targetNode.y);
-    ctx.stroke();
-  });
+function createRenderer() {
+  if (renderer) {
+    renderer.destroy();
+  }
+  renderer = null;
+  if (glCanvas && nodes.length >= WEBGL_NODE_THRESHOLD) {
+    renderer = createWebGLRenderer(glCanvas, currentScene());
+  }
+  if (glCanvas) {
+    glCanvas.hidden = !renderer;
+  }
+  renderer = renderer || createCanvasRenderer(ctx);
+}
 
-  ctx.globalAlpha = 1;
-
-  nodes.forEach((node) => {
-    ctx.beginPath();
-    const isSelected = selectedNode && selectedNode.id === node.id;
-    const isHovered = hoveredNode && hoveredNode.id === node.id;
-    const color = isSelected || isHovered ? colors.highlight : colors[node.type] || colors.user;
-    const radius = isSelected || isHovered ? node.size + 3 : node.size;
-    ctx.fillStyle = color;
-    ctx.shadowColor = color;
-    ctx.shadowBlur = isSelected || isHovered ? 12 : 6;
-    ctx.arc(node.x, node.y, radius, 0, Math.PI * 2);
-    ctx.fill();
-    ctx.shadowBlur = 0;
-
-    if (isSelected || isHovered) {
-      ctx.fillStyle = "#e6edf3";
-      ctx.font = "12px 'Space Grotesk', sans-serif";
-      ctx.fillText(node.label, node.x + radius + 6, node.y - radius - 2);
-    }
-  });
+function currentScene() {
+  return {
+    positions,
+    positionsVersion,
+    nodes,
+    nodeIndex,
+    edgeSources,
+    edgeTargets,
+    edgesByType,
+    edgeTypeNames,
+    visibleTypes,
+    highlighted: [...new Set([selectedNode, hoveredNode])].filter(Boolean),
+    scale,
+    offsetX,
+    offsetY,
+    width: canvas.clientWidth,
+    height: canvas.clientHeight,
+    isStatic: isLayoutStatic(),
+  };
+}
+
+function draw() {
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  if (!renderer) {
+    return;
+  }
+  const scene = currentScene();
+  renderer.draw(scene);
+  drawHighlights(ctx, scene);
+}
 
-  ctx.restore();
+// Draws on the next animation frame, at most once per frame. Nothing is drawn
+// while the view and the layout stand still.
+function requestDraw() {
+  if (!drawScheduled) {
+    drawScheduled = true;
+    requestAnimationFrame(frame);
+  }
 }
 
 function frame() {
-  applyForces();
+  drawScheduled = false;
+  if (layout && !isLayoutSettled(layout)) {
+    stepLayout(layout);
+    positionsVersion += 1;
+    requestDraw();
+  }
   draw();
-  requestAnimationFrame(frame);
 }
 
 function toGraphCoords(clientX, clientY) {
@@ -181,8 +281,8 @@ function toGraphCoords(clientX, clientY) {
 function findNodeAt(x, y) {
   for (let i = nodes.length - 1; i >= 0; i -= 1) {
     const node = nodes[i];
-    const dx = node.x - x;
-    const dy = node.y - y;
+    const dx = positions[i * 2] - x;
+    const dy = positions[i * 2 + 1] - y;
     if (Math.sqrt(dx * dx + dy * dy) <= node.size + 4) {
       return node;
     }
@@ -197,7 +297,11 @@ canvas.addEventListener("mousedown", (event) => {
 
 canvas.addEventListener("mousemove", (event) => {
   const coords = toGraphCoords(event.clientX, event.clientY);
+  const previousHoveredNode = hoveredNode;
   hoveredNode = findNodeAt(coords.x, coords.y);
+  if (hoveredNode !== previousHoveredNode) {
+    requestDraw();
+  }
 
   if (!isPanning) {
     return;
@@ -207,17 +311,22 @@ canvas.addEventListener("mousemove", (event) => {
   offsetX += dx;
   offsetY += dy;
   lastPan = { x: event.clientX, y: event.clientY };
+  requestDraw();
 });
 
 canvas.addEventListener("mouseup", (event) => {
   isPanning = false;
   const coords = toGraphCoords(event.clientX, event.clientY);
   selectedNode = findNodeAt(coords.x, coords.y);
+  requestDraw();
 });
 
 canvas.addEventListener("mouseleave", () => {
   isPanning = false;
-  hoveredNode = null;
+  if (hoveredNode) {
+    hoveredNode = null;
+    requestDraw();
+  }
 });
 
 canvas.addEventListener("wheel", (event) => {
@@ -225,27 +334,47 @@ canvas.addEventListener("wheel", (event) => {
   const delta = Math.sign(event.deltaY) * -0.08;
   const newScale = Math.min(2.5, Math.max(0.3, scale + delta));
   scale = newScale;
+  requestDraw();
 });
 
+toggles.forEach((toggle) => toggle.addEventListener("change", updateLayoutVisibility));
+
 searchInput.addEventListener("input", (event) => {
   const query = event.target.value.trim().toLowerCase();
-  if (!query) {
-    selectedNode = null;
-    return;
-  }
-  selectedNode = nodes.find((node) => node.label.toLowerCase().includes(query)) || null;
+  selectedNode = query
+    ? nodes.find((node) => node.label.toLowerCase().includes(query)) || null
+    : null;
+  requestDraw();
 });
 
 function updateStatus(text) {
   statusEl.textContent = text;
 }
 
+function graphSummary() {
+  return `${graph.nodes.length} nodes, ${graph.edges.length} edges`;
+}
+
 function initGraph(data) {
   graph = data;
   buildSimulation(graph);
+  startLayout();
   resize();
-  updateStatus(`${graph.nodes.length} nodes, ${graph.edges.length} edges`);
-  frame();
+  createRenderer();
+  updateStatus(graphSummary());
+  requestDraw();
+  if (graph.layout_pending) {
+    loadPrecomputedLayout().catch(handleError);
+  }
+}
+
+async function loadPrecomputedLayout() {
+  updateStatus(`${graphSummary()}, computing layout...`);
+  const laidOut = await window.pywebview.api.get_layout();
+  if (laidOut) {
+    applyLayout(laidOut);
+  }
+  updateStatus(graphSummary());
 }
 
 async function loadGraph() {
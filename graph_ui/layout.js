@@ -0,0 +1,398 @@
+// Force-directed layout shared by the layout worker and the main-thread fallback.
+// Positions and velocities are interleaved x, y pairs in Float32Arrays.
+// Every node has a heat that scales how far it may move in a step. Heat cools
+// off after each step, and once every node is cold the layout stops until a
+// change to the graph heats the nodes it affects again.
+
+const layoutSettings = {
+  repulsion: 2800,
+  springLength: 120,
+  springStrength: 0.008,
+  damping: 0.85,
+  maxVelocity: 6,
+  // Barnes-Hut opening angle: 0 is exact pairwise repulsion, larger is faster and coarser.
+  theta: 0.9,
+  // Cooling rate per step while the mean squared velocity of the moving nodes is
+  // above coolingEnergy, and once it is below.
+  coolingEnergy: 1,
+  slowCooling: 0.995,
+  fastCooling: 0.95,
+  // Heat below which a node stops moving.
+  minHeat: 0.01,
+  // Heat of the nodes a change to the graph disturbs.
+  disturbanceHeat: 0.5,
+};
+
+// Cells at this depth hold every further body as a list instead of splitting.
+const QUADTREE_MAX_DEPTH = 24;
+
+const quadtree = {
+  capacity: 0,
+  cellCount: 0,
+  children: new Int32Array(0),
+  firstBody: new Int32Array(0),
+  mass: new Float64Array(0),
+  massX: new Float64Array(0),
+  massY: new Float64Array(0),
+  size: new Float64Array(0),
+  centerX: new Float64Array(0),
+  centerY: new Float64Array(0),
+  nextBody: new Int32Array(0),
+  bodyX: new Float64Array(0),
+  bodyY: new Float64Array(0),
+  stack: new Int32Array(4 * (QUADTREE_MAX_DEPTH + 1)),
+};
+
+function resizeQuadtreeCells(capacity) {
+  const grow = (array, ArrayType, width = 1) => {
+    const grown = new ArrayType(capacity * width);
+    grown.set(array.subarray(0, quadtree.cellCount * width));
+    return grown;
+  };
+  quadtree.children = grow(quadtree.children, Int32Array, 4);
+  quadtree.firstBody = grow(quadtree.firstBody, Int32Array);
+  quadtree.mass = grow(quadtree.mass, Float64Array);
+  quadtree.massX = grow(quadtree.massX, Float64Array);
+  quadtree.massY = grow(quadtree.massY, Float64Array);
+  quadtree.size = grow(quadtree.size, Float64Array);
+  quadtree.centerX = grow(quadtree.centerX, Float64Array);
+  quadtree.centerY = grow(quadtree.centerY, Float64Array);
+  quadtree.capacity = capacity;
+}
+
+function addQuadtreeCell(centerX, centerY, size) {
+  if (quadtree.cellCount === quadtree.capacity) {
+    resizeQuadtreeCells(Math.max(64, quadtree.capacity * 2));
+  }
+  const cell = quadtree.cellCount;
+  quadtree.cellCount += 1;
+  quadtree.children.fill(-1, cell * 4, cell * 4 + 4);
+  quadtree.firstBody[cell] = -1;
+  quadtree.centerX[cell] = centerX;
+  quadtree.centerY[cell] = centerY;
+  quadtree.size[cell] = size;
+  return cell;
+}
+
+function addQuadtreeChild(cell, quadrant) {
+  const quarter = quadtree.size[cell] / 4;
+  const child = addQuadtreeCell(
+    quadtree.centerX[cell] + (quadrant & 1 ? quarter : -quarter),
+    quadtree.centerY[cell] + (quadrant & 2 ? quarter : -quarter),
+    quadtree.size[cell] / 2
+  );
+  quadtree.children[cell * 4 + quadrant] = child;
+  return child;
+}
+
+function quadrantOf(cell, body) {
+  return (
+    (quadtree.bodyX[body] >= quadtree.centerX[cell] ? 1 : 0) +
+    (quadtree.bodyY[body] >= quadtree.centerY[cell] ? 2 : 0)
+  );
+}
+
+function isQuadtreeLeaf(cell) {
+  const base = cell * 4;
+  return (
+    quadtree.children[base] < 0 &&
+    quadtree.children[base + 1] < 0 &&
+    quadtree.children[base + 2] < 0 &&
+    quadtree.children[base + 3] < 0
+  );
+}
+
+function insertQuadtreeBody(body) {
+  let cell = 0;
+  for (let depth = 0; ; depth += 1) {
+    if (isQuadtreeLeaf(cell)) {
+      if (quadtree.firstBody[cell] < 0 || depth >= QUADTREE_MAX_DEPTH) {
+        quadtree.nextBody[body] = quadtree.firstBody[cell];
+        quadtree.firstBody[cell] = body;
+        return;
+      }
+      // Split the leaf by moving its single body one level down.
+      const resident = quadtree.firstBody[cell];
+      quadtree.firstBody[cell] = -1;
+      const residentCell = addQuadtreeChild(cell, quadrantOf(cell, resident));
+      quadtree.firstBody[residentCell] = resident;
+      quadtree.nextBody[resident] = -1;
+    }
+    const quadrant = quadrantOf(cell, body);
+    const child = quadtree.children[cell * 4 + quadrant];
+    cell = child >= 0 ? child : addQuadtreeChild(cell, quadrant);
+  }
+}
+
+function buildQuadtree(positions) {
+  const bodyCount = positions.length / 2;
+  if (quadtree.bodyX.length < bodyCount) {
+    quadtree.nextBody = new Int32Array(bodyCount);
+    quadtree.bodyX = new Float64Array(bodyCount);
+    quadtree.bodyY = new Float64Array(bodyCount);
+  }
+  let minX = Infinity;
+  let minY = Infinity;
+  let maxX = -Infinity;
+  let maxY = -Infinity;
+  for (let i = 0; i < bodyCount; i += 1) {
+    const x = positions[i * 2];
+    const y = positions[i * 2 + 1];
+    quadtree.bodyX[i] = x;
+    quadtree.bodyY[i] = y;
+    minX = Math.min(minX, x);
+    minY = Math.min(minY, y);
+    maxX = Math.max(maxX, x);
+    maxY = Math.max(maxY, y);
+  }
+
+  quadtree.cellCount = 0;
+  addQuadtreeCell((minX + maxX) / 2, (minY + maxY) / 2, Math.max(maxX - minX, maxY - minY, 1) + 1);
+  for (let i = 0; i < bodyCount; i += 1) {
+    insertQuadtreeBody(i);
+  }
+
+  // Children are always added after their parent, so a reverse pass sees them first.
+  for (let cell = quadtree.cellCount - 1; cell >= 0; cell -= 1) {
+    let mass = 0;
+    let massX = 0;
+    let massY = 0;
+    if (quadtree.firstBody[cell] >= 0) {
+      for (let body = quadtree.firstBody[cell]; body >= 0; body = quadtree.nextBody[body]) {
+        mass += 1;
+        massX += quadtree.bodyX[body];
+        massY += quadtree.bodyY[body];
+      }
+    } else {
+      for (let quadrant = 0; quadrant < 4; quadrant += 1) {
+        const child = quadtree.children[cell * 4 + quadrant];
+        if (child >= 0) {
+          mass += quadtree.mass[child];
+          massX += quadtree.massX[child] * quadtree.mass[child];
+          massY += quadtree.massY[child] * quadtree.mass[child];
+        }
+      }
+    }
+    quadtree.mass[cell] = mass;
+    quadtree.massX[cell] = mass ? massX / mass : 0;
+    quadtree.massY[cell] = mass ? massY / mass : 0;
+  }
+}
+
+function applyRepulsion(velocities, body) {
+  const { bodyX, bodyY, children, firstBody, nextBody, mass, massX, massY, size, stack } = quadtree;
+  const { repulsion } = layoutSettings;
+  const thetaSq = layoutSettings.theta * layoutSettings.theta;
+  const x = bodyX[body];
+  const y = bodyY[body];
+  let vx = 0;
+  let vy = 0;
+  let stackSize = 0;
+  stack[stackSize++] = 0;
+  while (stackSize > 0) {
+    const cell = stack[--stackSize];
+    if (mass[cell] === 0) {
+      continue;
+    }
+    // Only leaves hold bodies.
+    if (firstBody[cell] >= 0) {
+      for (let other = firstBody[cell]; other >= 0; other = nextBody[other]) {
+        if (other === body) {
+          continue;
+        }
+        const dx = x - bodyX[other];
+        const dy = y - bodyY[other];
+        const distanceSq = dx * dx + dy * dy + 0.01;
+        const distance = Math.sqrt(distanceSq);
+        const force = repulsion / distanceSq;
+        vx += (dx / distance) * force;
+        vy += (dy / distance) * force;
+      }
+      continue;
+    }
+    const dx = x - massX[cell];
+    const dy = y - massY[cell];
+    const distanceSq = dx * dx + dy * dy + 0.01;
+    if (size[cell] * size[cell] < thetaSq * distanceSq) {
+      // Far enough away to treat the whole cell as one body at its center of mass.
+      const distance = Math.sqrt(distanceSq);
+      const force = (repulsion * mass[cell]) / distanceSq;
+      vx += (dx / distance) * force;
+      vy += (dy / distance) * force;
+      continue;
+    }
+    for (let child = cell * 4; child < cell * 4 + 4; child += 1) {
+      if (children[child] >= 0) {
+        stack[stackSize++] = children[child];
+      }
+    }
+  }
+  velocities[body * 2] += vx;
+  velocities[body * 2 + 1] += vy;
+}
+
+function createLayout(positions, edgeSources, edgeTargets, edgeTypes, visibleEdgeTypes, heat = 1) {
+  const bodyCount = positions.length / 2;
+  return {
+    positions,
+    velocities: new Float32Array(positions.length),
+    heat: new Float32Array(bodyCount).fill(heat),
+    hotCount: heat > 0 ? bodyCount : 0,
+    energy: 0,
+    edgeSources,
+    edgeTargets,
+    edgeTypes,
+    visibleEdgeTypes,
+  };
+}
+
+function isLayoutSettled(layout) {
+  return layout.hotCount === 0;
+}
+
+function heatLayoutNode(layout, body, heat) {
+  if (layout.heat[body] === 0) {
+    layout.hotCount += 1;
+  }
+  layout.heat[body] = Math.max(layout.heat[body], heat);
+}
+
+// Shows or hides edge types, restarting the layout around the edges that changed.
+function setLayoutEdgeVisibility(layout, visibleEdgeTypes) {
+  const { edgeSources, edgeTargets, edgeTypes } = layout;
+  const previous = layout.visibleEdgeTypes;
+  layout.visibleEdgeTypes = visibleEdgeTypes;
+  for (let edge = 0; edge < edgeSources.length; edge += 1) {
+    const type = edgeTypes[edge];
+    if (Boolean(previous[type]) !== Boolean(visibleEdgeTypes[type])) {
+      heatLayoutNode(layout, edgeSources[edge], layoutSettings.disturbanceHeat);
+      heatLayoutNode(layout, edgeTargets[edge], layoutSettings.disturbanceHeat);
+    }
+  }
+}
+
+function stepLayout(layout) {
+  const { positions, velocities, heat, edgeSources, edgeTargets, edgeTypes, visibleEdgeTypes } =
+    layout;
+  const { springLength, springStrength, damping, maxVelocity, minHeat } = layoutSettings;
+  const bodyCount = positions.length / 2;
+
+  // Cold nodes still repel the others, they just do not move.
+  buildQuadtree(positions);
+  for (let i = 0; i < bodyCount; i += 1) {
+    if (heat[i] > 0) {
+      applyRepulsion(velocities, i);
+    }
+  }
+
+  for (let edge = 0; edge < edgeSources.length; edge += 1) {
+    if (!visibleEdgeTypes[edgeTypes[edge]]) {
+      continue;
+    }
+    const source = edgeSources[edge] * 2;
+    const target = edgeTargets[edge] * 2;
+    const dx = positions[target] - positions[source];
+    const dy = positions[target + 1] - positions[source + 1];
+    const distance = Math.sqrt(dx * dx + dy * dy) || 1;
+    const force = (distance - springLength) * springStrength;
+    const fx = (dx / distance) * force;
+    const fy = (dy / distance) * force;
+    velocities[source] += fx;
+    velocities[source + 1] += fy;
+    velocities[target] -= fx;
+    velocities[target + 1] -= fy;
+  }
+
+  let energy = 0;
+  let movingCount = 0;
+  for (let i = 0; i < bodyCount; i += 1) {
+    const x = i * 2;
+    const y = x + 1;
+    if (heat[i] === 0) {
+      velocities[x] = 0;
+      velocities[y] = 0;
+      continue;
+    }
+    const limit = maxVelocity * heat[i];
+    const vx = Math.max(-limit, Math.min(limit, velocities[x] * damping));
+    const vy = Math.max(-limit, Math.min(limit, velocities[y] * damping));
+    velocities[x] = vx;
+    velocities[y] = vy;
+    positions[x] += vx;
+    positions[y] += vy;
+    energy += vx * vx + vy * vy;
+    movingCount += 1;
+  }
+
+  // Cool slowly while the moving nodes still have a lot of kinetic energy, then quickly.
+  layout.energy = movingCount ? energy / movingCount : 0;
+  const cooling =
+    layout.energy > layoutSettings.coolingEnergy
+      ? layoutSettings.slowCooling
+      : layoutSettings.fastCooling;
+  let hotCount = 0;
+  for (let i = 0; i < bodyCount; i += 1) {
+    if (heat[i] === 0) {
+      continue;
+    }
+    heat[i] = heat[i] * cooling < minHeat ? 0 : heat[i] * cooling;
+    hotCount += heat[i] > 0 ? 1 : 0;
+  }
+  layout.hotCount = hotCount;
+}
+
+// Worker side: steps the layout and posts positions back in two buffers that
+// the page returns once it has moved on to the newer one.
+if (typeof WorkerGlobalScope !== "undefined" && self instanceof WorkerGlobalScope) {
+  let layout = null;
+  let freeBuffers = [];
+  let tickScheduled = false;
+
+  const scheduleTick = () => {
+    if (!tickScheduled && layout && freeBuffers.length && !isLayoutSettled(layout)) {
+      tickScheduled = true;
+      setTimeout(tick, 0);
+    }
+  };
+
+  const tick = () => {
+    tickScheduled = false;
+    if (!layout || !freeBuffers.length || isLayoutSettled(layout)) {
+      return;
+    }
+    stepLayout(layout);
+    const buffer = freeBuffers.pop();
+    buffer.set(layout.positions);
+    self.postMessage(
+      { type: "positions", positions: buffer, settled: isLayoutSettled(layout) },
+      [buffer.buffer]
+    );
+    scheduleTick();
+  };
+
+  self.onmessage = (event) => {
+    const message = event.data;
+    if (message.type === "init") {
+      Object.assign(layoutSettings, message.settings);
+      layout = createLayout(
+        message.positions,
+        message.edgeSources,
+        message.edgeTargets,
+        message.edgeTypes,
+        message.visibleEdgeTypes,
+        message.heat
+      );
+      freeBuffers = [
+        new Float32Array(message.positions.length),
+        new Float32Array(message.positions.length),
+      ];
+    } else if (message.type === "visibility" && layout) {
+      setLayoutEdgeVisibility(layout, message.visibleEdgeTypes);
+    } else if (message.type === "buffer" && layout) {
+      if (message.positions.length === layout.positions.length) {
+        freeBuffers.push(message.positions);
+      }
+    }
+    scheduleTick();
+  };
+}
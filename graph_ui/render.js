@@ -0,0 +1,402 @@
+// Graph renderers. The Canvas2D renderer strokes all edges of one type as a
+// single path, stamps nodes from cached sprites, and once the layout is at rest
+// redraws from a cached layer. The WebGL renderer draws very large graphs on a
+// canvas under the 2D one. Either way, highlights and labels are drawn on top
+// of the 2D canvas by drawHighlights.
+
+// Graphs with at least this many nodes are drawn with WebGL when it is available.
+const WEBGL_NODE_THRESHOLD = 20000;
+// Sprite pixels per canvas pixel, so that nodes stay sharp when zoomed in.
+const SPRITE_RESOLUTION = 2;
+const NODE_GLOW = 6;
+const HIGHLIGHT_GLOW = 12;
+
+const edgeStyles = {
+  membership: { alpha: 0.4 },
+  default: { alpha: 0.6 },
+};
+
+function edgeStyle(edgeType) {
+  return {
+    color: colors[edgeType] || "#2d3748",
+    alpha: (edgeStyles[edgeType] || edgeStyles.default).alpha,
+  };
+}
+
+function nodeColor(node) {
+  return colors[node.type] || colors.user;
+}
+
+// Edge indices grouped by edge type index, so each type can be drawn in one batch.
+function groupEdgesByType(edgeTypes, typeCount) {
+  const counts = new Int32Array(typeCount);
+  edgeTypes.forEach((type) => {
+    counts[type] += 1;
+  });
+  const groups = Array.from(counts, (count) => new Int32Array(count));
+  const filled = new Int32Array(typeCount);
+  edgeTypes.forEach((type, edge) => {
+    groups[type][filled[type]] = edge;
+    filled[type] += 1;
+  });
+  return groups;
+}
+
+const nodeSprites = new Map();
+
+// A pre-rendered disc with its glow, which is far cheaper to stamp than shadowBlur.
+function getNodeSprite(color, radius, glow) {
+  const pixelRatio = window.devicePixelRatio * SPRITE_RESOLUTION;
+  const key = `${color}:${radius}:${glow}:${pixelRatio}`;
+  let sprite = nodeSprites.get(key);
+  if (!sprite) {
+    const extent = radius + glow;
+    sprite = document.createElement("canvas");
+    sprite.width = Math.ceil(extent * 2 * pixelRatio);
+    sprite.height = sprite.width;
+    const spriteCtx = sprite.getContext("2d");
+    spriteCtx.scale(pixelRatio, pixelRatio);
+    spriteCtx.fillStyle = color;
+    spriteCtx.shadowColor = color;
+    spriteCtx.shadowBlur = glow * pixelRatio;
+    spriteCtx.beginPath();
+    spriteCtx.arc(extent, extent, radius, 0, Math.PI * 2);
+    spriteCtx.fill();
+    sprite.extent = extent;
+    nodeSprites.set(key, sprite);
+  }
+  return sprite;
+}
+
+function drawNodeSprite(context, sprite, x, y) {
+  const { extent } = sprite;
+  context.drawImage(sprite, x - extent, y - extent, extent * 2, extent * 2);
+}
+
+function applyView(context, scene) {
+  context.translate(scene.offsetX, scene.offsetY);
+  context.scale(scene.scale, scene.scale);
+}
+
+function drawEdges(context, scene) {
+  const { positions, edgeSources, edgeTargets, edgesByType, edgeTypeNames, visibleTypes } = scene;
+  context.lineWidth = 1.1;
+  edgesByType.forEach((edges, type) => {
+    if (!visibleTypes[type] || !edges.length) {
+      return;
+    }
+    const style = edgeStyle(edgeTypeNames[type]);
+    context.beginPath();
+    for (let i = 0; i < edges.length; i += 1) {
+      const source = edgeSources[edges[i]] * 2;
+      const target = edgeTargets[edges[i]] * 2;
+      context.moveTo(positions[source], positions[source + 1]);
+      context.lineTo(positions[target], positions[target + 1]);
+    }
+    context.strokeStyle = style.color;
+    context.globalAlpha = style.alpha;
+    context.stroke();
+  });
+  context.globalAlpha = 1;
+}
+
+function drawNodes(context, scene) {
+  const { positions, nodes } = scene;
+  for (let i = 0; i < nodes.length; i += 1) {
+    const node = nodes[i];
+    drawNodeSprite(
+      context,
+      getNodeSprite(nodeColor(node), node.size, NODE_GLOW),
+      positions[i * 2],
+      positions[i * 2 + 1]
+    );
+  }
+}
+
+// Selected and hovered nodes with their labels, drawn over the rest of the graph.
+function drawHighlights(context, scene) {
+  const { positions, nodes, highlighted } = scene;
+  context.save();
+  applyView(context, scene);
+  context.fillStyle = "#e6edf3";
+  context.font = "12px 'Space Grotesk', sans-serif";
+  highlighted.forEach((node) => {
+    const i = scene.nodeIndex.get(node.id);
+    if (i === undefined) {
+      return;
+    }
+    const x = positions[i * 2];
+    const y = positions[i * 2 + 1];
+    const radius = node.size + 3;
+    drawNodeSprite(context, getNodeSprite(colors.highlight, radius, HIGHLIGHT_GLOW), x, y);
+    context.fillText(node.label, x + radius + 6, y - radius - 2);
+  });
+  context.restore();
+}
+
+// Everything but the highlights depends only on these, so an unchanged key means
+// a cached drawing of the graph is still up to date.
+function sceneKey(scene) {
+  return [
+    scene.positionsVersion,
+    scene.scale,
+    scene.offsetX,
+    scene.offsetY,
+    scene.width,
+    scene.height,
+    window.devicePixelRatio,
+    scene.visibleTypes.join(),
+  ].join(":");
+}
+
+function createCanvasRenderer(context) {
+  const layer = document.createElement("canvas");
+  const layerCtx = layer.getContext("2d");
+  let layerKey = null;
+
+  const drawGraph = (target, scene) => {
+    target.save();
+    applyView(target, scene);
+    drawEdges(target, scene);
+    drawNodes(target, scene);
+    target.restore();
+  };
+
+  return {
+    draw(scene) {
+      if (!scene.isStatic) {
+        layerKey = null;
+        drawGraph(context, scene);
+        return;
+      }
+      // Once the layout is at rest, hovering and selecting only redraw the highlights.
+      const key = sceneKey(scene);
+      if (key !== layerKey) {
+        layer.width = context.canvas.width;
+        layer.height = context.canvas.height;
+        layerCtx.setTransform(window.devicePixelRatio, 0, 0, window.devicePixelRatio, 0, 0);
+        drawGraph(layerCtx, scene);
+        layerKey = key;
+      }
+      context.save();
+      context.setTransform(1, 0, 0, 1, 0, 0);
+      context.drawImage(layer, 0, 0);
+      context.restore();
+    },
+    destroy() {},
+  };
+}
+
+const EDGE_VERTEX_SHADER = `#version 300 es
+in vec2 position;
+uniform float scale;
+uniform vec2 offset;
+uniform vec2 viewSize;
+void main() {
+  vec2 clip = (position * scale + offset) / viewSize * 2.0 - 1.0;
+  gl_Position = vec4(clip.x, -clip.y, 0.0, 1.0);
+}`;
+
+const EDGE_FRAGMENT_SHADER = `#version 300 es
+precision mediump float;
+uniform vec4 color;
+out vec4 fragColor;
+void main() {
+  fragColor = color;
+}`;
+
+const NODE_VERTEX_SHADER = `#version 300 es
+in vec2 position;
+in float radius;
+in vec3 color;
+uniform float scale;
+uniform vec2 offset;
+uniform vec2 viewSize;
+uniform float pixelRatio;
+uniform float glow;
+out vec3 nodeColor;
+out float extent;
+out float nodeRadius;
+void main() {
+  vec2 clip = (position * scale + offset) / viewSize * 2.0 - 1.0;
+  gl_Position = vec4(clip.x, -clip.y, 0.0, 1.0);
+  nodeColor = color;
+  nodeRadius = radius;
+  extent = radius + glow;
+  gl_PointSize = extent * 2.0 * scale * pixelRatio;
+}`;
+
+const NODE_FRAGMENT_SHADER = `#version 300 es
+precision highp float;
+in vec3 nodeColor;
+in float extent;
+in float nodeRadius;
+uniform float glow;
+out vec4 fragColor;
+void main() {
+  float fromCenter = length(gl_PointCoord - 0.5) * 2.0 * extent;
+  float alpha = fromCenter <= nodeRadius ? 1.0 : 0.35 * (1.0 - (fromCenter - nodeRadius) / glow);
+  if (alpha <= 0.0) {
+    discard;
+  }
+  fragColor = vec4(nodeColor, alpha);
+}`;
+
+function parseColor(hex) {
+  const value = parseInt(hex.slice(1), 16);
+  return [((value >> 16) & 255) / 255, ((value >> 8) & 255) / 255, (value & 255) / 255];
+}
+
+function compileProgram(gl, vertexSource, fragmentSource) {
+  const program = gl.createProgram();
+  [
+    [gl.VERTEX_SHADER, vertexSource],
+    [gl.FRAGMENT_SHADER, fragmentSource],
+  ].forEach(([type, source]) => {
+    const shader = gl.createShader(type);
+    gl.shaderSource(shader, source);
+    gl.compileShader(shader);
+    if (!gl.getShaderParameter(shader, gl.COMPILE_STATUS)) {
+      throw new Error(gl.getShaderInfoLog(shader));
+    }
+    gl.attachShader(program, shader);
+  });
+  gl.linkProgram(program);
+  if (!gl.getProgramParameter(program, gl.LINK_STATUS)) {
+    throw new Error(gl.getProgramInfoLog(program));
+  }
+  return program;
+}
+
+function uniformsOf(gl, program, names) {
+  return Object.fromEntries(names.map((name) => [name, gl.getUniformLocation(program, name)]));
+}
+
+function bindAttribute(gl, program, name, buffer, size) {
+  const location = gl.getAttribLocation(program, name);
+  gl.bindBuffer(gl.ARRAY_BUFFER, buffer);
+  gl.enableVertexAttribArray(location);
+  gl.vertexAttribPointer(location, size, gl.FLOAT, false, 0, 0);
+}
+
+// Draws edges as GL lines and nodes as point sprites, straight from the shared
+// positions buffer. Returns null when WebGL2 is unavailable.
+function createWebGLRenderer(glCanvas, scene) {
+  const gl = glCanvas.getContext("webgl2", { antialias: true });
+  if (!gl) {
+    return null;
+  }
+  let edgeProgram;
+  let nodeProgram;
+  try {
+    edgeProgram = compileProgram(gl, EDGE_VERTEX_SHADER, EDGE_FRAGMENT_SHADER);
+    nodeProgram = compileProgram(gl, NODE_VERTEX_SHADER, NODE_FRAGMENT_SHADER);
+  } catch (error) {
+    return null;
+  }
+  const edgeUniforms = uniformsOf(gl, edgeProgram, ["scale", "offset", "viewSize", "color"]);
+  const nodeUniforms = uniformsOf(gl, nodeProgram, [
+    "scale",
+    "offset",
+    "viewSize",
+    "pixelRatio",
+    "glow",
+  ]);
+
+  const { nodes, edgeSources, edgeTargets, edgesByType } = scene;
+  const positionBuffer = gl.createBuffer();
+  const radiusBuffer = gl.createBuffer();
+  gl.bindBuffer(gl.ARRAY_BUFFER, radiusBuffer);
+  gl.bufferData(gl.ARRAY_BUFFER, Float32Array.from(nodes, (node) => node.size), gl.STATIC_DRAW);
+  const colorBuffer = gl.createBuffer();
+  const nodeColors = new Float32Array(nodes.length * 3);
+  nodes.forEach((node, i) => nodeColors.set(parseColor(nodeColor(node)), i * 3));
+  gl.bindBuffer(gl.ARRAY_BUFFER, colorBuffer);
+  gl.bufferData(gl.ARRAY_BUFFER, nodeColors, gl.STATIC_DRAW);
+
+  const edgeVao = gl.createVertexArray();
+  gl.bindVertexArray(edgeVao);
+  bindAttribute(gl, edgeProgram, "position", positionBuffer, 2);
+  const edgeIndexBuffers = edgesByType.map((edges) => {
+    const indices = new Uint32Array(edges.length * 2);
+    edges.forEach((edge, i) => {
+      indices[i * 2] = edgeSources[edge];
+      indices[i * 2 + 1] = edgeTargets[edge];
+    });
+    const buffer = gl.createBuffer();
+    gl.bindBuffer(gl.ELEMENT_ARRAY_BUFFER, buffer);
+    gl.bufferData(gl.ELEMENT_ARRAY_BUFFER, indices, gl.STATIC_DRAW);
+    return { buffer, count: indices.length };
+  });
+
+  const nodeVao = gl.createVertexArray();
+  gl.bindVertexArray(nodeVao);
+  bindAttribute(gl, nodeProgram, "position", positionBuffer, 2);
+  bindAttribute(gl, nodeProgram, "radius", radiusBuffer, 1);
+  bindAttribute(gl, nodeProgram, "color", colorBuffer, 3);
+  gl.bindVertexArray(null);
+
+  let uploadedVersion = null;
+  let drawnKey = null;
+
+  const setView = (uniforms, scene) => {
+    gl.uniform1f(uniforms.scale, scene.scale);
+    gl.uniform2f(uniforms.offset, scene.offsetX, scene.offsetY);
+    gl.uniform2f(uniforms.viewSize, scene.width, scene.height);
+  };
+
+  return {
+    draw(scene) {
+      // The GL canvas keeps showing its last frame, so only redraw when it changed.
+      const key = sceneKey(scene);
+      if (key === drawnKey) {
+        return;
+      }
+      drawnKey = key;
+      const width = Math.round(scene.width * window.devicePixelRatio);
+      const height = Math.round(scene.height * window.devicePixelRatio);
+      if (glCanvas.width !== width || glCanvas.height !== height) {
+        glCanvas.width = width;
+        glCanvas.height = height;
+      }
+      gl.viewport(0, 0, glCanvas.width, glCanvas.height);
+      gl.clearColor(0, 0, 0, 0);
+      gl.clear(gl.COLOR_BUFFER_BIT);
+      gl.enable(gl.BLEND);
+      gl.blendFunc(gl.SRC_ALPHA, gl.ONE_MINUS_SRC_ALPHA);
+      if (uploadedVersion !== scene.positionsVersion) {
+        gl.bindBuffer(gl.ARRAY_BUFFER, positionBuffer);
+        if (uploadedVersion === null) {
+          gl.bufferData(gl.ARRAY_BUFFER, scene.positions, gl.DYNAMIC_DRAW);
+        } else {
+          gl.bufferSubData(gl.ARRAY_BUFFER, 0, scene.positions);
+        }
+        uploadedVersion = scene.positionsVersion;
+      }
+
+      gl.useProgram(edgeProgram);
+      setView(edgeUniforms, scene);
+      gl.bindVertexArray(edgeVao);
+      edgeIndexBuffers.forEach(({ buffer, count }, type) => {
+        if (!scene.visibleTypes[type] || !count) {
+          return;
+        }
+        const style = edgeStyle(scene.edgeTypeNames[type]);
+        gl.uniform4f(edgeUniforms.color, ...parseColor(style.color), style.alpha);
+        gl.bindBuffer(gl.ELEMENT_ARRAY_BUFFER, buffer);
+        gl.drawElements(gl.LINES, count, gl.UNSIGNED_INT, 0);
+      });
+
+      gl.useProgram(nodeProgram);
+      setView(nodeUniforms, scene);
+      gl.uniform1f(nodeUniforms.pixelRatio, window.devicePixelRatio);
+      gl.uniform1f(nodeUniforms.glow, NODE_GLOW);
+      gl.bindVertexArray(nodeVao);
+      gl.drawArrays(gl.POINTS, 0, nodes.length);
+      gl.bindVertexArray(null);
+    },
+    destroy() {
+      gl.getExtension("WEBGL_lose_context")?.loseContext();
+    },
+  };
+}
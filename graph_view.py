@@ -1,11 +1,43 @@
 import argparse
+import hashlib
 import json
+import logging
 import os
+import threading
+import time
 from pathlib import Path
-
-import webview
+from typing import Optional
 
 from core import normalize_output_path
+from output_writer import atomic_output_file, find_server_info_file, read_server_info
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+GRAPH_LAYOUT_FILENAME = "graph_layout.json"
+GRAPH_LAYOUT_VERSION = 1
+# The same forces as graph_ui/layout.js, so the viewer's refinement keeps the layout.
+LAYOUT_REPULSION = 2800.0
+LAYOUT_SPRING_LENGTH = 120.0
+LAYOUT_SPRING_STRENGTH = 0.008
+LAYOUT_DAMPING = 0.85
+LAYOUT_ITERATIONS = 100
+LAYOUT_SEEDED_ITERATIONS = 40
+# Large graphs run fewer iterations, as many as fit in this many seconds, and
+# the viewer refines the rest.
+LAYOUT_TIME_BUDGET = 5.0
+LAYOUT_MIN_ITERATIONS = 10
+# Largest move of a node in one iteration, cooling down linearly over the iterations.
+LAYOUT_MAX_STEP = 40.0
+LAYOUT_SEEDED_MAX_STEP = 10.0
+LAYOUT_MIN_STEP = 1.0
+# Pairs per block when computing repulsion against every grid cell.
+LAYOUT_BLOCK_PAIRS = 2_000_000
+NEIGHBOUR_OFFSETS = [(offset_x, offset_y) for offset_x in (-1, 0, 1) for offset_y in (-1, 0, 1)]
+# Half of the neighbours, so that each pair of neighbouring cells is visited once.
+FORWARD_NEIGHBOUR_OFFSETS = [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
 
 
 def build_graph(server_info: dict) -> dict:
@@ -68,19 +100,288 @@ def build_graph(server_info: dict) -> dict:
     }
 
 
+def graph_hash(graph: dict) -> str:
+    """Hash the nodes and edges of a graph, independent of their order."""
+    content = [
+        sorted(node["id"] for node in graph["nodes"]),
+        sorted([edge["source"], edge["target"], edge["type"]] for edge in graph["edges"]),
+    ]
+    return hashlib.sha256(json.dumps(content, separators=(",", ":")).encode()).hexdigest()
+
+
+def _add_pair_forces(force_x, force_y, x, y, sources, targets) -> None:
+    """Add the repulsion of each pair to both of its nodes."""
+    dx = x[sources] - x[targets]
+    dy = y[sources] - y[targets]
+    distance_sq = dx * dx + dy * dy + 0.01
+    weight = 1 / (distance_sq * np.sqrt(distance_sq))
+    dx *= weight
+    dy *= weight
+    force_x += np.bincount(sources, dx, len(x)) - np.bincount(targets, dx, len(x))
+    force_y += np.bincount(sources, dy, len(y)) - np.bincount(targets, dy, len(y))
+
+
+def _repulsion(x, y) -> tuple:
+    """Approximate the pairwise repulsion of graph_ui/layout.js on a grid.
+
+    Nodes repel each other exactly within the 3x3 grid cells around them,
+    and every cell further away repels as one body at its center of mass.
+    With about ``sqrt(n)`` cells of ``sqrt(n)`` nodes both parts take
+    ``O(n ** 1.5)``.
+    """
+    node_count = len(x)
+    grid_size = max(1, round((9 * node_count) ** 0.25))
+    low_x = x.min()
+    low_y = y.min()
+    span = max(x.max() - low_x, y.max() - low_y, 1.0) * (1 + 1e-6)
+    cell_x = np.minimum(((x - low_x) * (grid_size / span)).astype(np.intp), grid_size - 1)
+    cell_y = np.minimum(((y - low_y) * (grid_size / span)).astype(np.intp), grid_size - 1)
+    cells = cell_x * grid_size + cell_y
+    cell_count = grid_size * grid_size
+    counts = np.bincount(cells, minlength=cell_count)
+    mass = counts.astype(float)
+    center_x = np.bincount(cells, x, cell_count) / np.maximum(mass, 1)
+    center_y = np.bincount(cells, y, cell_count) / np.maximum(mass, 1)
+
+    # Every node against the center of mass of every cell.
+    force_x = np.zeros(node_count)
+    force_y = np.zeros(node_count)
+    occupied = np.flatnonzero(counts)
+    block_size = max(1, LAYOUT_BLOCK_PAIRS // len(occupied))
+    for start in range(0, node_count, block_size):
+        stop = min(start + block_size, node_count)
+        dx = x[start:stop, None] - center_x[occupied]
+        dy = y[start:stop, None] - center_y[occupied]
+        distance_sq = dx * dx + dy * dy + 0.01
+        weight = mass[occupied] / (distance_sq * np.sqrt(distance_sq))
+        force_x[start:stop] = (dx * weight).sum(axis=1)
+        force_y[start:stop] = (dy * weight).sum(axis=1)
+
+    # Swap the neighbouring cells' centers of mass for their nodes, sorted by cell.
+    order = np.argsort(cells, kind="stable")
+    cell_starts = np.cumsum(counts) - counts
+    for offset_x, offset_y in NEIGHBOUR_OFFSETS:
+        neighbour_x = cell_x + offset_x
+        neighbour_y = cell_y + offset_y
+        sources = np.flatnonzero(
+            (neighbour_x >= 0)
+            & (neighbour_x < grid_size)
+            & (neighbour_y >= 0)
+            & (neighbour_y < grid_size)
+        )
+        neighbours = neighbour_x[sources] * grid_size + neighbour_y[sources]
+        dx = x[sources] - center_x[neighbours]
+        dy = y[sources] - center_y[neighbours]
+        distance_sq = dx * dx + dy * dy + 0.01
+        weight = mass[neighbours] / (distance_sq * np.sqrt(distance_sq))
+        force_x[sources] -= dx * weight
+        force_y[sources] -= dy * weight
+        if (offset_x, offset_y) not in FORWARD_NEIGHBOUR_OFFSETS:
+            continue
+
+        # Each pair of nodes once, its repulsion added to both.
+        pair_counts = counts[neighbours]
+        pair_starts = np.cumsum(pair_counts) - pair_counts
+        targets = order[
+            np.repeat(cell_starts[neighbours] - pair_starts, pair_counts)
+            + np.arange(pair_counts.sum())
+        ]
+        sources = np.repeat(sources, pair_counts)
+        if offset_x == offset_y == 0:
+            forward = sources < targets
+            sources, targets = sources[forward], targets[forward]
+        _add_pair_forces(force_x, force_y, x, y, sources, targets)
+    return force_x * LAYOUT_REPULSION, force_y * LAYOUT_REPULSION
+
+
+def compute_layout(
+    graph: dict,
+    previous_positions: Optional[dict] = None,
+    iterations: Optional[int] = None,
+    seed: int = 0,
+    time_budget: Optional[float] = None,
+) -> dict:
+    """Lay out a graph with the forces of graph_ui/layout.js, vectorized with NumPy.
+
+    Nodes in ``previous_positions`` start where they were, new nodes next to
+    their already placed neighbours, and fewer iterations are run by
+    default. With a ``time_budget`` in seconds, the iterations are cut down
+    to what the first one suggests fits in it. Returns node ID -> ``[x, y]``.
+    """
+    node_ids = [node["id"] for node in graph["nodes"]]
+    node_count = len(node_ids)
+    if not node_count:
+        return dict()
+    node_index = {node_id: idx for idx, node_id in enumerate(node_ids)}
+    edges = np.array(
+        sorted(
+            (node_index[edge["source"]], node_index[edge["target"]])
+            for edge in graph["edges"]
+            if edge["source"] in node_index and edge["target"] in node_index
+        ),
+        dtype=np.intp,
+    ).reshape(-1, 2)
+    sources, targets = edges[:, 0], edges[:, 1]
+
+    rng = np.random.default_rng(seed)
+    angles = rng.uniform(0, 2 * np.pi, node_count)
+    radii = rng.uniform(300, 400, node_count)
+    x = np.cos(angles) * radii
+    y = np.sin(angles) * radii
+    placed = np.zeros(node_count, dtype=bool)
+    for node_id, (node_x, node_y) in (previous_positions or dict()).items():
+        if node_id in node_index:
+            x[node_index[node_id]] = node_x
+            y[node_index[node_id]] = node_y
+            placed[node_index[node_id]] = True
+    if placed.any() and not placed.all() and len(edges):
+        both_ways = np.concatenate([edges, edges[:, ::-1]])
+        new, old = both_ways[placed[both_ways[:, 1]] & ~placed[both_ways[:, 0]]].T
+        neighbours = np.bincount(new, minlength=node_count)
+        near_placed = np.flatnonzero(neighbours)
+        for coordinates in (x, y):
+            sums = np.bincount(new, coordinates[old], node_count)
+            coordinates[near_placed] = sums[near_placed] / neighbours[near_placed] + rng.uniform(
+                -20, 20, len(near_placed)
+            )
+    if iterations is None:
+        iterations = LAYOUT_SEEDED_ITERATIONS if placed.any() else LAYOUT_ITERATIONS
+    start_step = LAYOUT_SEEDED_MAX_STEP if placed.any() else LAYOUT_MAX_STEP
+
+    velocity_x = np.zeros(node_count)
+    velocity_y = np.zeros(node_count)
+    started_at = time.perf_counter()
+    iteration = 0
+    while iteration < iterations:
+        force_x, force_y = _repulsion(x, y)
+        dx = x[targets] - x[sources]
+        dy = y[targets] - y[sources]
+        distance = np.sqrt(dx * dx + dy * dy)
+        distance[distance == 0] = 1
+        spring = (distance - LAYOUT_SPRING_LENGTH) * LAYOUT_SPRING_STRENGTH / distance
+        force_x += np.bincount(sources, dx * spring, node_count)
+        force_x -= np.bincount(targets, dx * spring, node_count)
+        force_y += np.bincount(sources, dy * spring, node_count)
+        force_y -= np.bincount(targets, dy * spring, node_count)
+        max_step = LAYOUT_MIN_STEP + (start_step - LAYOUT_MIN_STEP) * (1 - iteration / iterations)
+        velocity_x = np.clip((velocity_x + force_x) * LAYOUT_DAMPING, -max_step, max_step)
+        velocity_y = np.clip((velocity_y + force_y) * LAYOUT_DAMPING, -max_step, max_step)
+        x += velocity_x
+        y += velocity_y
+        if iteration == 0 and time_budget is not None:
+            fitting_iterations = int(time_budget / (time.perf_counter() - started_at))
+            iterations = min(iterations, max(LAYOUT_MIN_ITERATIONS, fitting_iterations))
+        iteration += 1
+    x -= x.mean()
+    y -= y.mean()
+    return {
+        node_id: [round(float(node_x), 1), round(float(node_y), 1)]
+        for node_id, node_x, node_y in zip(node_ids, x, y)
+    }
+
+
+def read_graph_layout(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get("version") != GRAPH_LAYOUT_VERSION:
+        return None
+    return cached
+
+
+def cached_graph_layout(graph: dict, output_path: str) -> Optional[dict]:
+    """Return the positions cached in ``graph_layout.json`` if they are for this graph."""
+    cached = read_graph_layout(os.path.join(output_path, GRAPH_LAYOUT_FILENAME))
+    if cached is None or cached.get("graph_hash") != graph_hash(graph):
+        return None
+    return cached["positions"]
+
+
+def layout_graph(graph: dict, output_path: str, time_budget: Optional[float] = None) -> dict:
+    """Compute the layout of a graph and cache it in ``graph_layout.json``.
+
+    The cache next to ``server_info`` is keyed by :func:`graph_hash`. When
+    the graph changed, the new layout starts from the cached one, so nodes
+    stay roughly where they were. Returns node ID -> ``[x, y]``.
+    """
+    path = os.path.join(output_path, GRAPH_LAYOUT_FILENAME)
+    cached = read_graph_layout(path)
+    started_at = time.perf_counter()
+    positions = compute_layout(graph, cached and cached.get("positions"), time_budget=time_budget)
+    logging.info("Laid out %s nodes in %.1fs", len(positions), time.perf_counter() - started_at)
+    with atomic_output_file(path, "none") as f:
+        json.dump(
+            {
+                "version": GRAPH_LAYOUT_VERSION,
+                "graph_hash": graph_hash(graph),
+                "positions": positions,
+            },
+            f,
+            separators=(",", ":"),
+        )
+    return positions
+
+
+def apply_graph_layout(graph: dict, positions: dict) -> dict:
+    """Set ``x`` and ``y`` of every node that has a position."""
+    for node in graph["nodes"]:
+        if node["id"] in positions:
+            node["x"], node["y"] = positions[node["id"]]
+    return graph
+
+
 class GraphApi:
-    def __init__(self, output_path: str) -> None:
+    """Methods the viewer calls through ``window.pywebview.api``.
+
+    ``get_graph`` returns right away. A cached layout comes with the graph,
+    otherwise ``layout_pending`` is set and the layout is computed in a
+    background thread until ``get_layout`` hands it over.
+    """
+
+    def __init__(self, output_path: str, precompute_layout: bool = True) -> None:
         self._output_path = output_path
+        self._precompute_layout = precompute_layout
+        self._layout: Optional[dict] = None
+        self._layout_ready = threading.Event()
+        # Nothing is pending until get_graph starts a layout.
+        self._layout_ready.set()
 
     def get_graph(self):
-        server_info_path = Path(self._output_path) / "server_info.json"
-        if not server_info_path.exists():
-            raise FileNotFoundError(
-                "server_info.json not found. Run the scanner first to generate output."
-            )
-        with server_info_path.open("r") as handle:
-            server_info = json.load(handle)
-        return build_graph(server_info)
+        server_info = read_server_info(find_server_info_file(self._output_path))
+        graph = build_graph(server_info)
+        graph["layout_pending"] = False
+        if not self._precompute_layout:
+            return graph
+        if np is None:
+            logging.warning("NumPy is not installed, the graph is laid out in the viewer instead")
+            return graph
+        positions = cached_graph_layout(graph, self._output_path)
+        if positions is not None:
+            return apply_graph_layout(graph, positions)
+        self._layout = None
+        self._layout_ready.clear()
+        graph["layout_pending"] = True
+        # Daemonic, so closing the viewer does not wait for the layout to finish.
+        threading.Thread(target=self._compute_layout, args=(graph,), daemon=True).start()
+        return graph
+
+    def _compute_layout(self, graph: dict) -> None:
+        try:
+            self._layout = layout_graph(graph, self._output_path, LAYOUT_TIME_BUDGET)
+        except Exception:
+            logging.exception("Failed to lay out the graph, the viewer lays it out instead")
+        finally:
+            self._layout_ready.set()
+
+    def get_layout(self):
+        """Wait for the layout started by ``get_graph`` and return node ID -> ``[x, y]``."""
+        self._layout_ready.wait()
+        return self._layout
+
+    def log_warning(self, message: str) -> None:
+        logging.warning("Graph viewer: %s", message)
 
 
 def parse_args() -> argparse.Namespace:
@@ -91,26 +392,54 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Output path that contains server_info.json (default: ./output)",
     )
+    parser.add_argument(
+        "--theta",
+        type=float,
+        default=None,
+        help=(
+            "Barnes-Hut opening angle of the layout. 0 computes exact repulsion, larger "
+            "values are faster and coarser (default: 0.9)"
+        ),
+    )
+    parser.add_argument(
+        "--no_layout",
+        dest="precompute_layout",
+        action="store_false",
+        help=(
+            "If set, the layout is not precomputed and cached in graph_layout.json, and the "
+            "viewer lays out the graph from random positions instead"
+        ),
+    )
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+    # Imported here so build_graph can be used without a GUI toolkit installed.
+    import webview
+
     output_path = normalize_output_path(args.output_path)
 
     html_path = Path(__file__).parent / "graph_ui" / "index.html"
     if not html_path.exists():
         raise FileNotFoundError("graph_ui/index.html not found.")
 
-    api = GraphApi(output_path)
+    # A local path is served by pywebview's HTTP server. Pages opened from a
+    # file:// URL cannot start the layout worker in Chromium based web views.
+    url = str(html_path.resolve())
+    if args.theta is not None:
+        url += f"?theta={args.theta}"
+
+    api = GraphApi(output_path, args.precompute_layout)
     webview.create_window(
         "Mutual Graph",
-        html_path.resolve().as_uri(),
+        url,
         js_api=api,
         width=1100,
         height=720,
     )
-    webview.start()
+    webview.start(http_server=True)
 
 
 if __name__ == "__main__":
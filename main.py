@@ -6,6 +6,13 @@ import sys
 from dotenv import load_dotenv
 
 from core import run_client
+from enumeration import ENUMERATION_STRATEGIES, parse_enumeration_overrides
+from metrics import DEFAULT_METRICS_INTERVAL
+from output_writer import OUTPUT_COMPRESSIONS, OUTPUT_FORMATS, check_compression_available
+from rate_limit import RATE_LIMIT_MODES, check_rate_limit_mode
+from scan_config import DEFAULT_PROFILE_CACHE_MAX_ENTRIES, DEFAULT_PROFILE_CACHE_TTL
+from scan_state import DEFAULT_DELTA_REFRESH_FRACTION
+from watch import DEFAULT_WATCH_INTERVAL
 from get_token import get_token
 
 
@@ -29,6 +36,26 @@ def check_nonnegative_float(original_value):
     return value
 
 
+def check_positive_int(original_value):
+    try:
+        value = int(original_value)
+        if value <= 0:
+            raise argparse.ArgumentTypeError(f"{original_value} is not a positive")
+    except ValueError:
+        raise Exception(f"{original_value} is not an int")
+    return value
+
+
+def check_fraction(original_value):
+    try:
+        value = float(original_value)
+        if value < 0 or value > 1:
+            raise argparse.ArgumentTypeError(f"{original_value} is not between 0 and 1")
+    except ValueError:
+        raise Exception(f"{original_value} is not a float")
+    return value
+
+
 def add_arguments(parser: argparse.ArgumentParser, output_path: str) -> None:
     parser.add_argument(
         "-s",
@@ -130,7 +157,10 @@ def add_arguments(parser: argparse.ArgumentParser, output_path: str) -> None:
         "--max_members",
         type=int,
         default=sys.maxsize,
-        help="Maximum number of members to process. Example --max_members 100, default=no limit",
+        help=(
+            "Maximum number of members to process per server. Member enumeration stops as "
+            "soon as this many members were found. Example --max_members 100, default=no limit"
+        ),
     )
 
     parser.add_argument(
@@ -157,6 +187,245 @@ def add_arguments(parser: argparse.ArgumentParser, output_path: str) -> None:
         ),
     )
 
+    parser.add_argument(
+        "--profile_cache_ttl",
+        type=check_nonnegative_float,
+        default=None,
+        help=(
+            "How long in seconds a cached member profile is reused before it is fetched "
+            "from Discord again. Cached mutual servers and mutual friends can be that old, "
+            "even when servers were joined or left since, so the cache is off unless this "
+            "is set or --delta is used. Use 0 to disable the profile cache. "
+            "Example --profile_cache_ttl 86400, "
+            f"default=0, or {DEFAULT_PROFILE_CACHE_TTL} with --delta"
+        ),
+    )
+
+    parser.add_argument(
+        "--profile_cache_max_entries",
+        type=int,
+        default=DEFAULT_PROFILE_CACHE_MAX_ENTRIES,
+        help=(
+            "Maximum number of member profiles kept in the profile cache. The least "
+            "recently used entries are evicted first. "
+            f"Example --profile_cache_max_entries 50000, default={DEFAULT_PROFILE_CACHE_MAX_ENTRIES}"
+        ),
+    )
+
+    parser.add_argument(
+        "--rate_limit_mode",
+        default="fixed",
+        choices=RATE_LIMIT_MODES,
+        help=(
+            "How profile requests are paced. fixed waits sleep_time between requests and "
+            "pauses for pause_duration every period_max_members members. adaptive follows "
+            "Discord's rate limit headers and Retry-After responses, speeding up to the "
+            "allowed rate and never going slower than one request per sleep_time; "
+            "period pauses are skipped. Needs discord.py-self 2.0 or 2.1, otherwise fixed "
+            "is used. Example --rate_limit_mode adaptive, default=fixed"
+        ),
+    )
+
+    parser.add_argument(
+        "--profile_concurrency",
+        type=check_positive_int,
+        default=1,
+        help=(
+            "Number of member profiles fetched concurrently. All workers share the same "
+            "rate limit budget, so this mostly hides request latency. "
+            "Example --profile_concurrency 4, default=1"
+        ),
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help=(
+            "If set, members of upcoming servers are enumerated over the gateway while "
+            "profiles of already enumerated servers are being fetched, instead of "
+            "handling one server at a time"
+        ),
+    )
+
+    parser.add_argument(
+        "--plan_scan",
+        action="store_true",
+        help=(
+            "If set, members of every selected server are enumerated first so each unique "
+            "user is fetched exactly once and the result is shared by every server they are "
+            "in. Takes precedence over --pipeline"
+        ),
+    )
+
+    parser.add_argument(
+        "--skip_mutual_friends",
+        action="store_true",
+        help=(
+            "If set, profiles are fetched without mutual friends and the mutual friends "
+            "output stays empty"
+        ),
+    )
+
+    parser.add_argument(
+        "--local_mutual_servers",
+        action="store_true",
+        help=(
+            "If set together with --skip_mutual_friends, every server you are in is "
+            "enumerated and mutual servers are computed from those member lists. A "
+            "profile is only fetched for members whose mutual servers cannot be derived "
+            "because some server could not be fully enumerated. Implies --plan_scan"
+        ),
+    )
+
+    parser.add_argument(
+        "--enumeration_strategy",
+        default="auto",
+        choices=ENUMERATION_STRATEGIES,
+        help=(
+            "How server members are enumerated. auto starts from the member cache and "
+            "then tries the cheapest method that works for each server, based on its size, "
+            "your permissions and timings recorded on earlier runs. all runs guild.members, "
+            "fetch_members and chunk() for every server. cached, fetch_members and chunk "
+            "use only that method. Example --enumeration_strategy all, default=auto"
+        ),
+    )
+
+    parser.add_argument(
+        "--enumeration_override",
+        default=[],
+        nargs="+",
+        help=(
+            "Per-server enumeration strategy as SERVER=STRATEGY pairs, overriding "
+            "--enumeration_strategy for those servers. Example --enumeration_override "
+            "'server 1=chunk' 'server2=all', default=''"
+        ),
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=(
+            "If set, replays the scan journal left in the output path by an interrupted "
+            "scan and continues from where it stopped instead of starting over. A journal "
+            "written with a different --skip_mutual_friends or --local_mutual_servers is "
+            "discarded"
+        ),
+    )
+
+    parser.add_argument(
+        "--top_k",
+        type=check_positive_int,
+        default=None,
+        help=(
+            "Only keep the top K members with the most mutual friends or mutual servers "
+            "per server in the output files. Example --top_k 50, default=no limit"
+        ),
+    )
+
+    parser.add_argument(
+        "--output_format",
+        choices=OUTPUT_FORMATS,
+        default="json",
+        help=(
+            "Format of the output files. json keeps one object per file, jsonl writes one "
+            "line per server member. Example --output_format jsonl, default=json"
+        ),
+    )
+
+    parser.add_argument(
+        "--output_compression",
+        choices=OUTPUT_COMPRESSIONS,
+        default="none",
+        help=(
+            "Compress the output files. zstd requires the zstandard package. "
+            "Example --output_compression gzip, default=none"
+        ),
+    )
+
+    parser.add_argument(
+        "--compact_output",
+        action="store_true",
+        help="If set, the output files are written without indentation",
+    )
+
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help=(
+            "If set, only profiles of members who joined a server since the previous scan "
+            "are fetched, plus the delta_refresh_fraction of cached profiles that are the "
+            "oldest. Members of servers joined or left since then are fetched again too. "
+            "Everyone else reuses their profile from the profile cache. Implies "
+            "--plan_scan, so the membership changes of every server are known before any "
+            "cached profile is reused"
+        ),
+    )
+
+    parser.add_argument(
+        "--delta_refresh_fraction",
+        type=check_fraction,
+        default=DEFAULT_DELTA_REFRESH_FRACTION,
+        help=(
+            "Share of cached profiles, oldest first, that a delta scan fetches again. "
+            f"Example --delta_refresh_fraction 0.2, default={DEFAULT_DELTA_REFRESH_FRACTION}"
+        ),
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "If set, stays connected after the scan and keeps the output up to date from "
+            "member join/leave, server join/leave and friend add/remove events"
+        ),
+    )
+
+    parser.add_argument(
+        "--watch_interval",
+        type=check_positive_float,
+        default=DEFAULT_WATCH_INTERVAL,
+        help=(
+            "Seconds to collect changes for before the output is rewritten in watch mode. "
+            f"Example --watch_interval 300, default={DEFAULT_WATCH_INTERVAL}"
+        ),
+    )
+
+    parser.add_argument(
+        "--metrics_interval",
+        type=check_nonnegative_float,
+        default=DEFAULT_METRICS_INTERVAL,
+        help=(
+            "Seconds between writes of metrics.json and metrics.prom during a scan. They are "
+            "always written when the scan ends. Use 0 to only write them at the end. "
+            f"Example --metrics_interval 30, default={DEFAULT_METRICS_INTERVAL}"
+        ),
+    )
+
+    parser.add_argument(
+        "--record",
+        default=None,
+        help=(
+            "Record the server list, member lists and profile responses of the scan to this "
+            "gzip-compressed fixture file, for offline replay. Disables the profile cache. "
+            "Example --record output/scan_fixture.jsonl.gz, default=None"
+        ),
+    )
+
+    parser.add_argument(
+        "--record_anonymize",
+        action="store_true",
+        help="If set, IDs and names in the --record fixture are replaced by placeholders",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "If set, the scan runs under cProfile and a stack sampler, and per-phase stats, "
+            "collapsed stacks and event loop lag are written to scan_profile in the output path"
+        ),
+    )
+
 
 def main() -> None:
     output_path = os.path.dirname(os.path.realpath(__file__)) + "/output/"
@@ -165,6 +434,15 @@ def main() -> None:
     parser = argparse.ArgumentParser()
     add_arguments(parser, output_path)
     args = parser.parse_args()
+    try:
+        enumeration_overrides = parse_enumeration_overrides(args.enumeration_override)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        check_compression_available(args.output_compression)
+        check_rate_limit_mode(args.rate_limit_mode, args.sleep_time)
+    except ValueError as e:
+        parser.error(str(e))
 
     if args.get_token:
         token = get_token()
@@ -190,6 +468,29 @@ def main() -> None:
         period_max_members=args.period_max_members,
         pause_duration=args.pause_duration,
         member_fetch_timeout=args.member_fetch_timeout,
+        profile_cache_ttl=args.profile_cache_ttl,
+        profile_cache_max_entries=args.profile_cache_max_entries,
+        resume=args.resume,
+        rate_limit_mode=args.rate_limit_mode,
+        profile_concurrency=args.profile_concurrency,
+        pipeline=args.pipeline,
+        plan_scan=args.plan_scan,
+        skip_mutual_friends=args.skip_mutual_friends,
+        local_mutual_servers=args.local_mutual_servers,
+        enumeration_strategy=args.enumeration_strategy,
+        enumeration_overrides=enumeration_overrides,
+        top_k=args.top_k,
+        output_format=args.output_format,
+        output_compression=args.output_compression,
+        compact_output=args.compact_output,
+        delta=args.delta,
+        delta_refresh_fraction=args.delta_refresh_fraction,
+        watch=args.watch,
+        watch_interval=args.watch_interval,
+        metrics_interval=args.metrics_interval,
+        record_path=args.record,
+        record_anonymize=args.record_anonymize,
+        profile=args.profile,
     )
 
 
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from output_writer import atomic_output_file
+
+METRICS_JSON_FILENAME = "metrics.json"
+METRICS_PROMETHEUS_FILENAME = "metrics.prom"
+DEFAULT_METRICS_INTERVAL = 60
+METRIC_PREFIX = "discord_scan"
+PROFILE_FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets: tuple) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list:
+        cumulative = []
+        total = 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def to_dict(self) -> dict:
+        bounds = [str(bucket) for bucket in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(bounds, self.cumulative_counts())),
+            "count": self.count,
+            "sum": round(self.sum, 6),
+        }
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+class ScanMetrics:
+    """Counters and timings collected while a scan runs.
+
+    Rate limit and profile cache figures are read from the limiter and cache
+    themselves whenever a snapshot is taken. Snapshots are written as
+    ``metrics.json`` and in the Prometheus text format as ``metrics.prom``.
+    """
+
+    def __init__(self, rate_limiter=None, profile_cache=None) -> None:
+        self.rate_limiter = rate_limiter
+        self.profile_cache = profile_cache
+        self.started_at = time.time()
+        self._started_monotonic = time.monotonic()
+        self.enumeration: dict = dict()
+        self.profile_fetch_seconds = Histogram(PROFILE_FETCH_BUCKETS)
+        self.profile_requests = {"ok": 0, "error": 0}
+        self.members_processed = 0
+        self.guilds_processed = 0
+
+    def record_enumeration(
+        self, guild_id: int, guild_name: str, method: str, seconds: float, members: int
+    ) -> None:
+        guild_entry = self.enumeration.setdefault(
+            guild_id, {"guild": guild_name, "methods": dict()}
+        )
+        guild_entry["methods"][method] = {"seconds": round(seconds, 3), "members": members}
+
+    def observe_profile_fetch(self, seconds: float, ok: bool) -> None:
+        self.profile_fetch_seconds.observe(seconds)
+        self.profile_requests["ok" if ok else "error"] += 1
+
+    def record_guild_done(self, member_count: int) -> None:
+        self.guilds_processed += 1
+        self.members_processed += member_count
+
+    def snapshot(self) -> dict:
+        elapsed = time.monotonic() - self._started_monotonic
+        return {
+            "started_at": self.started_at,
+            "elapsed_seconds": round(elapsed, 3),
+            "guilds_processed": self.guilds_processed,
+            "members_processed": self.members_processed,
+            "members_per_second": (
+                round(self.members_processed / elapsed, 3) if elapsed > 0 else 0.0
+            ),
+            "profile_requests": dict(self.profile_requests),
+            "profile_fetch_seconds": self.profile_fetch_seconds.to_dict(),
+            "rate_limited": getattr(self.rate_limiter, "rate_limited_count", 0),
+            "retry_after_seconds": round(getattr(self.rate_limiter, "total_retry_after", 0.0), 3),
+            "profile_cache": {
+                "hits": getattr(self.profile_cache, "hits", 0),
+                "misses": getattr(self.profile_cache, "misses", 0),
+            },
+            "enumeration": {str(guild_id): entry for guild_id, entry in self.enumeration.items()},
+        }
+
+    def to_prometheus(self, snapshot: Optional[dict] = None) -> str:
+        snapshot = snapshot or self.snapshot()
+        lines = []
+
+        def add_metric(name: str, metric_type: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {metric_type}")
+            for suffix, labels, value in samples:
+                lines.append(f"{METRIC_PREFIX}_{name}{suffix}{_format_labels(labels)} {value}")
+
+        add_metric(
+            "elapsed_seconds",
+            "gauge",
+            "Seconds since the scan started.",
+            [("", {}, snapshot["elapsed_seconds"])],
+        )
+        add_metric(
+            "guilds_processed_total",
+            "counter",
+            "Guilds whose results are complete.",
+            [("", {}, snapshot["guilds_processed"])],
+        )
+        add_metric(
+            "members_processed_total",
+            "counter",
+            "Members added to the results.",
+            [("", {}, snapshot["members_processed"])],
+        )
+        add_metric(
+            "members_per_second",
+            "gauge",
+            "Members added per second of scan time.",
+            [("", {}, snapshot["members_per_second"])],
+        )
+        add_metric(
+            "profile_requests_total",
+            "counter",
+            "Profile requests by outcome.",
+            [
+                ("", {"outcome": outcome}, count)
+                for outcome, count in snapshot["profile_requests"].items()
+            ],
+        )
+        histogram = snapshot["profile_fetch_seconds"]
+        add_metric(
+            "profile_fetch_seconds",
+            "histogram",
+            "Profile request latency in seconds.",
+            [("_bucket", {"le": bound}, count) for bound, count in histogram["buckets"].items()]
+            + [("_sum", {}, histogram["sum"]), ("_count", {}, histogram["count"])],
+        )
+        add_metric(
+            "rate_limited_total",
+            "counter",
+            "429 responses received.",
+            [("", {}, snapshot["rate_limited"])],
+        )
+        add_metric(
+            "retry_after_seconds_total",
+            "counter",
+            "Total Retry-After time of 429 responses.",
+            [("", {}, snapshot["retry_after_seconds"])],
+        )
+        add_metric(
+            "profile_cache_lookups_total",
+            "counter",
+            "Profile cache lookups by result.",
+            [
+                ("", {"result": "hit"}, snapshot["profile_cache"]["hits"]),
+                ("", {"result": "miss"}, snapshot["profile_cache"]["misses"]),
+            ],
+        )
+        enumeration_samples = [
+            (guild_id, entry["guild"], method, method_entry)
+            for guild_id, entry in snapshot["enumeration"].items()
+            for method, method_entry in entry["methods"].items()
+        ]
+        add_metric(
+            "enumeration_seconds",
+            "gauge",
+            "Time a member enumeration method took per guild.",
+            [
+                ("", {"guild_id": guild_id, "guild": guild, "method": method}, entry["seconds"])
+                for guild_id, guild, method, entry in enumeration_samples
+            ],
+        )
+        add_metric(
+            "enumeration_members",
+            "gauge",
+            "Members a member enumeration method found per guild.",
+            [
+                ("", {"guild_id": guild_id, "guild": guild, "method": method}, entry["members"])
+                for guild_id, guild, method, entry in enumeration_samples
+            ],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_path: str) -> None:
+        snapshot = self.snapshot()
+        os.makedirs(output_path, exist_ok=True)
+        with atomic_output_file(os.path.join(output_path, METRICS_JSON_FILENAME), "none") as f:
+            json.dump(snapshot, f, indent=4)
+        with atomic_output_file(
+            os.path.join(output_path, METRICS_PROMETHEUS_FILENAME), "none"
+        ) as f:
+            f.write(self.to_prometheus(snapshot))
+
+    async def write_periodically(self, output_path: str, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.write(output_path)
+            except OSError as e:
+                logging.warning("Could not write scan metrics to %s: %s", output_path, e)
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import sys
+from array import array
+from typing import Iterator, Optional
+
+from output_writer import atomic_output_file
+
+# Discord snowflakes are unsigned 64-bit integers.
+ID_TYPECODE = "Q"
+SHARD_DIRNAME = "server_info_shards"
+
+
+class MemberRecord:
+    """Scan result of one member in one guild, with mutuals stored as IDs."""
+
+    __slots__ = ("user_id", "is_friend", "mutual_friend_ids", "mutual_server_ids")
+
+    def __init__(
+        self,
+        user_id: int,
+        is_friend: bool,
+        mutual_friend_ids: array,
+        mutual_server_ids: array,
+    ) -> None:
+        self.user_id = user_id
+        self.is_friend = is_friend
+        self.mutual_friend_ids = mutual_friend_ids
+        self.mutual_server_ids = mutual_server_ids
+
+
+class ScanResults:
+    """ID-keyed scan results with interned user and guild name tables.
+
+    Each name is stored once no matter how many guilds or mutual lists it
+    appears in, and member records only hold integer ID arrays. The name-keyed
+    ``server_info`` layout of the JSON output is produced by
+    :meth:`iter_server_info` and :meth:`to_server_info` when writing results.
+
+    With a ``shard_path``, :meth:`flush_guild` writes a finished guild to its
+    own JSON file in that directory and drops its records from memory. Flushed
+    guilds are read back one at a time whenever the results are iterated.
+    """
+
+    def __init__(self, shard_path: Optional[str] = None) -> None:
+        self.user_names: dict = dict()
+        self.guild_names: dict = dict()
+        self.guilds: dict = dict()
+        self.shard_path = shard_path
+        if shard_path is not None:
+            if os.path.isdir(shard_path):
+                logging.info("Discarding previous guild shards at %s", shard_path)
+                shutil.rmtree(shard_path)
+            os.makedirs(shard_path, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self.guilds)
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self.guilds
+
+    def set_user_name(self, user_id: int, name: str) -> None:
+        if self.user_names.get(user_id) != name:
+            self.user_names[user_id] = sys.intern(name)
+
+    def set_guild_name(self, guild_id: int, name: str) -> None:
+        if self.guild_names.get(guild_id) != name:
+            self.guild_names[guild_id] = sys.intern(name)
+
+    def add_guild(self, guild_id: int, name: str) -> dict:
+        """Start (or restart) the member list of a scanned guild."""
+        self.set_guild_name(guild_id, name)
+        self.guilds[guild_id] = dict()
+        return self.guilds[guild_id]
+
+    def remove_guild(self, guild_id: int) -> None:
+        """Drop a guild's records, including the shard it was flushed to."""
+        self.guilds.pop(guild_id, None)
+        if self.shard_path is not None:
+            shard_file = self.shard_file(guild_id)
+            if os.path.exists(shard_file):
+                os.remove(shard_file)
+
+    def add_member(
+        self,
+        guild_id: int,
+        user_id: int,
+        member_name: str,
+        payload: dict,
+        is_friend: bool,
+    ) -> MemberRecord:
+        """Store a member of ``guild_id`` from its profile payload."""
+        self.set_user_name(user_id, member_name)
+        mutual_friend_ids = array(ID_TYPECODE)
+        for friend_id, friend_name in payload["mutual_friends"] or []:
+            self.set_user_name(friend_id, friend_name)
+            mutual_friend_ids.append(friend_id)
+        mutual_server_ids = array(ID_TYPECODE)
+        for mutual_server_id, mutual_server_name in payload["mutual_guilds"]:
+            if mutual_server_id == guild_id:
+                continue
+            self.set_guild_name(mutual_server_id, mutual_server_name)
+            mutual_server_ids.append(mutual_server_id)
+        record = MemberRecord(user_id, is_friend, mutual_friend_ids, mutual_server_ids)
+        self.guilds[guild_id][user_id] = record
+        return record
+
+    def user_name(self, user_id: int) -> str:
+        return self.user_names.get(user_id, str(user_id))
+
+    def guild_name(self, guild_id: int) -> str:
+        return self.guild_names.get(guild_id, str(guild_id))
+
+    def mutual_friend_names(self, record: MemberRecord) -> list:
+        return [self.user_name(friend_id) for friend_id in record.mutual_friend_ids]
+
+    def mutual_server_names(self, record: MemberRecord) -> list:
+        return [self.guild_name(server_id) for server_id in record.mutual_server_ids]
+
+    def member_info(self, record: MemberRecord) -> dict:
+        return {
+            "is_friend": record.is_friend,
+            "mutual_friends": self.mutual_friend_names(record),
+            "mutual_servers": self.mutual_server_names(record),
+        }
+
+    def shard_file(self, guild_id: int) -> str:
+        return os.path.join(self.shard_path, f"{guild_id}.json")
+
+    def flush_guild(self, guild_id: int) -> None:
+        """Write a finished guild to its shard file and release its records."""
+        if self.shard_path is None or self.guilds.get(guild_id) is None:
+            return
+        shard = {
+            "guild_id": guild_id,
+            "guild": self.guild_name(guild_id),
+            "members": [
+                {
+                    "user_id": record.user_id,
+                    "member": self.user_name(record.user_id),
+                    "is_friend": record.is_friend,
+                    "mutual_friends": [
+                        [friend_id, self.user_name(friend_id)]
+                        for friend_id in record.mutual_friend_ids
+                    ],
+                    "mutual_servers": [
+                        [server_id, self.guild_name(server_id)]
+                        for server_id in record.mutual_server_ids
+                    ],
+                }
+                for record in self.guilds[guild_id].values()
+            ],
+        }
+        with atomic_output_file(self.shard_file(guild_id), "none") as f:
+            json.dump(shard, f, separators=(",", ":"))
+        self.guilds[guild_id] = None
+        logging.info(
+            "Flushed %s members of %s to %s",
+            len(shard["members"]),
+            shard["guild"],
+            self.shard_file(guild_id),
+        )
+
+    def guild_members(self, guild_id: int) -> dict:
+        """Return the records of a guild, reading them back from its shard if flushed."""
+        members = self.guilds[guild_id]
+        if members is not None:
+            return members
+        with open(self.shard_file(guild_id), "r", encoding="utf-8") as f:
+            shard = json.load(f)
+        members = dict()
+        for member in shard["members"]:
+            self.set_user_name(member["user_id"], member["member"])
+            for friend_id, friend_name in member["mutual_friends"]:
+                self.set_user_name(friend_id, friend_name)
+            for server_id, server_name in member["mutual_servers"]:
+                self.set_guild_name(server_id, server_name)
+            members[member["user_id"]] = MemberRecord(
+                member["user_id"],
+                member["is_friend"],
+                array(ID_TYPECODE, (friend_id for friend_id, _ in member["mutual_friends"])),
+                array(ID_TYPECODE, (server_id for server_id, _ in member["mutual_servers"])),
+            )
+        return members
+
+    def edit_guild(self, guild_id: int) -> dict:
+        """Return the records of a guild for changes, keeping them in memory until flushed."""
+        self.guilds[guild_id] = self.guild_members(guild_id)
+        return self.guilds[guild_id]
+
+    def flush_all(self) -> None:
+        for guild_id in self.guilds:
+            self.flush_guild(guild_id)
+
+    def discard_shards(self) -> None:
+        """Delete the shard directory once the merged output has been written."""
+        if self.shard_path is not None and os.path.isdir(self.shard_path):
+            shutil.rmtree(self.shard_path)
+
+    def iter_guilds(self, guild_ids: Optional[list] = None) -> Iterator[tuple]:
+        """Yield ``(guild_name, [(member_name, record), ...])`` per scanned guild.
+
+        Names are unique within the output: a guild or member whose name was
+        already used gets its ID appended, so nobody is silently overwritten.
+        """
+        seen_guild_names = set()
+        for guild_id in self.guilds if guild_ids is None else guild_ids:
+            guild_name = self.guild_name(guild_id)
+            if guild_name in seen_guild_names:
+                guild_name = f"{guild_name} ({guild_id})"
+            seen_guild_names.add(guild_name)
+            seen_member_names = set()
+            members = list()
+            for user_id, record in self.guild_members(guild_id).items():
+                member_name = self.user_name(user_id)
+                if member_name in seen_member_names:
+                    member_name = f"{member_name} ({user_id})"
+                seen_member_names.add(member_name)
+                members.append((member_name, record))
+            yield guild_name, members
+
+    def iter_server_info(self) -> Iterator[tuple]:
+        """Yield ``(guild_name, {member_name: member_info})`` per scanned guild."""
+        for guild_name, members in self.iter_guilds():
+            yield guild_name, {
+                member_name: self.member_info(record) for member_name, record in members
+            }
+
+    def to_server_info(self) -> dict:
+        return dict(self.iter_server_info())
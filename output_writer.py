@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import contextlib
+import gzip
+import io
+import json
+import os
+import stat
+import tempfile
+from typing import Iterable
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+OUTPUT_FORMATS = ("json", "jsonl")
+OUTPUT_COMPRESSIONS = ("none", "gzip", "zstd")
+COMPRESSION_EXTENSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+JSON_INDENT = 4
+
+
+def _current_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Read once, since setting the umask to read it is not thread safe.
+NEW_FILE_MODE = 0o666 & ~_current_umask()
+
+
+def check_compression_available(compression: str) -> None:
+    if compression not in OUTPUT_COMPRESSIONS:
+        raise ValueError(
+            f"Unknown output compression {compression!r}, "
+            f"choose from {', '.join(OUTPUT_COMPRESSIONS)}"
+        )
+    if compression == "zstd" and zstandard is None:
+        raise ValueError(
+            "zstd output compression requires the zstandard package (pip install zstandard)"
+        )
+
+
+def open_output_file(path: str, mode: str, compression: str):
+    """Open ``path`` as UTF-8 text, (de)compressing with ``compression``."""
+    if compression == "gzip":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if compression == "zstd":
+        check_compression_available(compression)
+        raw = open(path, mode + "b")
+        if mode == "w":
+            stream = zstandard.ZstdCompressor().stream_writer(raw)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+@contextlib.contextmanager
+def atomic_output_file(path: str, compression: str):
+    """Write to a temporary file next to ``path`` and rename it into place.
+
+    Readers never see a half-written file, and an interrupted write leaves
+    the previous output untouched. The file keeps the permissions of the one
+    it replaces, or gets those of a newly created file.
+    """
+    directory, filename = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{filename}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        with open_output_file(temp_path, "w", compression) as f:
+            yield f
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = NEW_FILE_MODE
+        # mkstemp creates the file readable by its owner only.
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class OutputWriter:
+    """Writes scan results as JSON or JSON Lines, optionally compressed.
+
+    ``json`` keeps the layout of the original output files, indented unless
+    ``compact`` is set. ``jsonl`` writes one line per server member, and one
+    with only the server name for a server without members. Both are
+    encoded one server at a time instead of serializing whole dicts at once.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        output_format: str = "json",
+        compression: str = "none",
+        compact: bool = False,
+    ) -> None:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(
+                f"Unknown output format {output_format!r}, "
+                f"choose from {', '.join(OUTPUT_FORMATS)}"
+            )
+        check_compression_available(compression)
+        self.output_path = output_path
+        self.output_format = output_format
+        self.compression = compression
+        self.indent = None if compact else JSON_INDENT
+
+    def output_file(self, name: str) -> str:
+        return os.path.join(
+            self.output_path,
+            f"{name}.{self.output_format}{COMPRESSION_EXTENSIONS[self.compression]}",
+        )
+
+    def _dumps(self, value, indent=None) -> str:
+        if indent is None:
+            return json.dumps(value, separators=(",", ":"))
+        return json.dumps(value, indent=indent)
+
+    def _write_json_object(self, f, items: Iterable[tuple]) -> None:
+        empty = True
+        f.write("{")
+        for key, value in items:
+            if not empty:
+                f.write(",")
+            if self.indent is None:
+                f.write(f"{self._dumps(key)}:{self._dumps(value)}")
+            else:
+                padding = " " * self.indent
+                encoded_value = self._dumps(value, self.indent).replace("\n", "\n" + padding)
+                f.write(f"\n{padding}{json.dumps(key)}: {encoded_value}")
+            empty = False
+        if self.indent is not None and not empty:
+            f.write("\n")
+        f.write("}")
+
+    def _write_empty_server(self, f, server: str) -> None:
+        # A line without a member keeps the server listed, as it is in json output.
+        f.write(self._dumps({"server": server}) + "\n")
+
+    def write_server_info(self, scan_results) -> str:
+        path = self.output_file("server_info")
+        with atomic_output_file(path, self.compression) as f:
+            if self.output_format == "json":
+                self._write_json_object(f, scan_results.iter_server_info())
+                return path
+            for server, members in scan_results.iter_guilds():
+                if not members:
+                    self._write_empty_server(f, server)
+                for member, record in members:
+                    line = {"server": server, "member": member}
+                    line.update(scan_results.member_info(record))
+                    f.write(self._dumps(line) + "\n")
+        return path
+
+    def write_view(self, name: str, view: dict) -> str:
+        path = self.output_file(name)
+        with atomic_output_file(path, self.compression) as f:
+            if self.output_format == "json":
+                self._write_json_object(f, view.items())
+                return path
+            for server, entries in view.items():
+                if not entries:
+                    self._write_empty_server(f, server)
+                for entry in entries:
+                    if isinstance(entry, str):
+                        line = {"server": server, "member": entry}
+                    else:
+                        line = {"server": server, "member": entry[0], "count": entry[1]}
+                        if len(entry) > 2:
+                            line["mutuals"] = entry[2]
+                    f.write(self._dumps(line) + "\n")
+        return path
+
+    def write_all(self, scan_results, friends, mutual_friends, mutual_servers) -> list:
+        os.makedirs(self.output_path, exist_ok=True)
+        return [
+            self.write_server_info(scan_results),
+            self.write_view("friends", friends),
+            self.write_view("mutual_friends", mutual_friends),
+            self.write_view("mutual_servers", mutual_servers),
+        ]
+
+
+def find_server_info_file(output_path: str) -> str:
+    """Return the most recently written ``server_info`` file in any format."""
+    candidates = [
+        os.path.join(
+            output_path,
+            f"server_info.{output_format}{COMPRESSION_EXTENSIONS[compression]}",
+        )
+        for output_format in OUTPUT_FORMATS
+        for compression in OUTPUT_COMPRESSIONS
+    ]
+    existing = [path for path in candidates if os.path.exists(path)]
+    if not existing:
+        raise FileNotFoundError(
+            "server_info.json not found. Run the scanner first to generate output."
+        )
+    return max(existing, key=os.path.getmtime)
+
+
+def read_server_info(path: str) -> dict:
+    """Load a ``server_info`` file written by :class:`OutputWriter`."""
+    compression = next(
+        (
+            compression
+            for compression, extension in COMPRESSION_EXTENSIONS.items()
+            if extension and path.endswith(extension)
+        ),
+        "none",
+    )
+    with open_output_file(path, "r", compression) as f:
+        if ".jsonl" not in os.path.basename(path):
+            return json.load(f)
+        server_info = dict()
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            members = server_info.setdefault(record.pop("server"), dict())
+            if "member" in record:
+                members[record.pop("member")] = record
+        return server_info
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Optional
+
+PROFILE_CACHE_FILENAME = "profile_cache.sqlite3"
+# Writes are committed once per this many cache operations, and on close.
+PROFILE_CACHE_COMMIT_INTERVAL = 100
+# Share of max_entries evicted at once when the cache overflows.
+PROFILE_CACHE_EVICTION_FRACTION = 0.1
+
+
+def profile_to_payload(member_profile, with_mutual_friends: bool = True) -> dict:
+    """Reduce a fetched member profile to the JSON-serializable fields we keep.
+
+    ``mutual_friends`` is None when the profile was fetched without them.
+    """
+    return {
+        "mutual_friends": [
+            [friend.id, f"{friend.name}#{friend.discriminator}"]
+            for friend in member_profile.mutual_friends or []
+        ]
+        if with_mutual_friends
+        else None,
+        "mutual_guilds": [
+            [mutual_guild.id, mutual_guild.guild.name]
+            for mutual_guild in member_profile.mutual_guilds or []
+        ],
+    }
+
+
+class ProfileCache:
+    """SQLite-backed cache of member profile payloads keyed by user ID.
+
+    Entries older than ``ttl`` seconds are treated as misses. Once the cache
+    holds more than ``max_entries`` rows, the least recently used ones are
+    evicted in a batch. Hits only queue their ``last_used`` update, and all
+    writes are committed every ``PROFILE_CACHE_COMMIT_INTERVAL`` operations.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pending_last_used: dict = dict()
+        self._pending_operations = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "user_id INTEGER PRIMARY KEY, "
+            "payload TEXT NOT NULL, "
+            "fetched_at REAL NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS profiles_last_used ON profiles (last_used)"
+        )
+        self._connection.execute(
+            "DELETE FROM profiles WHERE fetched_at < ?", (time.time() - ttl,)
+        )
+        self._connection.commit()
+        # Upper bound of the row count, since puts that replace a row count too.
+        self._row_count = len(self)
+        logging.info(
+            "Profile cache opened at %s (%s entries, ttl=%ss, max_entries=%s)",
+            path,
+            self._row_count,
+            ttl,
+            max_entries,
+        )
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def get(self, user_id: int, with_mutual_friends: bool = True) -> Optional[dict]:
+        now = time.time()
+        row = self._connection.execute(
+            "SELECT payload, fetched_at FROM profiles WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        payload = json.loads(row[0]) if row is not None else None
+        if (
+            payload is None
+            or now - row[1] > self.ttl
+            or (with_mutual_friends and payload["mutual_friends"] is None)
+        ):
+            self.misses += 1
+            return None
+        self._pending_last_used[user_id] = now
+        self._count_operation()
+        self.hits += 1
+        return payload
+
+    def put(self, user_id: int, payload: dict) -> None:
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO profiles (user_id, payload, fetched_at, last_used) "
+            "VALUES (?, ?, ?, ?)",
+            (user_id, json.dumps(payload, separators=(",", ":")), now, now),
+        )
+        self._pending_last_used.pop(user_id, None)
+        self._row_count += 1
+        if self._row_count > self.max_entries:
+            self._evict()
+        self._count_operation()
+
+    def patch(self, user_id: int, payload: dict) -> None:
+        """Replace a cached payload that was edited locally, keeping its fetch time."""
+        self._connection.execute(
+            "UPDATE profiles SET payload = ? WHERE user_id = ?",
+            (json.dumps(payload, separators=(",", ":")), user_id),
+        )
+        self._count_operation()
+
+    def fetched_at(self, user_ids: set) -> dict:
+        """Map each of ``user_ids`` with an unexpired entry to the time it was fetched."""
+        rows = self._connection.execute(
+            "SELECT user_id, fetched_at FROM profiles WHERE fetched_at >= ?",
+            (time.time() - self.ttl,),
+        )
+        return {user_id: fetched_at for user_id, fetched_at in rows if user_id in user_ids}
+
+    def _count_operation(self) -> None:
+        self._pending_operations += 1
+        if self._pending_operations >= PROFILE_CACHE_COMMIT_INTERVAL:
+            self.flush()
+
+    def _write_last_used(self) -> None:
+        if not self._pending_last_used:
+            return
+        self._connection.executemany(
+            "UPDATE profiles SET last_used = ? WHERE user_id = ?",
+            [(last_used, user_id) for user_id, last_used in self._pending_last_used.items()],
+        )
+        self._pending_last_used.clear()
+
+    def flush(self) -> None:
+        """Write queued ``last_used`` updates and commit."""
+        self._write_last_used()
+        self._connection.commit()
+        self._pending_operations = 0
+
+    def _evict(self) -> None:
+        self._row_count = len(self)
+        if self._row_count <= self.max_entries:
+            return
+        # Evicting below the limit leaves room for the next puts without a recount.
+        overflow = self._row_count - (
+            self.max_entries - int(self.max_entries * PROFILE_CACHE_EVICTION_FRACTION)
+        )
+        self._write_last_used()
+        self._connection.execute(
+            "DELETE FROM profiles WHERE user_id IN ("
+            "SELECT user_id FROM profiles ORDER BY last_used ASC LIMIT ?)",
+            (overflow,),
+        )
+        self._row_count -= overflow
+        logging.debug("Evicted %s entries from the profile cache", overflow)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def log_stats(self) -> None:
+        logging.info(
+            "Profile cache: %s hits, %s misses (%.1f%% hit rate)",
+            self.hits,
+            self.misses,
+            self.hit_rate * 100,
+        )
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import discord
+
+PROFILE_ROUTE_KEY = "GET /users/{user_id}/profile"
+RATE_LIMIT_MODES = ("fixed", "adaptive")
+RATE_LIMITED_LOG_PREFIX = "We are being rate limited."
+RATE_LIMITED_LOG_FORMAT = (
+    RATE_LIMITED_LOG_PREFIX + " %s %s responded with 429. Retrying in %.2f seconds."
+)
+# discord.py-self versions whose private HTTPClient bucket state and 429 log
+# record layout are known. Other versions fall back to the fixed pacing.
+HTTP_INTERNALS_VERSIONS = ((2, 0), (2, 1))
+
+
+def http_internals_supported() -> bool:
+    version_info = getattr(discord, "version_info", None)
+    return (
+        version_info is not None
+        and (version_info.major, version_info.minor) in HTTP_INTERNALS_VERSIONS
+    )
+
+
+class FixedRateLimiter:
+    """Spaces requests ``interval`` seconds apart, shared by every caller."""
+
+    periodic_pause = True
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.rate_limited_count = 0
+        self.total_retry_after = 0.0
+        self._next_request_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            delay = self._next_request_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_request_at = time.monotonic() + self.interval
+
+    def observe_bucket(self, limit: int, remaining: int, reset_after: float) -> None:
+        pass
+
+    def on_rate_limited(self, retry_after: float) -> None:
+        self.rate_limited_count += 1
+        self.total_retry_after += retry_after
+        self._next_request_at = max(
+            self._next_request_at, time.monotonic() + retry_after
+        )
+
+    def log_stats(self) -> None:
+        logging.info(
+            "Rate limiter: %s rate limits, %.1fs total Retry-After, fixed interval %ss",
+            self.rate_limited_count,
+            self.total_retry_after,
+            self.interval,
+        )
+
+
+class AdaptiveRateLimiter:
+    """Token bucket that follows Discord's rate limit buckets.
+
+    The rate starts at one request per ``max_interval`` seconds, which stays the
+    slowest pace the limiter will settle at. Every response whose bucket still
+    has requests remaining raises the rate additively, up to the sustained rate
+    the bucket advertises (``limit`` requests per reset window). An exhausted
+    bucket blocks until it resets, and a 429 halves the rate and blocks for the
+    ``Retry-After`` duration.
+    """
+
+    periodic_pause = False
+
+    def __init__(self, max_interval: float) -> None:
+        self.min_rate = 1 / max_interval
+        self.rate = self.min_rate
+        self.allowed_rate = self.min_rate
+        self.rate_limited_count = 0
+        self.total_retry_after = 0.0
+        self._window = 0.0
+        self._tokens = 1.0
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(1.0, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def observe_bucket(self, limit: int, remaining: int, reset_after: float) -> None:
+        now = time.monotonic()
+        self._window = max(self._window, reset_after)
+        if self._window > 0:
+            self.allowed_rate = max(self.min_rate, limit / self._window)
+        if remaining <= 0:
+            self._blocked_until = max(self._blocked_until, now + reset_after)
+            return
+        self._refill(now)
+        self.rate = min(self.allowed_rate, self.rate + self.min_rate)
+
+    def on_rate_limited(self, retry_after: float) -> None:
+        self.rate_limited_count += 1
+        self.total_retry_after += retry_after
+        self._refill(time.monotonic())
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        logging.info(
+            "Rate limited, backing off to %.2f requests/s for the next %.1fs",
+            self.rate,
+            retry_after,
+        )
+
+    def log_stats(self) -> None:
+        logging.info(
+            "Rate limiter: %s rate limits, %.1fs total Retry-After, "
+            "current rate %.2f requests/s (allowed %.2f requests/s)",
+            self.rate_limited_count,
+            self.total_retry_after,
+            self.rate,
+            self.allowed_rate,
+        )
+
+
+def check_rate_limit_mode(mode: str, sleep_time: float) -> None:
+    if mode not in RATE_LIMIT_MODES:
+        raise ValueError(
+            f"Unknown rate limit mode {mode!r}, choose from {', '.join(RATE_LIMIT_MODES)}"
+        )
+    # The adaptive limiter never goes slower than one request per sleep_time.
+    if mode == "adaptive" and sleep_time <= 0:
+        raise ValueError("Adaptive rate limiting needs a sleep_time above 0")
+
+
+def build_rate_limiter(mode: str, sleep_time: float):
+    check_rate_limit_mode(mode, sleep_time)
+    if mode == "adaptive" and not http_internals_supported():
+        logging.warning(
+            "Adaptive rate limiting is not supported with discord.py-self %s, "
+            "using the fixed rate limiter instead",
+            getattr(discord, "__version__", "unknown"),
+        )
+    elif mode == "adaptive":
+        return AdaptiveRateLimiter(sleep_time)
+    return FixedRateLimiter(sleep_time)
+
+
+def read_profile_bucket(http) -> Optional[tuple]:
+    """Return ``(limit, remaining, reset_after)`` of the profile route bucket.
+
+    discord.py parses the ``X-RateLimit-*`` headers of every response into its
+    per-bucket state, so the last values seen for the profile route are read
+    from there. Returns None until a response carrying those headers arrived,
+    and with discord.py-self versions whose private bucket state is unknown.
+    """
+    if not http_internals_supported():
+        return None
+    buckets = getattr(http, "_buckets", None)
+    if not buckets:
+        return None
+    bucket_hash = getattr(http, "_bucket_hashes", {}).get(PROFILE_ROUTE_KEY)
+    ratelimit = buckets.get(f"{bucket_hash or PROFILE_ROUTE_KEY}:")
+    if ratelimit is None or not getattr(ratelimit, "dirty", False):
+        return None
+    return ratelimit.limit, ratelimit.remaining, ratelimit.reset_after
+
+
+class RateLimitLogHandler(logging.Handler):
+    """Forwards the 429 ``Retry-After`` delays discord.py logs to a limiter.
+
+    discord.py retries 429 responses internally, so they never reach the caller
+    as exceptions; its warning log record is the only place they surface. Only
+    records with discord.py-self's exact retry message and arguments are used.
+    """
+
+    def __init__(self, rate_limiter) -> None:
+        super().__init__(level=logging.WARNING)
+        self.rate_limiter = rate_limiter
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.msg != RATE_LIMITED_LOG_FORMAT:
+            return
+        try:
+            _method, _url, retry_after = record.args
+            retry_after = float(retry_after)
+        except (TypeError, ValueError):
+            return
+        self.rate_limiter.on_rate_limited(retry_after)
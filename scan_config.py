@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from metrics import DEFAULT_METRICS_INTERVAL
+from scan_state import DEFAULT_DELTA_REFRESH_FRACTION
+from watch import DEFAULT_WATCH_INTERVAL
+
+DEFAULT_PROFILE_CACHE_TTL = 7 * 24 * 60 * 60
+DEFAULT_PROFILE_CACHE_MAX_ENTRIES = 100000
+
+
+@dataclass
+class ScanConfig:
+    """Options of a scan, as set by the command line or the GUI.
+
+    Every option after ``pause_duration`` has the default of its command-line
+    flag. Server and channel filters become sets, and a non-positive
+    ``member_fetch_timeout`` disables the timeout. Cached profiles can be
+    stale, so without a ``profile_cache_ttl`` the cache is only used by delta
+    scans, which fetch changed memberships again.
+    """
+
+    sleep_time: float
+    output_verbosity: int
+    print_info: bool
+    write_to_json: bool
+    output_path: str
+    include_servers: Iterable[str]
+    include_channels: Iterable[str]
+    max_members: int
+    period_max_members: int
+    pause_duration: int
+    member_fetch_timeout: Optional[float] = None
+    profile_cache_ttl: Optional[float] = None
+    profile_cache_max_entries: int = DEFAULT_PROFILE_CACHE_MAX_ENTRIES
+    resume: bool = False
+    rate_limit_mode: str = "fixed"
+    profile_concurrency: int = 1
+    pipeline: bool = False
+    plan_scan: bool = False
+    skip_mutual_friends: bool = False
+    local_mutual_servers: bool = False
+    enumeration_strategy: str = "auto"
+    enumeration_overrides: dict = field(default_factory=dict)
+    top_k: Optional[int] = None
+    output_format: str = "json"
+    output_compression: str = "none"
+    compact_output: bool = False
+    delta: bool = False
+    delta_refresh_fraction: float = DEFAULT_DELTA_REFRESH_FRACTION
+    watch: bool = False
+    watch_interval: float = DEFAULT_WATCH_INTERVAL
+    metrics_interval: float = DEFAULT_METRICS_INTERVAL
+    record_path: Optional[str] = None
+    record_anonymize: bool = False
+    profile: bool = False
+
+    def __post_init__(self) -> None:
+        self.include_servers = set(self.include_servers)
+        self.include_channels = set(self.include_channels)
+        if not self.member_fetch_timeout or self.member_fetch_timeout <= 0:
+            self.member_fetch_timeout = None
+        if self.profile_cache_ttl is None:
+            self.profile_cache_ttl = DEFAULT_PROFILE_CACHE_TTL if self.delta else 0
+        self.profile_concurrency = max(1, self.profile_concurrency)
+        self.enumeration_overrides = dict(self.enumeration_overrides or {})
+
+    def profile_options(self) -> dict:
+        """The options that shape fetched profiles, which a resumed scan has to share."""
+        return {
+            "skip_mutual_friends": self.skip_mutual_friends,
+            "local_mutual_servers": self.local_mutual_servers,
+        }
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import collections
+import collections.abc
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from typing import Optional
+
+from metrics import Histogram
+
+SCAN_PROFILE_DIRNAME = "scan_profile"
+OTHER_PHASE = "other"
+STACK_SAMPLE_INTERVAL = 0.005
+LOOP_LAG_CHECK_INTERVAL = 0.1
+LOOP_LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SLOW_STEP_SECONDS = 0.05
+MAX_SLOW_EVENTS = 100
+
+_current_phase: contextvars.ContextVar = contextvars.ContextVar(
+    "scan_profile_phase", default=OTHER_PHASE
+)
+
+
+def fold_stack(frame) -> str:
+    """Format a frame and its callers as one line of collapsed-stack input."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(
+            f"{getattr(code, 'co_qualname', code.co_name)} "
+            f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+        )
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class _PhaseTrackingCoroutine(collections.abc.Coroutine):
+    """Runs each step of a task's coroutine under the profiler of its phase."""
+
+    def __init__(self, coro, profiler: "ScanProfiler") -> None:
+        self._coro = coro
+        self._profiler = profiler
+
+    def send(self, value):
+        return self._profiler.run_step(self._coro, self._coro.send, value)
+
+    def throw(self, *args):
+        return self._profiler.run_step(self._coro, self._coro.throw, *args)
+
+    def close(self) -> None:
+        self._coro.close()
+
+    def __await__(self):
+        return self._coro.__await__()
+
+
+class ScanProfiler:
+    """Per-phase cProfile stats, stack samples and event loop lag of a scan.
+
+    Phases are tracked per asyncio task, and the profiler of the running
+    task's phase is switched in for every step of that task, so phases that
+    overlap with ``--pipeline`` or ``--profile_concurrency`` are still told
+    apart. Work outside any phase is attributed to ``other``. A sampling
+    thread folds the loop thread's stack every few milliseconds into
+    collapsed-stack files for flamegraph tools, and a monitor task measures
+    how late the event loop wakes it up.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.active_phase: Optional[str] = None
+        self.profiles: dict = dict()
+        self.stack_samples: dict = collections.defaultdict(collections.Counter)
+        self.loop_lag = Histogram(LOOP_LAG_BUCKETS)
+        self.loop_lag_events: list = []
+        self.slow_steps: list = []
+        self._started_at = time.monotonic()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop_sampling = threading.Event()
+        self._loop_lag_task: Optional[asyncio.Task] = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        token = _current_phase.set(name)
+        self.activate(name)
+        try:
+            yield
+        finally:
+            _current_phase.reset(token)
+            self.activate(_current_phase.get())
+
+    def activate(self, name: Optional[str]) -> None:
+        if name == self.active_phase:
+            return
+        if self.active_phase is not None:
+            self.profiles[self.active_phase].disable()
+        if name is not None:
+            if name not in self.profiles:
+                self.profiles[name] = cProfile.Profile()
+            self.profiles[name].enable()
+        self.active_phase = name
+
+    def run_step(self, coro, step, *args):
+        phase = _current_phase.get()
+        self.activate(phase)
+        step_start = time.perf_counter()
+        try:
+            return step(*args)
+        finally:
+            step_seconds = time.perf_counter() - step_start
+            self.activate(OTHER_PHASE)
+            if step_seconds >= SLOW_STEP_SECONDS:
+                self.slow_steps.append(
+                    {
+                        "at_seconds": round(time.monotonic() - self._started_at, 3),
+                        "seconds": round(step_seconds, 4),
+                        "phase": phase,
+                        "coroutine": getattr(coro, "__qualname__", repr(coro)),
+                    }
+                )
+
+    def _task_factory(self, loop, coro, **kwargs) -> asyncio.Task:
+        return asyncio.Task(_PhaseTrackingCoroutine(coro, self), loop=loop, **kwargs)
+
+    def _sample_stacks(self, thread_id: int) -> None:
+        while not self._stop_sampling.wait(STACK_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self.stack_samples[self.active_phase or OTHER_PHASE][fold_stack(frame)] += 1
+
+    async def _monitor_loop_lag(self) -> None:
+        while True:
+            sleep_start = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_CHECK_INTERVAL)
+            lag = max(0.0, time.perf_counter() - sleep_start - LOOP_LAG_CHECK_INTERVAL)
+            self.loop_lag.observe(lag)
+            if lag >= SLOW_STEP_SECONDS:
+                self.loop_lag_events.append(
+                    {
+                        "at_seconds": round(time.monotonic() - self._started_at, 3),
+                        "lag_seconds": round(lag, 4),
+                    }
+                )
+
+    def start(self) -> None:
+        if self._sampler is not None:
+            return
+        self._sampler = threading.Thread(
+            target=self._sample_stacks,
+            args=(threading.get_ident(),),
+            name="scan-profiler-sampler",
+            daemon=True,
+        )
+        self._sampler.start()
+        self._loop_lag_task = asyncio.create_task(self._monitor_loop_lag())
+        self.activate(OTHER_PHASE)
+
+    async def run(self, coro):
+        """Run ``coro`` as a task whose steps, and those of tasks it starts, are profiled."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        previous_task_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)
+        try:
+            return await loop.create_task(coro)
+        finally:
+            loop.set_task_factory(previous_task_factory)
+
+    def stop(self) -> None:
+        self.activate(None)
+        if self._loop_lag_task is not None:
+            self._loop_lag_task.cancel()
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+
+    def write(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        for phase, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.path, f"{phase}.pstats"))
+            logging.info(
+                "Profiled %.2fs of %s in %s",
+                pstats.Stats(profile).total_tt,
+                phase,
+                os.path.join(self.path, f"{phase}.pstats"),
+            )
+        for phase, samples in self.stack_samples.items():
+            with open(os.path.join(self.path, f"{phase}.collapsed"), "w") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.path, "loop_lag.json"), "w") as f:
+            json.dump(
+                {
+                    "check_interval_seconds": LOOP_LAG_CHECK_INTERVAL,
+                    "lag_seconds": self.loop_lag.to_dict(),
+                    "lag_events": sorted(
+                        self.loop_lag_events, key=lambda event: -event["lag_seconds"]
+                    )[:MAX_SLOW_EVENTS],
+                    "slow_steps": sorted(self.slow_steps, key=lambda step: -step["seconds"])[
+                        :MAX_SLOW_EVENTS
+                    ],
+                },
+                f,
+                indent=4,
+            )
+        logging.info(
+            "Event loop lag: %s checks, %.2fs total, %s checks over %ss",
+            self.loop_lag.count,
+            self.loop_lag.sum,
+            len(self.loop_lag_events),
+            SLOW_STEP_SECONDS,
+        )
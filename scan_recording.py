@@ -0,0 +1,365 @@
+"""Record the Discord traffic of a scan and replay it offline.
+
+``ScanRecorder`` wraps the client handed to ``get_server_info`` and appends
+the guild list, every member enumeration and every profile response, with
+how long each took, to a gzip-compressed JSON Lines fixture. With
+``anonymize`` all IDs and names are replaced by consistent placeholders.
+``ReplayClient`` serves such a fixture back to ``get_server_info``, either as
+fast as possible or scaled to the recorded latencies.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import types
+from typing import Optional
+
+import discord
+
+from fake_discord import (
+    FAKE_CLIENT_USER_ID,
+    FIRST_FAKE_GUILD_ID,
+    FIRST_FAKE_USER_ID,
+    FakeMe,
+    FakeMemberProfile,
+    FakeMutualGuild,
+    FakePermissions,
+    FakeRelationship,
+    FakeRequestStats,
+    FakeUser,
+)
+from output_writer import open_output_file
+from profile_cache import profile_to_payload
+
+FIXTURE_VERSION = 1
+ENUMERATION_EVENTS = ("fetch_members", "chunk", "cached_members")
+
+
+class ScanRecorder:
+    def __init__(self, path: str, anonymize: bool = False) -> None:
+        self.path = path
+        self.anonymize = anonymize
+        self.events = 0
+        self._user_ids: dict = dict()
+        self._guild_ids: dict = dict()
+        self._handle = open_output_file(path, "w", "gzip")
+
+    def _write(self, record: dict) -> None:
+        self._handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.events += 1
+
+    def user_id(self, user_id: int) -> int:
+        if not self.anonymize:
+            return user_id
+        return self._user_ids.setdefault(user_id, FIRST_FAKE_USER_ID + len(self._user_ids))
+
+    def guild_id(self, guild_id: int) -> int:
+        if not self.anonymize:
+            return guild_id
+        return self._guild_ids.setdefault(guild_id, FIRST_FAKE_GUILD_ID + len(self._guild_ids))
+
+    def user(self, user) -> list:
+        if not self.anonymize:
+            return [user.id, user.name, user.discriminator]
+        user_id = self.user_id(user.id)
+        return [user_id, f"user{user_id - FIRST_FAKE_USER_ID}", "0"]
+
+    def guild_name(self, guild_id: int, name: str) -> str:
+        if not self.anonymize:
+            return name
+        return f"guild{self.guild_id(guild_id) - FIRST_FAKE_GUILD_ID}"
+
+    def payload(self, payload: dict) -> dict:
+        if not self.anonymize:
+            return payload
+        mutual_friends = payload["mutual_friends"]
+        return {
+            "mutual_friends": (
+                None
+                if mutual_friends is None
+                else [
+                    [
+                        self.user_id(friend_id),
+                        f"user{self.user_id(friend_id) - FIRST_FAKE_USER_ID}#0",
+                    ]
+                    for friend_id, _friend_name in mutual_friends
+                ]
+            ),
+            "mutual_guilds": [
+                [self.guild_id(guild_id), self.guild_name(guild_id, guild_name)]
+                for guild_id, guild_name in payload["mutual_guilds"]
+            ],
+        }
+
+    def record_start(self, client, friend_ids: set) -> None:
+        if self.anonymize:
+            self._user_ids[client.user.id] = FAKE_CLIENT_USER_ID
+        self._write(
+            {
+                "event": "start",
+                "version": FIXTURE_VERSION,
+                "anonymized": self.anonymize,
+                "user": self.user(client.user),
+                "friends": sorted(self.user_id(friend_id) for friend_id in friend_ids),
+            }
+        )
+
+    def record(self, event: str, started_at: float, **fields) -> None:
+        self._write({"event": event, "seconds": round(time.monotonic() - started_at, 4), **fields})
+
+    def record_members(self, event: str, guild, started_at: float, members, error=None) -> None:
+        fields = {"guild_id": self.guild_id(guild.id)}
+        if error is not None:
+            fields["error"] = f"{type(error).__name__}: {error}"
+        else:
+            fields["members"] = [self.user(member) for member in members or []]
+        self.record(event, started_at, **fields)
+
+    def wrap(self, client) -> "RecordingClient":
+        return RecordingClient(client, self)
+
+    def close(self) -> None:
+        if not self._handle.closed:
+            self._handle.close()
+
+
+class RecordingGuild:
+    """Delegates to a guild while recording its member enumerations and profiles."""
+
+    def __init__(self, guild, recorder: ScanRecorder) -> None:
+        self._guild = guild
+        self._recorder = recorder
+        permissions = getattr(getattr(guild, "me", None), "guild_permissions", None)
+        recorder.record(
+            "guild",
+            time.monotonic(),
+            guild_id=recorder.guild_id(guild.id),
+            name=recorder.guild_name(guild.id, guild.name),
+            member_count=getattr(guild, "member_count", None),
+            chunked=getattr(guild, "chunked", False),
+            can_request_all_members=permissions is not None
+            and any((permissions.kick_members, permissions.ban_members, permissions.manage_roles)),
+        )
+
+    def __getattr__(self, name: str):
+        return getattr(self._guild, name)
+
+    @property
+    def members(self) -> list:
+        started_at = time.monotonic()
+        members = list(self._guild.members)
+        self._recorder.record_members("cached_members", self._guild, started_at, members)
+        return members
+
+    async def _record_enumeration(self, event: str, coro):
+        started_at = time.monotonic()
+        try:
+            members = await coro
+        except Exception as e:
+            self._recorder.record_members(event, self._guild, started_at, None, e)
+            raise
+        self._recorder.record_members(event, self._guild, started_at, members)
+        return members
+
+    async def fetch_members(self, *args, **kwargs):
+        return await self._record_enumeration(
+            "fetch_members", self._guild.fetch_members(*args, **kwargs)
+        )
+
+    async def chunk(self, *args, **kwargs):
+        return await self._record_enumeration("chunk", self._guild.chunk(*args, **kwargs))
+
+    async def fetch_member_profile(self, member_id: int, *args, **kwargs):
+        recorder = self._recorder
+        started_at = time.monotonic()
+        try:
+            member_profile = await self._guild.fetch_member_profile(member_id, *args, **kwargs)
+        except Exception as e:
+            recorder.record(
+                "profile",
+                started_at,
+                user_id=recorder.user_id(member_id),
+                error=f"{type(e).__name__}: {e}",
+            )
+            raise
+        with_mutual_friends = kwargs.get("with_mutual_friends", True)
+        recorder.record(
+            "profile",
+            started_at,
+            user_id=recorder.user_id(member_id),
+            payload=recorder.payload(profile_to_payload(member_profile, with_mutual_friends)),
+        )
+        return member_profile
+
+
+class RecordingClient:
+    """Delegates to a client, recording the guild list and wrapping its guilds."""
+
+    def __init__(self, client, recorder: ScanRecorder) -> None:
+        self._client = client
+        self._recorder = recorder
+        self._guilds: dict = dict()
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+    async def fetch_guilds(self, *args, **kwargs) -> list:
+        started_at = time.monotonic()
+        guilds = await self._client.fetch_guilds(*args, **kwargs)
+        self._recorder.record(
+            "guilds",
+            started_at,
+            guilds=[
+                [self._recorder.guild_id(guild.id), self._recorder.guild_name(guild.id, guild.name)]
+                for guild in guilds
+            ],
+        )
+        return guilds
+
+    def get_guild(self, guild_id: int):
+        if guild_id not in self._guilds:
+            guild = self._client.get_guild(guild_id)
+            self._guilds[guild_id] = guild and RecordingGuild(guild, self._recorder)
+        return self._guilds[guild_id]
+
+
+class ReplayGuild:
+    def __init__(self, client: "ReplayClient", record: dict) -> None:
+        self._client = client
+        self.id = record["guild_id"]
+        self.name = record["name"]
+        self.member_count = record["member_count"]
+        self.chunked = record["chunked"]
+        self.channels: list = []
+        self.me = FakeMe(client.user, FakePermissions(record["can_request_all_members"]))
+        self._enumerations: dict = {event: [] for event in ENUMERATION_EVENTS}
+
+    def _next_enumeration(self, event: str) -> Optional[dict]:
+        recorded = self._enumerations[event]
+        if not recorded:
+            return None
+        # Repeated calls replay the recorded calls in order, then the last one again.
+        return recorded.pop(0) if len(recorded) > 1 else recorded[0]
+
+    async def _replay_enumeration(self, event: str) -> list:
+        record = self._next_enumeration(event)
+        if record is None:
+            return []
+        await self._client.replay_latency(record["seconds"])
+        if "error" in record:
+            raise RuntimeError(f"Recorded {event} failure: {record['error']}")
+        return [self._client.user_for(member) for member in record["members"]]
+
+    @property
+    def members(self) -> list:
+        record = self._next_enumeration("cached_members")
+        if record is None:
+            return []
+        return [self._client.user_for(member) for member in record["members"]]
+
+    async def fetch_members(self, channels=None, **kwargs) -> list:
+        self._client.stats.fetch_members_requests += 1
+        return await self._replay_enumeration("fetch_members")
+
+    async def chunk(self, **kwargs) -> list:
+        self._client.stats.chunk_requests += 1
+        return await self._replay_enumeration("chunk")
+
+    async def fetch_member_profile(
+        self,
+        member_id: int,
+        with_mutual_guilds: bool = True,
+        with_mutual_friends: bool = True,
+        **kwargs,
+    ) -> FakeMemberProfile:
+        self._client.stats.profile_requests += 1
+        record = self._client.profiles.get(member_id)
+        if record is None:
+            raise discord.errors.InvalidData(f"No recorded profile for {member_id}")
+        await self._client.replay_latency(record["seconds"])
+        if "error" in record:
+            raise discord.errors.InvalidData(f"Recorded profile failure: {record['error']}")
+        return self._client.member_profile(record["payload"], with_mutual_friends)
+
+
+class ReplayClient:
+    """Serves a recorded scan fixture to ``get_server_info``.
+
+    ``speed`` scales the recorded latencies: 1 replays them in real time, 10
+    ten times faster, and 0 skips them.
+    """
+
+    def __init__(self, path: str, speed: float = 0.0) -> None:
+        self.speed = speed
+        self.stats = FakeRequestStats()
+        self.http = None
+        self.guilds: list = []
+        self.friends: list = []
+        self.profiles: dict = dict()
+        self._users: dict = dict()
+        self._guilds_by_id: dict = dict()
+        self._guild_list: list = []
+        self._guild_list_seconds = 0.0
+        with open_output_file(path, "r", "gzip") as f:
+            for line in f:
+                if line.strip():
+                    self._apply(json.loads(line))
+
+    def _apply(self, record: dict) -> None:
+        event = record["event"]
+        if event == "start":
+            self.user = self.user_for(record["user"])
+            self.friends = [
+                FakeRelationship(self._users.get(friend_id) or FakeUser(friend_id, str(friend_id)))
+                for friend_id in record["friends"]
+            ]
+        elif event == "guilds":
+            self._guild_list = record["guilds"]
+            self._guild_list_seconds = record["seconds"]
+        elif event == "guild":
+            guild = ReplayGuild(self, record)
+            self._guilds_by_id[guild.id] = guild
+            self.guilds.append(guild)
+        elif event in ENUMERATION_EVENTS:
+            self._guilds_by_id[record["guild_id"]]._enumerations[event].append(record)
+        elif event == "profile":
+            self.profiles[record["user_id"]] = record
+
+    def user_for(self, member: list) -> FakeUser:
+        user_id, name, discriminator = member
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = FakeUser(user_id, name, discriminator)
+        return user
+
+    async def replay_latency(self, seconds: float) -> None:
+        if self.speed > 0:
+            await asyncio.sleep(seconds / self.speed)
+
+    async def fetch_guilds(self) -> list:
+        await self.replay_latency(self._guild_list_seconds)
+        return [
+            types.SimpleNamespace(id=guild_id, name=guild_name)
+            for guild_id, guild_name in self._guild_list
+        ]
+
+    def get_guild(self, guild_id: int) -> Optional[ReplayGuild]:
+        return self._guilds_by_id.get(guild_id)
+
+    def member_profile(self, payload: dict, with_mutual_friends: bool) -> FakeMemberProfile:
+        mutual_friends = None
+        if with_mutual_friends and payload["mutual_friends"] is not None:
+            mutual_friends = []
+            for friend_id, friend_name in payload["mutual_friends"]:
+                name, _, discriminator = friend_name.rpartition("#")
+                mutual_friends.append(self.user_for([friend_id, name, discriminator]))
+        mutual_guilds = [
+            FakeMutualGuild(
+                self._guilds_by_id.get(guild_id)
+                or types.SimpleNamespace(id=guild_id, name=guild_name)
+            )
+            for guild_id, guild_name in payload["mutual_guilds"]
+        ]
+        return FakeMemberProfile(mutual_friends, mutual_guilds)
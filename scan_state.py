@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import math
+import os
+
+from output_writer import atomic_output_file, open_output_file
+
+SCAN_STATE_FILENAME = "scan_state.json.gz"
+DEFAULT_DELTA_REFRESH_FRACTION = 0.1
+
+
+class ScanState:
+    """Member IDs of every scanned guild.
+
+    Saved after each scan so a ``--delta`` scan can tell which members joined
+    or left a guild since then. The profiles of everyone who stayed are reused
+    from the profile cache, whose fetch times pick the oldest ones to refresh
+    a slice at a time.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.guilds: dict = dict()
+        if os.path.exists(path):
+            try:
+                self._load()
+            except (OSError, EOFError, ValueError, KeyError) as e:
+                logging.warning("Ignoring unreadable scan state at %s: %s", path, e)
+                self.guilds.clear()
+
+    def _load(self) -> None:
+        with open_output_file(self.path, "r", "gzip") as f:
+            state = json.load(f)
+        for guild_id, member_ids in state["guilds"].items():
+            self.guilds[int(guild_id)] = set(member_ids)
+        logging.info("Loaded scan state from %s (%s guilds)", self.path, len(self.guilds))
+
+    def member_ids(self) -> set:
+        return set().union(*self.guilds.values())
+
+    def stale_user_ids(self, profile_cache, refresh_fraction: float) -> set:
+        """The ``refresh_fraction`` share of cached member profiles that were fetched longest ago."""
+        fetched_at = profile_cache.fetched_at(self.member_ids())
+        refresh_count = math.ceil(len(fetched_at) * refresh_fraction)
+        return set(heapq.nsmallest(refresh_count, fetched_at, key=fetched_at.get))
+
+    def update(self, guild_members: dict) -> None:
+        """Replace the state with the guilds of this scan.
+
+        Guilds that were not part of this scan are dropped, so the next delta
+        scan fetches their members again when they come back.
+        """
+        self.guilds = {guild_id: set(member_ids) for guild_id, member_ids in guild_members.items()}
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with atomic_output_file(self.path, "gzip") as f:
+            json.dump(
+                {
+                    "guilds": {
+                        str(guild_id): sorted(member_ids)
+                        for guild_id, member_ids in self.guilds.items()
+                    },
+                },
+                f,
+                separators=(",", ":"),
+            )
@@ -0,0 +1,669 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Callable, Optional
+
+import discord
+
+from checkpoint import CheckpointJournal
+from enumeration import EnumerationStats, choose_enumeration_methods, enumeration_target
+from metrics import ScanMetrics
+from model import ScanResults
+from profile_cache import ProfileCache, profile_to_payload
+from rate_limit import read_profile_bucket
+from scan_config import ScanConfig
+from scan_state import ScanState
+
+PIPELINE_PREFETCH_SERVERS = 1
+
+
+def is_fully_enumerated(server, server_members: list) -> bool:
+    member_count = getattr(server, "member_count", None)
+    return member_count is not None and len(server_members) >= member_count
+
+
+def member_display_name(member) -> str:
+    return f"{member.name}#{member.discriminator}"
+
+
+async def maybe_wait_for(coro, timeout: Optional[float], label: str):
+    if not timeout:
+        return await coro
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        logging.warning("%s timed out after %ss", label, timeout)
+        return None
+
+
+async def fetch_members_with_retry(server, channels=None):
+    try:
+        if channels:
+            return await server.fetch_members(channels=channels)
+        return await server.fetch_members()
+    except discord.HTTPException as e:
+        if e.status == 429:
+            retry_after = int(e.response.headers.get("Retry-After", 1))
+            logging.warning(f"Rate limited. Retrying after {retry_after} seconds.")
+            await asyncio.sleep(retry_after)
+            return await fetch_members_with_retry(server, channels)
+        logging.error(f"Failed to fetch members: {e}")
+        return []
+    except RuntimeError as e:
+        logging.warning(f"Cannot fetch members for {server.name}: {e}")
+        return []
+
+
+def _no_profile_phase(phase: str):
+    return contextlib.nullcontext()
+
+
+class ServerScanner:
+    """Scans the member profiles of every selected server of ``client``.
+
+    One scanner runs one scan. Profiles fetched so far, the members whose
+    profile could not be fetched and the members a delta scan refetches past
+    the profile cache are kept on the scanner, so ``profiles`` can be handed
+    to the watcher afterwards. The cache, journal, scan state, enumeration
+    stats and metrics are all optional.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        friend_ids: set,
+        config: ScanConfig,
+        rate_limiter,
+        profile_cache: Optional[ProfileCache] = None,
+        checkpoint_journal: Optional[CheckpointJournal] = None,
+        scan_state: Optional[ScanState] = None,
+        enumeration_stats: Optional[EnumerationStats] = None,
+        scan_metrics: Optional[ScanMetrics] = None,
+        profile_phase: Callable = _no_profile_phase,
+    ) -> None:
+        self.client = client
+        self.friend_ids = friend_ids
+        self.config = config
+        self.rate_limiter = rate_limiter
+        self.profile_cache = profile_cache
+        self.checkpoint_journal = checkpoint_journal
+        self.scan_state = scan_state
+        self.enumeration_stats = enumeration_stats
+        self.scan_metrics = scan_metrics
+        self.profile_phase = profile_phase
+        self.scan_results = ScanResults()
+        self.profiles: dict = dict()
+        self.failed_member_ids: set = set()
+        # Fetched from Discord even when the profile cache holds them.
+        self.refresh_user_ids: set = set()
+        self.user_servers: list = []
+        if checkpoint_journal is not None:
+            self.scan_results = checkpoint_journal.scan_results
+            self.profiles.update(checkpoint_journal.profiles)
+
+    async def run(self) -> ScanResults:
+        logging.info("Fetching guild list...")
+        with self.profile_phase("guild_fetch"):
+            self.user_servers = await self.client.fetch_guilds()
+        logging.info("Found %s guilds", len(self.user_servers))
+        self.select_stale_profiles()
+        selected_servers = self.select_servers()
+
+        if self.config.plan_scan or self.config.local_mutual_servers or self.config.delta:
+            # A delta scan needs the membership changes of every server before any
+            # cached profile is reused, so it always enumerates all of them first.
+            await self.plan_and_process_servers(selected_servers)
+        elif self.config.pipeline and len(selected_servers) > 1:
+            await self.pipeline_servers(selected_servers)
+        else:
+            for server_idx, server, server_progress in selected_servers:
+                server_members = await self.enumerate_server_members(
+                    server, server_idx, self.config.max_members
+                )
+                await self.process_server_members(server, server_members, server_progress)
+
+        if self.scan_state is not None:
+            self.scan_state.update(
+                {
+                    guild_id: set(self.scan_results.guild_members(guild_id))
+                    for guild_id in self.scan_results.guilds
+                }
+            )
+            self.scan_state.save()
+        return self.scan_results
+
+    def select_stale_profiles(self) -> None:
+        if not self.config.delta or self.scan_state is None:
+            return
+        if self.profile_cache is None:
+            logging.warning("Delta scan without the profile cache, every profile is fetched again")
+            return
+        self.refresh_user_ids.update(
+            self.scan_state.stale_user_ids(self.profile_cache, self.config.delta_refresh_fraction)
+        )
+        logging.info(
+            "Delta scan: reusing cached profiles, refreshing the %s oldest",
+            len(self.refresh_user_ids),
+        )
+
+    def select_servers(self) -> list:
+        """Return ``(server_idx, server, server_progress)`` of every server to scan."""
+        include_servers = self.config.include_servers
+        servers_count = len(self.user_servers)
+        specific_server_count = 0
+        matched_servers = set()
+        seen_servers = set()
+        selected_servers = []
+        for server_idx, user_server in enumerate(self.user_servers):
+            server = self.client.get_guild(user_server.id)
+            server_name = server.name
+            seen_servers.add(server_name)
+            if include_servers:
+                if server_name not in include_servers:
+                    continue
+                matched_servers.add(server_name)
+                specific_server_count += 1
+            if include_servers:
+                server_progress = (specific_server_count, len(include_servers))
+            else:
+                server_progress = (server_idx + 1, servers_count)
+            if (
+                self.checkpoint_journal is not None
+                and server.id in self.checkpoint_journal.completed_guilds
+            ):
+                logging.info(
+                    "Skipping server %s, already completed in the scan journal",
+                    server_name,
+                )
+                continue
+            selected_servers.append((server_idx, server, server_progress))
+
+        unmatched_servers = include_servers.difference(matched_servers)
+        if unmatched_servers:
+            logging.warning(
+                "Did not find the following servers: %s consider choosing from the following servers: %s",
+                unmatched_servers,
+                seen_servers,
+            )
+        return selected_servers
+
+    async def fetch_profile_payload(self, server, member, member_name: str) -> tuple:
+        """Return ``(payload, fetched)``, with ``payload`` None when the fetch failed."""
+        with_mutual_friends = not self.config.skip_mutual_friends
+        profile_cache = self.profile_cache
+        if profile_cache is not None and member.id not in self.refresh_user_ids:
+            payload = profile_cache.get(member.id, with_mutual_friends)
+            if payload is not None:
+                return payload, False
+        await self.rate_limiter.acquire()
+        fetch_start = time.monotonic()
+        fetch_ok = False
+        try:
+            member_profile = await server.fetch_member_profile(
+                member.id,
+                with_mutual_guilds=True,
+                with_mutual_friends=with_mutual_friends,
+            )
+            fetch_ok = True
+        except (discord.errors.NotFound, discord.errors.InvalidData):
+            logging.warning("Member %s not found or invalid. Skipping.", member_name)
+            return None, True
+        except discord.errors.HTTPException as e:
+            logging.warning(
+                "HTTP error fetching profile for %s: %s. Skipping.",
+                member_name,
+                e,
+            )
+            return None, True
+        except Exception as e:
+            logging.error(
+                "Unexpected error fetching profile for %s: %s.",
+                member_name,
+                e,
+            )
+            return None, True
+        finally:
+            if self.scan_metrics is not None:
+                self.scan_metrics.observe_profile_fetch(time.monotonic() - fetch_start, fetch_ok)
+            bucket = read_profile_bucket(getattr(self.client, "http", None))
+            if bucket is not None:
+                self.rate_limiter.observe_bucket(*bucket)
+        payload = profile_to_payload(member_profile, with_mutual_friends)
+        if profile_cache is not None:
+            profile_cache.put(member.id, payload)
+        return payload, True
+
+    async def profile_worker(self, member_queue: asyncio.Queue) -> int:
+        requests = 0
+        while True:
+            try:
+                server, member, member_name, progress = member_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return requests
+            logging.info(
+                "Processing %s server, progress = %s/%s servers %s/%s members",
+                server.name,
+                *progress,
+            )
+            payload, fetched = await self.fetch_profile_payload(server, member, member_name)
+            requests += fetched
+            if payload is None:
+                self.failed_member_ids.add(member.id)
+                continue
+            self.profiles[member.id] = payload
+            if self.checkpoint_journal is not None:
+                self.checkpoint_journal.record_profile(member.id, payload)
+
+    async def fetch_profiles(self, work: list) -> None:
+        """Fetch ``(server, member, member_name, progress)`` work items a period at a time."""
+        period_max_members = self.config.period_max_members
+        pause_duration = self.config.pause_duration
+        for start_idx in range(0, len(work), period_max_members):
+            end_idx = min(start_idx + period_max_members, len(work))
+            member_queue = asyncio.Queue()
+            for work_item in work[start_idx:end_idx]:
+                member_queue.put_nowait(work_item)
+            worker_count = min(self.config.profile_concurrency, member_queue.qsize())
+            with self.profile_phase("profile_fetch"):
+                period_requests = sum(
+                    await asyncio.gather(
+                        *(self.profile_worker(member_queue) for _ in range(worker_count))
+                    )
+                )
+
+            if self.profile_cache is not None:
+                self.profile_cache.log_stats()
+            if (
+                end_idx < len(work)
+                and pause_duration > 0
+                and period_requests > 0
+                and self.rate_limiter.periodic_pause
+            ):
+                logging.info("Pausing for %s seconds...", pause_duration)
+                await asyncio.sleep(pause_duration)
+
+    def needs_profile(self, member) -> bool:
+        return member.id not in self.profiles and member.id not in self.failed_member_ids
+
+    def select_server_members(self, server, server_members: list) -> list:
+        max_members = self.config.max_members
+        server_member_count = len(server_members)
+        logging.info(
+            "Server %s has %s members (processing up to %s)",
+            server.name,
+            server_member_count,
+            max_members,
+        )
+        if server_member_count > max_members:
+            logging.info(
+                "The server member count of %s is greater than the max member count "
+                "of %s, selecting only the first %s members",
+                server_member_count,
+                max_members,
+                max_members,
+            )
+        client_user_id = self.client.user.id
+        return [member for member in server_members[:max_members] if member.id != client_user_id]
+
+    def apply_member_delta(self, server, selected_members: list) -> None:
+        if not self.config.delta or self.scan_state is None:
+            return
+        previous_member_ids = self.scan_state.guilds.get(server.id)
+        if previous_member_ids is None:
+            # Joined since the previous scan, so no cached profile lists it yet.
+            logging.info("Server %s is new since the previous scan", server.name)
+            previous_member_ids = set()
+        member_ids = {member.id for member in selected_members}
+        joined_member_ids = member_ids - previous_member_ids
+        left_member_ids = previous_member_ids - member_ids
+        # Their cached mutual servers no longer match, so fetch them again.
+        changed_user_ids = joined_member_ids | left_member_ids
+        self.refresh_user_ids.update(changed_user_ids)
+        for user_id in changed_user_ids:
+            self.profiles.pop(user_id, None)
+        logging.info(
+            "Delta for %s: %s joined, %s left, %s stayed since the previous scan",
+            server.name,
+            len(joined_member_ids),
+            len(left_member_ids),
+            len(member_ids & previous_member_ids),
+        )
+
+    def apply_guild_delta(self) -> None:
+        """Refresh every member of a server that was left since the previous scan."""
+        if not self.config.delta or self.scan_state is None:
+            return
+        guild_ids = {user_server.id for user_server in self.user_servers}
+        left_guild_ids = set(self.scan_state.guilds) - guild_ids
+        for guild_id in left_guild_ids:
+            # Their cached mutual servers still list it.
+            member_ids = self.scan_state.guilds[guild_id]
+            self.refresh_user_ids.update(member_ids)
+            for user_id in member_ids:
+                self.profiles.pop(user_id, None)
+            logging.info(
+                "Left server %s since the previous scan, refreshing its %s members",
+                guild_id,
+                len(member_ids),
+            )
+
+    def add_server_members(self, server, selected_members: list) -> None:
+        scan_results = self.scan_results
+        checkpoint_journal = self.checkpoint_journal
+        server_name = server.name
+        scan_results.add_guild(server.id, server_name)
+        for member_idx, member in enumerate(selected_members):
+            payload = self.profiles.get(member.id)
+            if payload is None:
+                continue
+            member_name = member_display_name(member)
+            is_friend = member.id in self.friend_ids
+            scan_results.add_member(server.id, member.id, member_name, payload, is_friend)
+            if checkpoint_journal is not None:
+                checkpoint_journal.record_member(
+                    server.id,
+                    server_name,
+                    member_idx,
+                    member.id,
+                    member_name,
+                    is_friend,
+                    payload,
+                )
+        if checkpoint_journal is not None:
+            checkpoint_journal.record_guild_done(server.id, server_name)
+        if self.scan_metrics is not None:
+            self.scan_metrics.record_guild_done(len(scan_results.guild_members(server.id)))
+        scan_results.flush_guild(server.id)
+
+    async def run_enumeration_method(self, server, method: str) -> list:
+        server_name = server.name
+        include_channels = self.config.include_channels
+        member_fetch_timeout = self.config.member_fetch_timeout
+        if method == "cached":
+            guild_server_members = list(server.members)
+            logging.info(
+                "guild.members has %s members for %s",
+                len(guild_server_members),
+                server_name,
+            )
+            return guild_server_members
+        if method == "fetch_members":
+            if include_channels:
+                channels = [
+                    discord.utils.get(server.channels, name=channel) for channel in include_channels
+                ]
+                logging.info(
+                    "Starting fetch_members for %s with channels filter (%s)",
+                    server_name,
+                    len(channels),
+                )
+                fetch_start = time.monotonic()
+                fetch_server_members = await maybe_wait_for(
+                    fetch_members_with_retry(server, channels),
+                    member_fetch_timeout,
+                    f"fetch_members for {server_name}",
+                )
+            else:
+                logging.info("Starting fetch_members for %s (no channel filter)", server_name)
+                fetch_start = time.monotonic()
+                fetch_server_members = await maybe_wait_for(
+                    fetch_members_with_retry(server),
+                    member_fetch_timeout,
+                    f"fetch_members for {server_name}",
+                )
+            if fetch_server_members is None:
+                fetch_server_members = []
+            logging.info(
+                "fetch_members returned %s members for %s in %.1fs",
+                len(fetch_server_members),
+                server_name,
+                time.monotonic() - fetch_start,
+            )
+            return fetch_server_members
+
+        chunk_start = time.monotonic()
+        logging.info("Starting chunk() for %s", server_name)
+        try:
+            chunk_result = await maybe_wait_for(
+                server.chunk(),
+                member_fetch_timeout,
+                f"chunk() for {server_name}",
+            )
+            chunked_server_members = chunk_result or []
+            logging.info(
+                "chunk() returned %s members for %s in %.1fs",
+                len(chunked_server_members),
+                server_name,
+                time.monotonic() - chunk_start,
+            )
+        except Exception as e:
+            logging.warning(
+                "chunk() failed for %s after %.1fs: %s",
+                server_name,
+                time.monotonic() - chunk_start,
+                e,
+            )
+            chunked_server_members = []
+        return chunked_server_members
+
+    async def iter_server_members(self, server, methods: list, target: Optional[int]):
+        seen_member_ids = set()
+        for method in methods:
+            method_start = time.monotonic()
+            with self.profile_phase("enumeration"):
+                method_members = await self.run_enumeration_method(server, method)
+            method_seconds = time.monotonic() - method_start
+            if self.enumeration_stats is not None:
+                self.enumeration_stats.record(
+                    server.id, method, method_seconds, len(method_members)
+                )
+            if self.scan_metrics is not None:
+                self.scan_metrics.record_enumeration(
+                    server.id, server.name, method, method_seconds, len(method_members)
+                )
+            for member in method_members:
+                if member.id not in seen_member_ids:
+                    seen_member_ids.add(member.id)
+                    yield member
+            del method_members
+            if target is not None and len(seen_member_ids) >= target:
+                return
+
+    async def enumerate_server_members(
+        self, server, server_idx: int, limit: Optional[int] = None
+    ) -> list:
+        server_name = server.name
+        enumeration_stats = self.enumeration_stats
+        logging.info(
+            "Fetching members for server %s (%s/%s)",
+            server_name,
+            server_idx + 1,
+            len(self.user_servers),
+        )
+        history = enumeration_stats.get(server.id) if enumeration_stats else dict()
+        strategy = self.config.enumeration_overrides.get(
+            server_name, self.config.enumeration_strategy
+        )
+        methods = choose_enumeration_methods(
+            server, strategy, history, bool(self.config.include_channels)
+        )
+        target = enumeration_target(server, history) if strategy == "auto" else None
+        logging.info(
+            "Enumerating %s with %s (strategy=%s, target=%s members)",
+            server_name,
+            ", ".join(methods),
+            strategy,
+            target,
+        )
+
+        server_members = []
+        server_members_iter = self.iter_server_members(server, methods, target)
+        try:
+            async for member in server_members_iter:
+                server_members.append(member)
+                if limit is not None and len(server_members) >= limit:
+                    logging.info(
+                        "Stopped enumerating %s after %s members (max_members=%s)",
+                        server_name,
+                        len(server_members),
+                        limit,
+                    )
+                    break
+        finally:
+            await server_members_iter.aclose()
+        if enumeration_stats is not None:
+            enumeration_stats.save()
+        server_members.sort(key=lambda server_member: server_member.id)
+        return server_members
+
+    async def process_server_members(
+        self, server, server_members: list, server_progress: tuple
+    ) -> None:
+        selected_members = self.select_server_members(server, server_members)
+        self.apply_member_delta(server, selected_members)
+        work = [
+            (
+                server,
+                member,
+                member_display_name(member),
+                (*server_progress, member_idx + 1, len(selected_members)),
+            )
+            for member_idx, member in enumerate(selected_members)
+            if self.needs_profile(member)
+        ]
+        await self.fetch_profiles(work)
+        self.add_server_members(server, selected_members)
+
+    async def pipeline_servers(self, selected_servers: list) -> None:
+        # The queue itself is unbounded so the closing sentinel never waits for a
+        # consumer that may have stopped; the semaphore bounds the prefetch.
+        enumerated_servers = asyncio.Queue()
+        prefetch_slots = asyncio.Semaphore(PIPELINE_PREFETCH_SERVERS)
+
+        async def enumerate_servers() -> None:
+            try:
+                for server_idx, server, server_progress in selected_servers:
+                    server_members = await self.enumerate_server_members(
+                        server, server_idx, self.config.max_members
+                    )
+                    await prefetch_slots.acquire()
+                    enumerated_servers.put_nowait((server, server_members, server_progress))
+            finally:
+                enumerated_servers.put_nowait(None)
+
+        logging.info("Pipelining member enumeration of upcoming servers with profile fetching")
+        producer = asyncio.create_task(enumerate_servers())
+        try:
+            while True:
+                enumerated_server = await enumerated_servers.get()
+                if enumerated_server is None:
+                    break
+                prefetch_slots.release()
+                await self.process_server_members(*enumerated_server)
+        except BaseException:
+            producer.cancel()
+            raise
+        await producer
+
+    async def plan_and_process_servers(self, selected_servers: list) -> None:
+        config = self.config
+        local_mutual_servers = config.local_mutual_servers and config.skip_mutual_friends
+        if config.local_mutual_servers and not local_mutual_servers:
+            logging.warning(
+                "Mutual servers can only be computed locally when mutual friends are "
+                "skipped, fetching every profile instead"
+            )
+        self.apply_guild_delta()
+        server_progresses = {
+            server.id: server_progress for _, server, server_progress in selected_servers
+        }
+        if local_mutual_servers:
+            index_servers = [
+                (server_idx, self.client.get_guild(user_server.id))
+                for server_idx, user_server in enumerate(self.user_servers)
+            ]
+        else:
+            index_servers = [(server_idx, server) for server_idx, server, _ in selected_servers]
+
+        planned_servers = []
+        member_servers = dict()
+        incomplete_server_ids = set()
+        for server_idx, server in index_servers:
+            server_members = await self.enumerate_server_members(
+                server, server_idx, None if local_mutual_servers else config.max_members
+            )
+            if local_mutual_servers:
+                if not is_fully_enumerated(server, server_members):
+                    logging.info(
+                        "Server %s could not be fully enumerated (%s of %s members)",
+                        server.name,
+                        len(server_members),
+                        server.member_count,
+                    )
+                    incomplete_server_ids.add(server.id)
+                for member in server_members:
+                    member_servers.setdefault(member.id, set()).add(server.id)
+            if server.id in server_progresses:
+                selected_members = self.select_server_members(server, server_members)
+                self.apply_member_delta(server, selected_members)
+                planned_servers.append((server, selected_members, server_progresses[server.id]))
+
+        planned_member_ids = set()
+        planned_members = []
+        local_member_count = 0
+        for server, selected_members, server_progress in planned_servers:
+            for member in selected_members:
+                if member.id in planned_member_ids:
+                    continue
+                planned_member_ids.add(member.id)
+                if not self.needs_profile(member):
+                    continue
+                if local_mutual_servers and incomplete_server_ids.issubset(
+                    member_servers[member.id]
+                ):
+                    self.profiles[member.id] = {
+                        "mutual_friends": None,
+                        "mutual_guilds": [
+                            [index_server.id, index_server.name]
+                            for _, index_server in index_servers
+                            if index_server.id in member_servers[member.id]
+                        ],
+                    }
+                    local_member_count += 1
+                else:
+                    planned_members.append((server, member, server_progress))
+        member_rows = sum(len(selected_members) for _, selected_members, _ in planned_servers)
+        logging.info(
+            "Planned %s profile requests for %s unique members across %s member rows "
+            "in %s servers (overlap factor %.2f)",
+            len(planned_members),
+            len(planned_member_ids),
+            member_rows,
+            len(planned_servers),
+            member_rows / len(planned_member_ids) if planned_member_ids else 1.0,
+        )
+        if local_mutual_servers:
+            logging.info(
+                "Computed mutual servers locally for %s members from %s servers "
+                "(%s not fully enumerated)",
+                local_member_count,
+                len(index_servers),
+                len(incomplete_server_ids),
+            )
+
+        await self.fetch_profiles(
+            [
+                (
+                    server,
+                    member,
+                    member_display_name(member),
+                    (*server_progress, member_idx + 1, len(planned_members)),
+                )
+                for member_idx, (server, member, server_progress) in enumerate(planned_members)
+            ]
+        )
+        for server, selected_members, _ in planned_servers:
+            self.add_server_members(server, selected_members)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional
+
+import discord
+
+from profile_cache import profile_to_payload
+
+DEFAULT_WATCH_INTERVAL = 60
+
+
+class ResultsWatcher:
+    """Keeps the results of a finished scan up to date from gateway events.
+
+    The profile payload of every affected user is patched in memory and in the
+    profile cache, and that user's records are rebuilt in each scanned guild
+    they are a member of. Only members who join a scanned guild need a profile request.
+    Changes are written out at most once per ``interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        client,
+        scan_results,
+        scan_state,
+        profiles: dict,
+        friend_ids: set,
+        interval: float,
+    ) -> None:
+        self.client = client
+        self.scan_results = scan_results
+        self.scan_state = scan_state
+        self.profiles = profiles
+        self.friend_ids = friend_ids
+        self.interval = interval
+        self.pending_changes = 0
+        self._rewrite_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def is_watched(self, guild_id: int) -> bool:
+        return guild_id in self.scan_results
+
+    async def fetch_profile(self, member) -> Optional[dict]:
+        with_mutual_friends = not self.client.config.skip_mutual_friends
+        await self.client.rate_limiter.acquire()
+        try:
+            member_profile = await member.guild.fetch_member_profile(
+                member.id,
+                with_mutual_guilds=True,
+                with_mutual_friends=with_mutual_friends,
+            )
+        except (discord.errors.HTTPException, discord.errors.InvalidData) as e:
+            logging.warning("Could not fetch profile for %s: %s. Skipping.", member, e)
+            return None
+        return profile_to_payload(member_profile, with_mutual_friends)
+
+    def rebuild_user(self, user_id: int, member_name: Optional[str] = None) -> None:
+        payload = self.profiles.get(user_id)
+        if payload is None:
+            return
+        member_name = member_name or self.scan_results.user_name(user_id)
+        for guild_id, member_ids in self.scan_state.guilds.items():
+            if user_id in member_ids and self.is_watched(guild_id):
+                self.scan_results.edit_guild(guild_id)
+                self.scan_results.add_member(
+                    guild_id, user_id, member_name, payload, user_id in self.friend_ids
+                )
+        self.schedule_rewrite()
+
+    def set_mutual_guild(self, user_id: int, guild, is_mutual: bool) -> None:
+        payload = self.profiles.get(user_id)
+        if payload is None:
+            return
+        mutual_guilds = [
+            mutual_guild
+            for mutual_guild in payload["mutual_guilds"]
+            if mutual_guild[0] != guild.id
+        ]
+        if is_mutual:
+            mutual_guilds.append([guild.id, guild.name])
+        self.patch_profile(user_id, dict(payload, mutual_guilds=mutual_guilds))
+
+    def patch_profile(self, user_id: int, payload: dict) -> None:
+        self.profiles[user_id] = payload
+        if self.client.profile_cache is not None:
+            self.client.profile_cache.patch(user_id, payload)
+
+    async def on_member_join(self, member) -> None:
+        guild = member.guild
+        if not self.is_watched(guild.id) or member.id == self.client.user.id:
+            return
+        payload = await self.fetch_profile(member)
+        if payload is None:
+            return
+        member_name = f"{member.name}#{member.discriminator}"
+        logging.info("%s joined %s", member_name, guild.name)
+        async with self._lock:
+            if not self.is_watched(guild.id):
+                return
+            self.scan_state.guilds.setdefault(guild.id, set()).add(member.id)
+            self.profiles[member.id] = payload
+            if self.client.profile_cache is not None:
+                self.client.profile_cache.put(member.id, payload)
+            self.rebuild_user(member.id, member_name)
+
+    async def on_member_remove(self, member) -> None:
+        guild = member.guild
+        if not self.is_watched(guild.id):
+            return
+        logging.info("%s#%s left %s", member.name, member.discriminator, guild.name)
+        async with self._lock:
+            self.scan_state.guilds.get(guild.id, set()).discard(member.id)
+            self.scan_results.edit_guild(guild.id).pop(member.id, None)
+            self.set_mutual_guild(member.id, guild, False)
+            self.rebuild_user(member.id)
+            self.schedule_rewrite()
+
+    async def on_guild_join(self, guild) -> None:
+        logging.info(
+            "Joined %s, its members are only scanned by the next scan", guild.name
+        )
+        async with self._lock:
+            for member in guild.members:
+                if member.id in self.profiles:
+                    self.set_mutual_guild(member.id, guild, True)
+                    self.rebuild_user(member.id)
+
+    async def on_guild_remove(self, guild) -> None:
+        logging.info("Left %s", guild.name)
+        async with self._lock:
+            member_ids = self.scan_state.guilds.pop(guild.id, set())
+            self.scan_results.remove_guild(guild.id)
+            for user_id in member_ids:
+                self.set_mutual_guild(user_id, guild, False)
+                self.rebuild_user(user_id)
+            self.schedule_rewrite()
+
+    async def on_friendship_change(self, user, is_friend: bool) -> None:
+        logging.info("%s is %s a friend", user, "now" if is_friend else "no longer")
+        async with self._lock:
+            self._apply_friendship_change(user, is_friend)
+
+    def _apply_friendship_change(self, user, is_friend: bool) -> None:
+        if is_friend:
+            self.friend_ids.add(user.id)
+        else:
+            self.friend_ids.discard(user.id)
+            # A former friend can no longer be a mutual friend of anyone.
+            for user_id, payload in list(self.profiles.items()):
+                mutual_friends = payload["mutual_friends"] or []
+                if any(friend_id == user.id for friend_id, _ in mutual_friends):
+                    self.patch_profile(
+                        user_id,
+                        dict(
+                            payload,
+                            mutual_friends=[
+                                friend for friend in mutual_friends if friend[0] != user.id
+                            ],
+                        ),
+                    )
+                    self.rebuild_user(user_id)
+        self.rebuild_user(user.id)
+
+    def schedule_rewrite(self) -> None:
+        self.pending_changes += 1
+        if self._rewrite_task is None or self._rewrite_task.done():
+            self._rewrite_task = asyncio.create_task(self._rewrite_later())
+
+    async def _rewrite_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        await self.rewrite()
+        # Changes that arrived while writing wait for the next interval.
+        if self.pending_changes:
+            self._rewrite_task = asyncio.create_task(self._rewrite_later())
+
+    async def rewrite(self) -> None:
+        async with self._lock:
+            changes = self.pending_changes
+            if not changes:
+                return
+            self.pending_changes = 0
+            logging.info("Rewriting results after %s changes", changes)
+            try:
+                self.scan_state.save()
+                if self.client.profile_cache is not None:
+                    self.client.profile_cache.flush()
+                self.scan_results.flush_all()
+                await self.client.write_results(self.scan_results)
+            except Exception:
+                logging.exception("Failed to rewrite watched results")
+
+    async def close(self) -> None:
+        """Stop the debounce timer and write pending changes right away."""
+        if self._rewrite_task is not None and not self._rewrite_task.done():
+            self._rewrite_task.cancel()
+        await self.rewrite()